@@ -2,5 +2,7 @@ class AppState:
     def __init__(self):
         self.hwnd = 0
         self.window_capture = None
+        self.frame_source = None
         self.game_analyzer = None
         self.locked_regions = None
+        self.calibration = None
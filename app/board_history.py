@@ -0,0 +1,240 @@
+"""
+紧凑棋盘状态与历史记录模块
+- 棋盘固定为 129 个节点 (四条臂各 6x5，中央 3x3)，一帧状态即一个长度 129 的结构化数组，
+  每个节点 7 字节: 棋子代码、颜色代码、所属玩家代码、跟踪 ID 代码，0 表示空
+- BoardHistory 把状态存进环形缓冲区：关键帧存完整数组，其余帧只存相对其关键帧的累积差异，
+  差异超过 max_delta 个节点时自动另起关键帧。因此任意历史帧都只需“关键帧 + 一次差异”即可还原 (O(1))，
+  一帧的常驻开销约一百多字节，数小时的对局可以整体留在内存中供回放与分析。
+"""
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.game_model import BoardState, Piece, PIECE_RANKS
+from app.services.board_lattice import REGION_SPECS
+
+# 全局节点编号：与 BoardLattice 相同的 REGION_SPECS 顺序、行优先，但与是否锁定分区无关
+NODE_KEYS: Tuple[Tuple[str, int, int], ...] = tuple(
+    (region, r, c) for region, (rows, cols) in REGION_SPECS.items() for r in range(rows) for c in range(cols))
+NODE_INDEX: Dict[Tuple[str, int, int], int] = {key: i for i, key in enumerate(NODE_KEYS)}
+NUM_NODES = len(NODE_KEYS)
+
+PIECE_NAMES: Tuple[str, ...] = ("",) + tuple(PIECE_RANKS)
+PIECE_CODES: Dict[str, int] = {name: i for i, name in enumerate(PIECE_NAMES) if name}
+# 按棋子代码查等级，空节点为 -1
+RANK_BY_CODE = np.array([-1] + [PIECE_RANKS[name] for name in PIECE_NAMES[1:]], dtype=np.int8)
+
+NODE_DTYPE = np.dtype([("piece", np.uint8), ("color", np.uint8), ("owner", np.uint8), ("track", np.int32)])
+
+
+class SymbolTable:
+    """字符串 <-> 小整数的双向表，0 固定表示空字符串；编码在整个会话内保持稳定"""
+
+    def __init__(self, symbols: Sequence[str] = ()):
+        self._names: List[str] = [""]
+        self._codes: Dict[str, int] = {"": 0}
+        for s in symbols: self.code(s)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def code(self, name: Optional[str]) -> int:
+        if not name: return 0
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self._names)
+            self._names.append(name)
+        return code
+
+    def name(self, code: int) -> str:
+        return self._names[code]
+
+
+class PieceRecord:
+    """节点数组中一个棋子的轻量记录 (__slots__，不带 dataclass 开销)"""
+    __slots__ = ("id", "name", "color", "player_pos", "node")
+
+    def __init__(self, id: str, name: str, color: str, player_pos: str, node: int):
+        self.id = id
+        self.name = name
+        self.color = color
+        self.player_pos = player_pos
+        self.node = node
+
+    @property
+    def rank(self) -> int:
+        return PIECE_RANKS.get(self.name, -1)
+
+    @property
+    def region(self) -> str:
+        return NODE_KEYS[self.node][0]
+
+    @property
+    def board_coords(self) -> Tuple[int, int]:
+        return NODE_KEYS[self.node][1:]
+
+    def to_piece(self) -> Piece:
+        return Piece(self.id, self.name, self.color, self.player_pos, self.board_coords, region=self.region)
+
+    def __repr__(self) -> str:
+        return f"PieceRecord({self.id!r}, {self.name!r}, {self.color!r}, {self.player_pos!r}, node={self.node})"
+
+
+def node_of(piece: Piece) -> Optional[int]:
+    """棋子所在的全局节点编号；分区取 piece.region，未设置时退回 player_pos"""
+    return NODE_INDEX.get((piece.region or piece.player_pos, *piece.board_coords))
+
+
+class BoardCodec:
+    """BoardState <-> 节点数组的编解码；颜色/玩家与跟踪 ID 各用一张 SymbolTable"""
+
+    def __init__(self):
+        self.labels = SymbolTable()   # 颜色与玩家方位
+        self.tracks = SymbolTable()   # PieceTracker 分配的 ID
+
+    @staticmethod
+    def empty() -> np.ndarray:
+        return np.zeros(NUM_NODES, dtype=NODE_DTYPE)
+
+    def encode(self, state: BoardState) -> np.ndarray:
+        """无法定位到节点或棋子名未知的条目被忽略；同一节点有多个棋子时保留后出现的"""
+        nodes = self.empty()
+        for piece in state.pieces.values():
+            node = node_of(piece)
+            code = PIECE_CODES.get(piece.name)
+            if node is None or code is None: continue
+            nodes[node] = (code, self.labels.code(piece.color), self.labels.code(piece.player_pos), self.tracks.code(piece.id))
+        return nodes
+
+    def records(self, nodes: np.ndarray) -> List[PieceRecord]:
+        occupied = np.flatnonzero(nodes["piece"])
+        return [PieceRecord(self.tracks.name(int(t)), PIECE_NAMES[int(p)], self.labels.name(int(c)), self.labels.name(int(o)), int(n))
+                for n, p, c, o, t in zip(occupied, nodes["piece"][occupied], nodes["color"][occupied],
+                                         nodes["owner"][occupied], nodes["track"][occupied])]
+
+    def decode(self, nodes: np.ndarray, timestamp: float = 0.0) -> BoardState:
+        state = BoardState(timestamp=timestamp)
+        for record in self.records(nodes):
+            piece = record.to_piece()
+            state.pieces[piece.id] = piece
+            state.grid[piece.board_coords] = piece.id
+        return state
+
+
+class BoardHistory:
+    """
+    环形缓冲区，保存最近 capacity 帧的节点数组
+    - 帧号从 0 开始单调递增；超出容量后最旧的帧被覆盖，first_frame 随之前移
+    - 每帧存: 时间戳、所属关键帧编号、相对关键帧的差异 (至多 max_delta 个节点)
+    - 关键帧按需保存在字典中，不再被任何帧引用时释放
+    """
+
+    def __init__(self, capacity: int = 36000, max_delta: int = 16, codec: Optional[BoardCodec] = None):
+        if capacity < 1 or max_delta < 1: raise ValueError("capacity 与 max_delta 必须为正数")
+        self.capacity = capacity
+        self.max_delta = max_delta
+        self.codec = codec or BoardCodec()
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._keyframe_of = np.zeros(capacity, dtype=np.int64)
+        self._delta_len = np.zeros(capacity, dtype=np.uint8 if max_delta < 256 else np.uint16)
+        self._delta_nodes = np.zeros((capacity, max_delta), dtype=np.uint8)
+        self._delta_values = np.zeros((capacity, max_delta), dtype=NODE_DTYPE)
+        self._keyframes: Dict[int, np.ndarray] = {}
+        self._next_keyframe = 0
+        self._last: Optional[np.ndarray] = None
+        self._count = 0  # 已写入的总帧数
+
+    # --- 写入 ---
+    def append(self, state, timestamp: Optional[float] = None) -> int:
+        """写入一帧 (BoardState 或节点数组)，返回帧号"""
+        if isinstance(state, BoardState):
+            nodes = self.codec.encode(state)
+            if timestamp is None: timestamp = state.timestamp
+        else:
+            nodes = np.asarray(state, dtype=NODE_DTYPE)
+            if nodes.shape != (NUM_NODES,): raise ValueError(f"节点数组形状应为 ({NUM_NODES},)，实际为 {nodes.shape}")
+        frame = self._count
+        slot = frame % self.capacity
+
+        key_id = self._next_keyframe - 1
+        keyframe = self._keyframes.get(key_id)
+        changed = np.flatnonzero(nodes != keyframe) if keyframe is not None else None
+        if changed is None or len(changed) > self.max_delta:
+            key_id = self._next_keyframe; self._next_keyframe += 1
+            self._keyframes[key_id] = nodes.copy()
+            changed = changed[:0] if changed is not None else np.zeros(0, dtype=np.int64)
+        n = len(changed)
+        self._timestamps[slot] = 0.0 if timestamp is None else timestamp
+        self._keyframe_of[slot] = key_id
+        self._delta_len[slot] = n
+        self._delta_nodes[slot, :n] = changed
+        self._delta_values[slot, :n] = nodes[changed]
+        self._last = nodes
+        self._count += 1
+        self._release_keyframes()
+        return frame
+
+    def _release_keyframes(self) -> None:
+        oldest = self._keyframe_of[self.first_frame % self.capacity]
+        for key_id in [k for k in self._keyframes if k < oldest]: del self._keyframes[key_id]
+
+    # --- 读取 ---
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    @property
+    def first_frame(self) -> int:
+        return max(0, self._count - self.capacity)
+
+    @property
+    def last_frame(self) -> int:
+        return self._count - 1
+
+    def _slot(self, frame: int) -> int:
+        if frame < 0: frame += self._count
+        if not self.first_frame <= frame < self._count: raise IndexError(f"帧 {frame} 不在历史范围内")
+        return frame % self.capacity
+
+    def nodes_at(self, frame: int) -> np.ndarray:
+        """帧号对应的节点数组 (副本)；负数表示从最新一帧倒数"""
+        slot = self._slot(frame)
+        nodes = self._keyframes[int(self._keyframe_of[slot])].copy()
+        n = int(self._delta_len[slot])
+        nodes[self._delta_nodes[slot, :n]] = self._delta_values[slot, :n]
+        return nodes
+
+    def timestamp_at(self, frame: int) -> float:
+        return float(self._timestamps[self._slot(frame)])
+
+    def state_at(self, frame: int) -> BoardState:
+        return self.codec.decode(self.nodes_at(frame), self.timestamp_at(frame))
+
+    def latest(self) -> Optional[np.ndarray]:
+        return None if self._last is None else self._last.copy()
+
+    def frame_at_time(self, timestamp: float) -> int:
+        """时间戳不晚于 timestamp 的最后一帧 (二分查找)；早于全部历史时返回 first_frame"""
+        lo, hi = self.first_frame, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamps[mid % self.capacity] <= timestamp: lo = mid + 1
+            else: hi = mid
+        return max(self.first_frame, lo - 1)
+
+    def iter_nodes(self, start: Optional[int] = None, stop: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        start = self.first_frame if start is None else max(start, self.first_frame)
+        stop = self._count if stop is None else min(stop, self._count)
+        for frame in range(start, stop): yield frame, self.nodes_at(frame)
+
+    # --- 内存统计 ---
+    @property
+    def nbytes(self) -> int:
+        """缓冲区与关键帧实际占用的字节数 (不含 SymbolTable)"""
+        ring = (self._timestamps.nbytes + self._keyframe_of.nbytes + self._delta_len.nbytes
+                + self._delta_nodes.nbytes + self._delta_values.nbytes)
+        return ring + len(self._keyframes) * NUM_NODES * NODE_DTYPE.itemsize
+
+    @property
+    def bytes_per_frame(self) -> float:
+        """满载时平均每帧的字节数"""
+        return self.nbytes / self.capacity
@@ -1,8 +1,11 @@
 from dataclasses import dataclass, field
 from typing import List, Dict, Tuple, Optional, Any
-from collections import Counter
+from collections import Counter, defaultdict
+from itertools import permutations
 import math
 
+import numpy as np
+
 # --- Constants ---
 PIECE_RANKS = {
     "司令": 10, "军长": 9, "师长": 8, "旅长": 7, "团长": 6, "营长": 5,
@@ -20,6 +23,7 @@ class Piece:
     player_pos: str
     rank: int = field(init=False)
     board_coords: Tuple[int, int]
+    region: Optional[str] = None  # 所在分区；board_coords 是该分区内的 (行, 列)，未设置时视为 player_pos
 
     def __post_init__(self):
         self.rank = PIECE_RANKS.get(self.name, -1)
@@ -33,6 +37,9 @@ class BoardState:
 
 # --- Piece Tracker ---
 
+MATCH_DISTANCE = 4  # 同一棋子在相邻两帧间允许的最大格距
+SMALL_BUCKET = 3    # 不超过该大小的桶直接枚举排列求最优指派
+
 class PieceTracker:
     def __init__(self):
         self._last_id_counters: Dict[str, int] = Counter()
@@ -50,34 +57,148 @@ class PieceTracker:
             return current_detections
 
         new_state = BoardState(timestamp=current_detections.timestamp)
-        unmatched_new_pieces = list(current_detections.pieces.values())
-        
+        prev_pieces = list(prev_state.pieces.values())
+        new_pieces = list(current_detections.pieces.values())
+
+        # 1. 原地未动的棋子：按 (颜色, 棋子, 坐标) 精确查表，零距离配对
+        prev_at: Dict[Tuple[str, str, Tuple[int, int]], Piece] = {}
+        dirty = set()  # 需要做指派的 (颜色, 棋子) 桶
+        for piece in prev_pieces:
+            key = (piece.color, piece.name, piece.board_coords)
+            if key in prev_at: dirty.add(key[:2])
+            prev_at[key] = piece
+        matched: Dict[int, Piece] = {}  # id(上一帧棋子) -> 本帧棋子
+        for piece in new_pieces:
+            prev_piece = prev_at.get((piece.color, piece.name, piece.board_coords))
+            if prev_piece is None or id(prev_piece) in matched: dirty.add((piece.color, piece.name))
+            else: matched[id(prev_piece)] = piece
+        for piece in prev_pieces:
+            if id(piece) not in matched: dirty.add((piece.color, piece.name))
+
+        # 2. 有棋子移动、出现或消失的桶整桶重新求最优指派 (整桶零距离配对的桶本身就是最优解，无需再算)
+        if dirty:
+            prev_buckets = _bucket_pieces(p for p in prev_pieces if (p.color, p.name) in dirty)
+            new_buckets = _bucket_pieces(p for p in new_pieces if (p.color, p.name) in dirty)
+            for key, prev_bucket in prev_buckets.items():
+                for piece in prev_bucket: matched.pop(id(piece), None)
+                new_bucket = new_buckets.get(key)
+                if not new_bucket: continue
+                for r, c in _assign_bucket([p.board_coords for p in prev_bucket], [p.board_coords for p in new_bucket]):
+                    matched[id(prev_bucket[r])] = new_bucket[c]
+        taken = {id(piece) for piece in matched.values()}
+
+        # 已匹配的按上一帧顺序、新出现的按检测顺序写入，与原先的遍历顺序一致
         for prev_piece in prev_state.pieces.values():
-            best_match = None
-            min_dist = float('inf')
-            for i, new_piece in enumerate(unmatched_new_pieces):
-                if prev_piece.name == new_piece.name and prev_piece.color == new_piece.color:
-                    dist = math.hypot(
-                        prev_piece.board_coords[0] - new_piece.board_coords[0],
-                        prev_piece.board_coords[1] - new_piece.board_coords[1]
-                    )
-                    if dist < 4 and dist < min_dist:
-                        min_dist = dist
-                        best_match = i
-            
-            if best_match is not None:
-                matched_piece = unmatched_new_pieces.pop(best_match)
-                matched_piece.id = prev_piece.id
-                new_state.pieces[matched_piece.id] = matched_piece
-                new_state.grid[matched_piece.board_coords] = matched_piece.id
-
-        for new_piece in unmatched_new_pieces:
+            matched_piece = matched.get(id(prev_piece))
+            if matched_piece is None: continue
+            matched_piece.id = prev_piece.id
+            new_state.pieces[matched_piece.id] = matched_piece
+            new_state.grid[matched_piece.board_coords] = matched_piece.id
+        for new_piece in new_pieces:
+            if id(new_piece) in taken: continue
             new_piece.id = self.get_new_id(new_piece)
             new_state.pieces[new_piece.id] = new_piece
             new_state.grid[new_piece.board_coords] = new_piece.id
-            
+
         return new_state
 
+
+def _bucket_pieces(pieces) -> Dict[Tuple[str, str], List[Piece]]:
+    """按 (color, name) 分桶，桶内保持原顺序"""
+    buckets: Dict[Tuple[str, str], List[Piece]] = defaultdict(list)
+    for piece in pieces:
+        buckets[(piece.color, piece.name)].append(piece)
+    return buckets
+
+
+def _assign_bucket(prev_coords: List[Tuple[int, int]], new_coords: List[Tuple[int, int]],
+                   gate: float = MATCH_DISTANCE) -> List[Tuple[int, int]]:
+    """
+    一个桶内的最优指派，返回 [(上一帧序号, 本帧序号)]。
+    同色同名的棋子每方至多 3 个，绝大多数桶是 1x1 到 3x3，直接枚举排列 (至多 6 种) 比构造矩阵更快；
+    误检导致桶变大时才走向量化距离矩阵 + 匈牙利算法。
+    """
+    if len(prev_coords) == 1 and len(new_coords) == 1:
+        a, b = prev_coords[0], new_coords[0]
+        return [(0, 0)] if math.hypot(a[0] - b[0], a[1] - b[1]) < gate else []
+    if len(prev_coords) > SMALL_BUCKET or len(new_coords) > SMALL_BUCKET:
+        prev_xy = np.asarray(prev_coords, dtype=np.float64); new_xy = np.asarray(new_coords, dtype=np.float64)
+        dist = np.hypot(prev_xy[:, None, 0] - new_xy[None, :, 0], prev_xy[:, None, 1] - new_xy[None, :, 1])
+        return [(int(r), int(c)) for r, c in zip(*min_cost_assignment(dist, gate))]
+
+    dist = [[math.hypot(a[0] - b[0], a[1] - b[1]) for b in new_coords] for a in prev_coords]
+    transposed = len(prev_coords) > len(new_coords)
+    if transposed: dist = [list(column) for column in zip(*dist)]
+    best, best_key = [], (0, 0.0)
+    # 先比匹配数、再比总距离，与 min_cost_assignment 的目标一致
+    for perm in permutations(range(len(dist[0])), len(dist)):
+        pairs = [(r, c) for r, c in enumerate(perm) if dist[r][c] < gate]
+        key = (len(pairs), -sum(dist[r][c] for r, c in pairs))
+        if key > best_key: best, best_key = pairs, key
+    return [(c, r) for r, c in best] if transposed else best
+
+
+def _hungarian(cost: np.ndarray) -> np.ndarray:
+    """
+    rows <= cols 的最小代价指派 (最短增广路 + 势函数, O(n²m))。
+    返回每一行分到的列。同色同名的一桶至多十几个棋子，纯 NumPy 实现足够快。
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1); v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # owner[j]: 列 j 当前分给的行 (1 起)，0 表示空闲
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        min_slack = np.full(m + 1, np.inf)
+        way = np.zeros(m + 1, dtype=np.int64)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used[1:]
+            slack = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = j0
+            candidates = np.where(free, min_slack[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[owner[used]] += delta; v[used] -= delta
+            min_slack[1:][free] -= delta
+            j0 = j1
+            if owner[j0] == 0: break
+        while j0:
+            j1 = way[j0]; owner[j0] = owner[j1]; j0 = j1
+    assignment = np.full(n, -1, dtype=np.int64)
+    rows = owner[1:]
+    assignment[rows[rows > 0] - 1] = np.nonzero(rows > 0)[0]
+    return assignment
+
+
+def min_cost_assignment(dist: np.ndarray, gate: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    在 dist < gate 的约束下求总距离最小的一一匹配，返回 (行索引, 列索引)。
+    超出门限的配对代价设为一个大于所有合法匹配总和的常数，因此结果先保证匹配数最多、再保证总距离最小，
+    指派完成后再把落在门限外的配对剔除。安装了 SciPy 时直接使用 linear_sum_assignment。
+    """
+    dist = np.asarray(dist, dtype=np.float64)
+    if dist.size == 0: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    allowed = dist < gate
+    if not allowed.any(): return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    cost = np.where(allowed, dist, gate * (min(dist.shape) + 1))
+    try:
+        from scipy.optimize import linear_sum_assignment
+        rows, cols = linear_sum_assignment(cost)
+    except ImportError:
+        transposed = cost.shape[0] > cost.shape[1]
+        assignment = _hungarian(cost.T if transposed else cost)
+        rows = np.arange(len(assignment)); cols = assignment
+        if transposed: rows, cols = cols, rows
+        order = np.argsort(rows); rows, cols = rows[order], cols[order]
+    keep = allowed[rows, cols]
+    return rows[keep], cols[keep]
+
+
 # --- Game Event Data Classes ---
 
 @dataclass
@@ -124,52 +245,34 @@ class GameLogicEngine:
             "左侧": {"allies": ["右侧"], "enemies": ["上方", "下方"]},
             "右侧": {"allies": ["左侧"], "enemies": ["上方", "下方"]},
         }
+        # 节点数组相关模块依赖本模块的数据类，延迟导入以避免循环引用
+        from app.board_history import BoardCodec
+        from app.state_diff import EventResolver
+        self.codec = BoardCodec()
+        self.resolver = EventResolver(self.codec, self.teams())
 
     def is_enemy(self, piece1: Piece, piece2: Piece) -> bool:
         return piece2.player_pos in self.player_relationships.get(piece1.player_pos, {}).get("enemies", [])
 
+    def teams(self) -> Dict[str, int]:
+        """玩家方位 -> 阵营编号 (同盟的两方编号相同)"""
+        teams: Dict[str, int] = {}
+        for pos, rel in self.player_relationships.items():
+            if pos in teams: continue
+            team = len(set(teams.values()))
+            for member in [pos] + rel.get("allies", []): teams[member] = team
+        return teams
+
     def compare_states(self, prev_state: BoardState, curr_state: BoardState) -> List[GameEvent]:
-        events = []
-        prev_ids = set(prev_state.pieces.keys())
-        curr_ids = set(curr_state.pieces.keys())
-        disappeared_ids = prev_ids - curr_ids
-        
-        if len(disappeared_ids) == 1:
-            victim_id = disappeared_ids.pop()
-            victim = prev_state.pieces[victim_id]
-            attacker = None
-            for piece in curr_state.pieces.values():
-                if piece.board_coords == victim.board_coords and self.is_enemy(piece, victim):
-                    attacker = piece
-                    break
-            if attacker:
-                events.append(CaptureEvent("capture", curr_state.timestamp, attacker, victim, victim.board_coords))
-            else:
-                events.append(LandmineEvent("landmine", curr_state.timestamp, victim, victim.board_coords))
-
-        elif len(disappeared_ids) == 2:
-            p1_id, p2_id = disappeared_ids
-            p1 = prev_state.pieces[p1_id]
-            p2 = prev_state.pieces[p2_id]
-            if self.is_enemy(p1, p2) and p1.board_coords == p2.board_coords:
-                if p1.name == "炸弹":
-                    events.append(BombEvent("bomb", curr_state.timestamp, p1, p2, p1.board_coords))
-                elif p2.name == "炸弹":
-                    events.append(BombEvent("bomb", curr_state.timestamp, p2, p1, p1.board_coords))
-                elif p1.rank == p2.rank:
-                    events.append(TradeEvent("trade", curr_state.timestamp, p1, p2, p1.board_coords))
-                else:
-                    attacker, defender = (p1, p2) if p1.rank > p2.rank else (p2, p1)
-                    events.append(CaptureEvent("capture", curr_state.timestamp, attacker, defender, p1.board_coords))
-
-        if not disappeared_ids:
-            for piece_id, piece in curr_state.pieces.items():
-                if piece_id in prev_state.pieces:
-                    prev_piece = prev_state.pieces[piece_id]
-                    if piece.board_coords != prev_piece.board_coords:
-                        events.append(MoveEvent("move", curr_state.timestamp, piece, prev_piece.board_coords, piece.board_coords))
-                        break
-        return events
+        """
+        两帧 BoardState 编码为节点数组后交给 compare_nodes；
+        无法定位到节点的棋子 (缺少分区或坐标越界) 不参与比较。
+        """
+        return self.compare_nodes(self.codec.encode(prev_state), self.codec.encode(curr_state), curr_state.timestamp)
+
+    def compare_nodes(self, prev_nodes, curr_nodes, timestamp: float) -> List[GameEvent]:
+        """两帧节点数组 (board_history.NODE_DTYPE，使用 self.codec 编码) 之间的全部事件"""
+        return self.resolver.resolve(prev_nodes, curr_nodes, timestamp)
 
 # --- Utility Function ---
 def map_pixel_to_grid(px: int, py: int, locked_regions: Dict) -> Optional[Tuple[str, Tuple[int, int]]]:
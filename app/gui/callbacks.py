@@ -1,23 +1,22 @@
-import tkinter as tk
 from pathlib import Path
 import win32gui
 import win32con
 import win32api
-from threading import Thread
-import time
 import cv2
 import json
+import numpy as np
 
 from app.utils.capture import WindowCapture
-from app.services.game_analyzer import GameAnalyzer
+from app.utils.frame_source import WindowFrameSource
+from app.services.engines import create_engine
+from app.services.board_lattice import BoardLattice
+from app.services.pipeline import RecognitionPipeline, LATEST_ONLY
+from app.services.calibration import CalibrationManager, CalibrationStore, window_dpi
 
 # --- SINGLE UNIFIED LOGGER ---
 def log_message(app, message: str):
-    """Appends a message to the log panel."""
-    app.info_text.config(state='normal')
-    app.info_text.insert(tk.END, message + "\n\n")
-    app.info_text.see(tk.END)
-    app.info_text.config(state='disabled')
+    """Appends a message to the log panel (bounded; redraws coalesced per display frame)."""
+    app.log_view.append(message)
 
 # --- UTILITY FUNCTIONS ---
 def _force_set_topmost(app):
@@ -31,17 +30,27 @@ def _get_full_roi(app):
     regions = app.app_state.locked_regions.values()
     min_x=min(r[0] for r in regions); min_y=min(r[1] for r in regions)
     max_x=max(r[2] for r in regions); max_y=max(r[3] for r in regions)
-    return int(min_x), int(min_y), int(max_x), int(max_y)
+    # 分区是棋子中心的范围，外扩半个节点间距才能包住边缘的棋子
+    pad = int(np.ceil(BoardLattice(app.app_state.locked_regions).cell_sizes.max() / 2))
+    return max(0, int(min_x) - pad), max(0, int(min_y) - pad), int(max_x) + pad, int(max_y) + pad
 
 # --- INITIALIZATION AND UI CALLBACKS ---
 
 def initialize_analyzer(app):
     try:
-        app.app_state.game_analyzer = GameAnalyzer("pictures/qizi_samples")
+        app.app_state.game_analyzer = create_engine(app.engine_name, "pictures/qizi_samples")
+        app.app_state.calibration = CalibrationManager(
+            app.app_state.game_analyzer, CalibrationStore("data/calibration_profiles.json"),
+            dpi_provider=lambda: window_dpi(app.app_state.hwnd),
+            on_change=lambda regions, source: _on_calibration_change(app, regions, source))
         log_message(app, "--- 战情室启动成功 (V32-最终修复版) ---")
+        if app.show_metrics:
+            app.app_state.game_analyzer.enable_metrics(True, dump_path="data/metrics.json")
+            refresh_metrics_panel(app)
         if app.regions_file.exists():
             try:
                 with open(app.regions_file, 'r') as f: app.app_state.locked_regions = json.load(f)
+                app.app_state.calibration.adopt(app.app_state.locked_regions)
                 log_message(app, "[信息] 已成功从文件加载锁定的分区数据。")
             except Exception as e: log_message(app, f"[错误] 加载分区文件失败: {e}")
         else:
@@ -49,8 +58,24 @@ def initialize_analyzer(app):
             app.regions_file.parent.mkdir(parents=True, exist_ok=True)
     except Exception as e: log_message(app, f"[严重错误] 分析器初始化失败: {e}")
 
+METRICS_PANEL_STAGES = ("frame_total", "pool_roundtrip", "hsv", "mask", "xingying", "nms", "report")
+METRICS_REFRESH_MS = 1000
+
+def refresh_metrics_panel(app):
+    """每秒刷新一次性能面板：主要阶段的 p50/p95 与每帧计数"""
+    analyzer = app.app_state.game_analyzer
+    if app.metrics_label is None or analyzer is None: return
+    stats = analyzer.stats()
+    lines = [f"{stage:<15} p50={s['p50']:7.1f}ms  p95={s['p95']:7.1f}ms  n={s['count']}"
+             for stage in METRICS_PANEL_STAGES for s in [stats["timings_ms"].get(stage)] if s and s["count"]]
+    counts = "  ".join(f"{name}={s['p50']:.0f}" for name, s in stats["counts"].items() if s["count"])
+    if counts: lines.append(counts)
+    app.metrics_label.config(text="\n".join(lines) or "性能指标: 等待数据...")
+    app.root.after(METRICS_REFRESH_MS, refresh_metrics_panel, app)
+
 def on_closing(app):
     app.is_recognizing = False
+    if app.pipeline: app.pipeline.stop(); app.pipeline = None
     if app.app_state.hwnd and win32gui.IsWindow(app.app_state.hwnd):
         try:
             win32gui.ShowWindow(app.app_state.hwnd, win32con.SW_MINIMIZE)
@@ -59,9 +84,7 @@ def on_closing(app):
     app.root.destroy()
 
 def clear_log(app):
-    app.info_text.config(state='normal')
-    app.info_text.delete('1.0', tk.END)
-    app.info_text.config(state='disabled')
+    app.log_view.clear()
 
 # --- CORE FUNCTIONALITY CALLBACKS ---
 
@@ -70,6 +93,7 @@ def detect_game_window(app):
     try:
         app.app_state.window_capture = WindowCapture("JunQiRpg.exe", "四国军棋")
         app.app_state.hwnd = app.app_state.window_capture.hwnd
+        app.app_state.frame_source = WindowFrameSource(app.app_state.window_capture)
         if app.app_state.hwnd:
             win32gui.ShowWindow(app.app_state.hwnd, win32con.SW_RESTORE)
             _force_set_topmost(app)
@@ -86,21 +110,17 @@ def start_recognition(app, use_roi: bool):
 
     if not app.app_state.locked_regions:
         log_message(app, "[信息] 首次运行，正在自动分析并锁定分区...")
-        try:
-            regions = app.app_state.game_analyzer.get_player_regions(screenshot)
-            if len(regions) < 5: return log_message(app, "[错误] 未能计算出完整的5个区域。")
-            app.app_state.locked_regions = {k: tuple(map(int, v)) for k, v in regions.items()}
-            with open(app.regions_file, 'w') as f: json.dump(app.app_state.locked_regions, f, indent=4)
-            log_message(app, "[成功] 初始分区已自动锁定并保存！")
-        except Exception as e: return log_message(app, f"[严重错误] 自动锁定分区时出错: {e}")
-
-    image_to_analyze = screenshot
+    try:
+        app.app_state.calibration.ensure(screenshot)
+    except Exception as e: return log_message(app, f"[严重错误] 自动锁定分区时出错: {e}")
+
+    image_to_analyze, origin = screenshot, (0, 0)
     if use_roi:
         x1, y1, x2, y2 = _get_full_roi(app)
         if x1 is None: return log_message(app, "[错误] 分区数据不完整，无法计算ROI。")
-        image_to_analyze = screenshot[y1:y2, x1:x2]
+        image_to_analyze, origin = screenshot[y1:y2, x1:x2], (x1, y1)
     
-    report = app.app_state.game_analyzer.analyze_screenshot(image_to_analyze, match_threshold=0.8)
+    report = app.app_state.game_analyzer.analyze_screenshot(image_to_analyze, match_threshold=0.8, origin=origin)
     log_message(app, report)
     _force_set_topmost(app)
 
@@ -108,24 +128,51 @@ def start_continuous_recognition(app):
     if app.is_recognizing: return
     if not app.app_state.window_capture: return log_message(app, "[错误] 请先检测游戏窗口。")
     app.is_recognizing = True
+    app.calibration_error = None
     app.button3.config(state='disabled'); app.button4.config(state='normal')
-    app.recognition_thread = Thread(target=_continuous_recognition_worker, args=(app,), daemon=True)
-    app.recognition_thread.start()
+    app.pipeline = RecognitionPipeline(
+        app.app_state.frame_source,
+        analyze=lambda frame: _analyze_frame(app, frame),
+        publish=lambda result: app.root.after(0, _publish_result, app, result),
+        stale_policy=LATEST_ONLY,
+    )
+    app.pipeline.start()
     log_message(app, "--- 连续识别已启动 ---")
 
 def stop_continuous_recognition(app):
     if not app.is_recognizing: return
     app.is_recognizing = False
+    if app.pipeline: app.pipeline.stop(); app.pipeline = None
     app.button3.config(state='normal'); app.button4.config(state='disabled')
     log_message(app, "--- 连续识别已停止 ---")
 
-def _continuous_recognition_worker(app):
-    while app.is_recognizing:
-        screenshot = app.app_state.window_capture.get_screenshot()
-        if screenshot is None: time.sleep(0.5); continue
-        report = app.app_state.game_analyzer.analyze_screenshot(screenshot, match_threshold=0.8)
-        app.root.after(0, log_message, app, report)
-        time.sleep(1)
+def _on_calibration_change(app, regions, source):
+    """标定变化 (可能发生在分析线程中)：更新状态并保存 regions.json，日志转交主线程输出"""
+    app.app_state.locked_regions = dict(regions)
+    try:
+        with open(app.regions_file, 'w') as f: json.dump(app.app_state.locked_regions, f, indent=4)
+    except OSError: pass
+    message = "[成功] 已载入该窗口布局的标定档案。" if source == "profile" else "[成功] 分区已重新标定并保存！"
+    app.root.after(0, log_message, app, message)
+
+def _analyze_frame(app, frame):
+    # 每帧先用棋盘指纹校验标定 (亚毫秒)，失效时自动载入档案或重新标定
+    try:
+        app.app_state.calibration.ensure(frame.image)
+    except RuntimeError as e:
+        # 标定失效且暂时无法恢复：同一段失效只记一条日志，摘要区显示待标定状态，不用过期分区继续识别
+        if app.calibration_error is None: app.root.after(0, log_message, app, f"[警告] 标定失效: {e}")
+        app.calibration_error = str(e)
+        return f"[待标定] {e}\n请确认棋盘完整可见，恢复后自动继续识别。"
+    app.calibration_error = None
+    # 已锁定分区时走增量节点识别 (只重识别变化的格子)，否则退回整图匹配
+    mode = "incremental" if app.app_state.game_analyzer.lattice is not None else "full"
+    return app.app_state.game_analyzer.analyze_screenshot(frame.image, match_threshold=0.8, mode=mode)
+
+def _publish_result(app, result):
+    if not app.is_recognizing: return
+    # 连续识别的结果只刷新摘要区，不再逐秒追加到日志
+    app.log_view.set_summary(f"{result.result}\n(端到端延迟: {result.latency * 1000:.0f} ms)")
 
 # --- VISUALIZATION CALLBACKS ---
 
@@ -154,15 +201,7 @@ def visualize_theoretical_nodes(app):
     screenshot = app.app_state.window_capture.get_screenshot();
     if screenshot is None: return
     vis_image = screenshot.copy()
-    all_nodes = []
-    specs = {"上方":(6,5),"下方":(6,5),"左侧":(6,5),"右侧":(6,5),"中央":(3,3)}
-    for key, (rows,cols) in specs.items():
-        if key in app.app_state.locked_regions:
-            x1,y1,x2,y2 = map(int, app.app_state.locked_regions[key])
-            cell_w, cell_h = (x2-x1)/cols, (y2-y1)/rows
-            for r in range(rows):
-                for c in range(cols):
-                    all_nodes.append((int(x1+(c+0.5)*cell_w), int(y1+(r+0.5)*cell_h)))
+    all_nodes = [node.center for node in BoardLattice(app.app_state.locked_regions).nodes]
     for (cx,cy) in all_nodes: cv2.circle(vis_image, (cx,cy), 5, (0,255,0), -1)
     log_message(app, f"成功生成了 {len(all_nodes)} 个理论棋盘节点。")
     cv2.imshow("理论节点分布 (按钮7)", vis_image); cv2.waitKey(1); _force_set_topmost(app)
@@ -0,0 +1,82 @@
+"""
+日志面板模块
+- 日志区只保留最近 max_entries 条消息，超出部分从顶部整段删除，Text 控件不再无限增长
+- 实时棋盘摘要显示在日志区上方的固定区域，原地更新，只改写内容变化的行
+- append / set_summary 只记录待显示内容并登记一次刷新，同一显示帧内的多次调用合并为一次重绘
+"""
+import tkinter as tk
+from collections import deque
+from typing import Deque, List, Optional
+
+FRAME_MS = 16  # 约 60Hz，一个显示帧内最多重绘一次
+
+
+class LogView:
+    def __init__(self, root, log_text: tk.Text, summary_text: Optional[tk.Text] = None,
+                 max_entries: int = 500, frame_ms: int = FRAME_MS):
+        self.root = root
+        self.log_text = log_text
+        self.summary_text = summary_text
+        self.max_entries = max_entries
+        self.frame_ms = frame_ms
+        self._pending: Deque[str] = deque(maxlen=max_entries)  # 一帧内来不及显示的消息，同样有界
+        self._entry_lines: Deque[int] = deque()  # 日志区中每条消息占用的行数 (含分隔空行)
+        self._summary: Optional[str] = None
+        self._summary_lines: List[str] = []
+        self._scheduled = None
+
+    def append(self, message: str) -> None:
+        self._pending.append(message)
+        self._schedule()
+
+    def set_summary(self, text: str) -> None:
+        """没有摘要区时退化为追加一条日志"""
+        if self.summary_text is None: return self.append(text)
+        self._summary = text
+        self._schedule()
+
+    def clear(self) -> None:
+        self._pending.clear(); self._entry_lines.clear()
+        self._edit(self.log_text, lambda w: w.delete("1.0", tk.END))
+
+    def _schedule(self) -> None:
+        if self._scheduled is None: self._scheduled = self.root.after(self.frame_ms, self.flush)
+
+    def flush(self) -> None:
+        self._scheduled = None
+        if self._pending: self._flush_log()
+        if self._summary is not None: self._flush_summary()
+
+    @staticmethod
+    def _edit(widget: tk.Text, action) -> None:
+        widget.config(state="normal")
+        try: action(widget)
+        finally: widget.config(state="disabled")
+
+    def _flush_log(self) -> None:
+        messages = list(self._pending); self._pending.clear()
+        for m in messages: self._entry_lines.append(m.count("\n") + 2)
+        excess = len(self._entry_lines) - self.max_entries
+        drop_lines = sum(self._entry_lines.popleft() for _ in range(max(0, excess)))
+
+        def apply(w: tk.Text) -> None:
+            w.insert(tk.END, "".join(m + "\n\n" for m in messages))
+            if drop_lines: w.delete("1.0", f"{drop_lines + 1}.0")
+            w.see(tk.END)
+        self._edit(self.log_text, apply)
+
+    def _flush_summary(self) -> None:
+        lines = self._summary.split("\n"); self._summary = None
+        old = self._summary_lines
+        if lines == old: return
+
+        def apply(w: tk.Text) -> None:
+            for i, line in enumerate(lines[:len(old)]):
+                if line != old[i]:
+                    w.delete(f"{i + 1}.0", f"{i + 1}.end"); w.insert(f"{i + 1}.0", line)
+            if len(lines) > len(old):
+                w.insert(tk.END, ("\n" if old else "") + "\n".join(lines[len(old):]))
+            elif len(lines) < len(old):
+                w.delete(f"{len(lines)}.end", tk.END)
+        self._edit(self.summary_text, apply)
+        self._summary_lines = lines
@@ -3,10 +3,12 @@ from tkinter import ttk, scrolledtext
 from pathlib import Path
 
 from app.app_state import AppState
+from app.gui.log_view import LogView
+from app.services.engines import DEFAULT_ENGINE
 import app.gui.callbacks as callbacks
 
 class DashboardApp:
-    def __init__(self, root):
+    def __init__(self, root, show_metrics: bool = False, engine: str = DEFAULT_ENGINE):
         self.root = root
         self.root.title("陆战棋-智能战情室 (V33-模块化)")
         self.root.geometry("800x800")
@@ -15,9 +17,14 @@ class DashboardApp:
         self.app_state = AppState()
         self.regions_file = Path("data/regions.json")
         self.is_recognizing = False
-        self.recognition_thread = None
+        self.pipeline = None
+        self.calibration_error = None  # 连续识别中最近一次标定失败的原因；恢复后清空
         self.button3 = None
         self.button4 = None
+        self.show_metrics = show_metrics
+        self.engine_name = engine  # 识别引擎注册名，见 app.services.engines
+        self.metrics_label = None
+        self.log_view = None
 
         self.setup_ui()
         self.setup_bindings()
@@ -29,8 +36,15 @@ class DashboardApp:
         self.control_frame = ttk.Frame(self.root, height=150)
         self.control_frame.pack(fill="x", padx=10, pady=5)
         self.control_frame.pack_propagate(False)
+        if self.show_metrics:
+            self.metrics_label = ttk.Label(self.info_frame, text="性能指标: 等待数据...", font=("Consolas", 9), justify="left", anchor="w")
+            self.metrics_label.pack(fill="x", padx=5, pady=(5, 0))
+        # 实时棋盘摘要 (原地更新) 在上，有界日志在下
+        self.summary_text = tk.Text(self.info_frame, height=12, wrap=tk.NONE, state='disabled', font=("Microsoft YaHei", 10), bg="#e8eef4")
+        self.summary_text.pack(fill="x", padx=5, pady=(5, 0))
         self.info_text = scrolledtext.ScrolledText(self.info_frame, wrap=tk.WORD, state='disabled', font=("Microsoft YaHei", 10), bg="#f0f0f0")
         self.info_text.pack(fill="both", expand=True, padx=5, pady=5)
+        self.log_view = LogView(self.root, self.info_text, self.summary_text, max_entries=500)
         
         self.setup_control_buttons()
 
@@ -0,0 +1,116 @@
+"""
+棋盘理论节点模块
+由锁定分区 (data/regions.json) 与各分区的行列规格生成全部理论节点，
+供节点局部匹配、可视化等功能共用。
+
+锁定分区的口径 (见 region_finder.regions_from_points):
+- 四条臂的边界是该臂棋子中心的范围，首尾两行/列节点正好落在边界上，节点按边界到边界等距排列
+- 中央分区由四条臂的内沿围成，节点位于 3x3 等分格子的中心
+- 左右两臂在截图中横置：逻辑行沿 x 方向 (6 列)，逻辑列沿 y 方向 (5 行)
+"""
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Sequence
+
+# 各分区的逻辑 (行数, 列数)
+REGION_SPECS: Dict[str, Tuple[int, int]] = {"上方": (6, 5), "下方": (6, 5), "左侧": (6, 5), "右侧": (6, 5), "中央": (3, 3)}
+TRANSPOSED_REGIONS = ("左侧", "右侧")
+CENTER_REGION = "中央"
+
+
+def region_grid(region: str) -> Tuple[int, int]:
+    """分区在截图中的 (行数, 列数)；横置的臂为逻辑规格的转置"""
+    rows, cols = REGION_SPECS[region]
+    return (cols, rows) if region in TRANSPOSED_REGIONS else (rows, cols)
+
+
+def region_pitch(region: str, bounds: Sequence[float]) -> Tuple[float, float]:
+    """分区内相邻节点在截图中的间距 (dx, dy)"""
+    x1, y1, x2, y2 = bounds
+    rows, cols = region_grid(region)
+    if region == CENTER_REGION: return (x2 - x1) / cols, (y2 - y1) / rows
+    return (x2 - x1) / max(1, cols - 1), (y2 - y1) / max(1, rows - 1)
+
+
+def region_node_centers(region: str, bounds: Sequence[float]) -> np.ndarray:
+    """分区全部节点的截图坐标 (rows * cols, 2)，按逻辑坐标行优先排列"""
+    x1, y1, _, _ = bounds
+    rows, cols = REGION_SPECS[region]
+    dx, dy = region_pitch(region, bounds)
+    r, c = np.divmod(np.arange(rows * cols), cols)
+    if region in TRANSPOSED_REGIONS: r, c = c, r   # 逻辑行 -> 截图列
+    offset = 0.5 if region == CENTER_REGION else 0.0
+    return np.stack([x1 + (c + offset) * dx, y1 + (r + offset) * dy], axis=1)
+
+
+@dataclass
+class BoardNode:
+    index: int
+    region: str
+    row: int
+    col: int
+    center: Tuple[int, int]
+    cell_size: Tuple[float, float]  # 相邻节点间距 (cell_w, cell_h)
+
+
+class BoardLattice:
+    """
+    锁定分区对应的理论节点网格
+    - nodes: 按 REGION_SPECS 顺序、行优先排列的节点
+    - centers / cell_sizes: 与 nodes 对齐的 (N, 2) 数组，便于向量化计算
+    """
+
+    def __init__(self, locked_regions: Dict[str, Sequence[int]]):
+        self.locked_regions = {k: tuple(int(v) for v in bounds) for k, bounds in locked_regions.items()}
+        self.nodes: List[BoardNode] = []
+        self._index: Dict[Tuple[str, int, int], int] = {}
+        for region, (rows, cols) in REGION_SPECS.items():
+            if region not in self.locked_regions: continue
+            bounds = self.locked_regions[region]
+            cell_size = region_pitch(region, bounds)
+            centers = np.round(region_node_centers(region, bounds)).astype(int)
+            for (r, c), (cx, cy) in zip(np.ndindex(rows, cols), centers):
+                node = BoardNode(len(self.nodes), region, r, c, (int(cx), int(cy)), cell_size)
+                self._index[(region, r, c)] = node.index
+                self.nodes.append(node)
+        self.centers = np.array([n.center for n in self.nodes], dtype=np.int32).reshape(-1, 2)
+        self.cell_sizes = np.array([n.cell_size for n in self.nodes], dtype=np.float32).reshape(-1, 2)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def node_index(self, region: str, row: int, col: int) -> int:
+        return self._index[(region, row, col)]
+
+    def search_windows(self, template_size: Tuple[int, int], margin: int, image_shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        每个节点的局部搜索窗口 (N, 4) = [x1, y1, x2, y2]，已裁剪到图像范围内。
+        窗口为节点格子与最大模板尺寸中的较大者，再向四周扩展 margin 像素以容忍抖动。
+        """
+        tmpl_h, tmpl_w = template_size
+        img_h, img_w = image_shape[:2]
+        half_w = np.ceil(np.maximum(self.cell_sizes[:, 0], tmpl_w) / 2).astype(np.int32) + margin
+        half_h = np.ceil(np.maximum(self.cell_sizes[:, 1], tmpl_h) / 2).astype(np.int32) + margin
+        windows = np.stack([self.centers[:, 0] - half_w, self.centers[:, 1] - half_h,
+                            self.centers[:, 0] + half_w, self.centers[:, 1] + half_h], axis=1)
+        windows[:, [0, 2]] = np.clip(windows[:, [0, 2]], 0, img_w)
+        windows[:, [1, 3]] = np.clip(windows[:, [1, 3]], 0, img_h)
+        return windows
+
+    def cell_windows(self, image_shape: Tuple[int, ...]) -> np.ndarray:
+        """每个节点自身格子的范围 (N, 4)，不含抖动余量"""
+        return self.search_windows((0, 0), 0, image_shape)
+
+    def cell_signatures(self, image: np.ndarray, size: int = 16) -> np.ndarray:
+        """
+        每个节点格子的廉价像素签名：BGR 格子经 INTER_AREA 缩放到 size x size。
+        返回 (N, size * size * 3) 的 int16 数组；保留颜色通道，同形异色的棋子 (换色、吃子) 也会改变签名。
+        """
+        channels = image.shape[2] if image.ndim == 3 else 1
+        signatures = np.zeros((len(self.nodes), size * size * channels), dtype=np.int16)
+        for i, (x1, y1, x2, y2) in enumerate(self.cell_windows(image.shape)):
+            cell = image[y1:y2, x1:x2]
+            if cell.size == 0: continue
+            signatures[i] = cv2.resize(cell, (size, size), interpolation=cv2.INTER_AREA).reshape(-1)
+        return signatures
@@ -0,0 +1,221 @@
+"""
+标定校验与标定档案模块
+- BoardFingerprint: 标定时在中央分区的棋盘线边缘上采样少量像素作为指纹，
+  每帧只需比较这几十个像素 (远小于 1 毫秒)，窗口缩放、跨 DPI 显示器、重新布局或平移几个像素时即可发现标定失效
+- CalibrationStore: 以 "客户区宽x高@DPI" 为键保存分区与指纹，回到已知布局时直接载入
+- CalibrationManager: 每帧先校验指纹，失败时依次尝试已保存的档案与重新标定
+"""
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.services.board_lattice import CENTER_REGION, region_grid, region_node_centers, region_pitch
+
+Bounds = Tuple[int, int, int, int]
+DEFAULT_DPI = 96
+FINGERPRINT_VERSION = 2   # 采样点规则变化时递增，旧档案的指纹视为失效
+
+
+def window_dpi(hwnd: int) -> int:
+    """窗口所在显示器的 DPI；非 Windows 或接口不可用时返回 96"""
+    try:
+        import ctypes
+        dpi = ctypes.windll.user32.GetDpiForWindow(hwnd)
+        return int(dpi) or DEFAULT_DPI
+    except Exception:
+        return DEFAULT_DPI
+
+
+def _segment_midpoints(bounds: Bounds) -> List[Tuple[float, float, bool]]:
+    """中央分区相邻节点连线的中点 (x, y, 是否横向)；节点上才会有棋子，中点附近只有棋盘线"""
+    rows, cols = region_grid(CENTER_REGION)
+    centers = region_node_centers(CENTER_REGION, bounds).reshape(rows, cols, 2)
+    mids = [((centers[r, c] + centers[r, c + 1]) / 2, True) for r in range(rows) for c in range(cols - 1)]
+    mids += [((centers[r, c] + centers[r + 1, c]) / 2, False) for r in range(rows - 1) for c in range(cols)]
+    return [(float(m[0]), float(m[1]), horizontal) for m, horizontal in mids]
+
+
+def landmark_points(image: np.ndarray, locked_regions: Dict[str, Bounds], per_segment: int = 3,
+                    min_gradient: float = 96.0) -> np.ndarray:
+    """
+    指纹采样点：中央分区每段棋盘线中点附近的窗口 (沿线 ±1/6 间距、垂直于线 ±1/4 间距，远离节点上的棋子)
+    沿线等分为 per_segment 段，每段各取 |gx|、|gy| 最大的像素，即棋盘线与虚线端点的边缘；
+    边缘像素在窗口平移 1 个像素后即会变化，而角区、边框等平坦区域对平移不敏感
+    """
+    bounds = locked_regions.get(CENTER_REGION)
+    if bounds is None: return np.zeros((0, 2), dtype=np.int32)
+    h, w = image.shape[:2]
+    x1, y1, x2, y2 = (int(v) for v in bounds)
+    x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+    if x2 - x1 < 3 or y2 - y1 < 3: return np.zeros((0, 2), dtype=np.int32)
+    gray = cv2.cvtColor(image[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY).astype(np.float32)
+    gradients = (np.abs(cv2.Sobel(gray, cv2.CV_32F, 1, 0)), np.abs(cv2.Sobel(gray, cv2.CV_32F, 0, 1)))
+    dx, dy = region_pitch(CENTER_REGION, bounds)
+    points = []
+    for mx, my, horizontal in _segment_midpoints(bounds):
+        along, across = (dx, dy) if horizontal else (dy, dx)
+        steps = np.linspace(-along / 6, along / 6, per_segment + 1)
+        for a0, a1 in zip(steps[:-1], steps[1:]):
+            if horizontal: wx1, wx2, wy1, wy2 = mx + a0, mx + a1, my - across / 4, my + across / 4
+            else: wx1, wx2, wy1, wy2 = mx - across / 4, mx + across / 4, my + a0, my + a1
+            # 窗口换算到裁剪坐标，并去掉 Sobel 边界行列
+            wx1, wy1 = max(1, int(round(wx1)) - x1), max(1, int(round(wy1)) - y1)
+            wx2, wy2 = min(x2 - x1 - 1, int(round(wx2)) - x1), min(y2 - y1 - 1, int(round(wy2)) - y1)
+            if wx2 <= wx1 or wy2 <= wy1: continue
+            for gradient in gradients:
+                patch = gradient[wy1:wy2, wx1:wx2]
+                r, c = np.unravel_index(int(np.argmax(patch)), patch.shape)
+                if patch[r, c] >= min_gradient: points.append((x1 + wx1 + c, y1 + wy1 + r))
+    return np.array(points, dtype=np.int32).reshape(-1, 2)
+
+
+@dataclass
+class BoardFingerprint:
+    """
+    - frame_shape 不一致 (窗口缩放/DPI 变化) 直接判定失效
+    - 否则逐点比较 BGR，三通道差值都不超过 tolerance 的点占比不低于 min_agreement 即视为一致
+    - 采样点都在边缘上，棋盘平移 1 个像素以上时一致率即降到 0.55 以下
+    """
+    frame_shape: Tuple[int, int]
+    points: np.ndarray   # (K, 2) int32 (x, y)
+    values: np.ndarray   # (K, 3) int16 BGR
+    tolerance: int = 16
+    min_agreement: float = 0.8
+
+    @classmethod
+    def capture(cls, image: np.ndarray, locked_regions: Dict[str, Bounds], **kwargs) -> "BoardFingerprint":
+        points = landmark_points(image, locked_regions)
+        values = image[points[:, 1], points[:, 0]].astype(np.int16)
+        return cls(tuple(image.shape[:2]), points, values, **kwargs)
+
+    def agreement(self, image: np.ndarray) -> float:
+        if tuple(image.shape[:2]) != tuple(self.frame_shape) or len(self.points) == 0: return 0.0
+        current = image[self.points[:, 1], self.points[:, 0]].astype(np.int16)
+        return float((np.abs(current - self.values) <= self.tolerance).all(axis=1).mean())
+
+    def matches(self, image: np.ndarray) -> bool:
+        return self.agreement(image) >= self.min_agreement
+
+    def to_dict(self) -> Dict:
+        return {"frame_shape": list(self.frame_shape), "points": self.points.tolist(), "values": self.values.tolist(),
+                "tolerance": self.tolerance, "min_agreement": self.min_agreement, "version": FINGERPRINT_VERSION}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BoardFingerprint":
+        if data.get("version") != FINGERPRINT_VERSION:   # 旧规则的采样点对平移不敏感，不再沿用
+            return cls(tuple(data["frame_shape"]), np.zeros((0, 2), dtype=np.int32), np.zeros((0, 3), dtype=np.int16))
+        return cls(tuple(data["frame_shape"]), np.array(data["points"], dtype=np.int32).reshape(-1, 2),
+                   np.array(data["values"], dtype=np.int16).reshape(-1, 3), data.get("tolerance", 16),
+                   data.get("min_agreement", 0.8))
+
+
+@dataclass
+class CalibrationProfile:
+    locked_regions: Dict[str, Bounds]
+    fingerprint: BoardFingerprint
+    saved_at: str = ""
+
+
+class CalibrationStore:
+    """标定档案文件: {"1024x768@96": {"locked_regions": ..., "fingerprint": ..., "saved_at": ...}, ...}"""
+
+    def __init__(self, path: str = "data/calibration_profiles.json"):
+        self.path = Path(path)
+        self._profiles: Dict[str, Dict] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f: self._profiles = json.load(f)
+            except (OSError, ValueError):
+                self._profiles = {}
+
+    @staticmethod
+    def key(frame_shape: Tuple[int, ...], dpi: int) -> str:
+        return f"{frame_shape[1]}x{frame_shape[0]}@{dpi}"
+
+    def load(self, key: str) -> Optional[CalibrationProfile]:
+        data = self._profiles.get(key)
+        if data is None: return None
+        regions = {k: tuple(int(v) for v in bounds) for k, bounds in data["locked_regions"].items()}
+        return CalibrationProfile(regions, BoardFingerprint.from_dict(data["fingerprint"]), data.get("saved_at", ""))
+
+    def save(self, key: str, profile: CalibrationProfile) -> None:
+        self._profiles[key] = {"locked_regions": {k: list(v) for k, v in profile.locked_regions.items()},
+                               "fingerprint": profile.fingerprint.to_dict(), "saved_at": profile.saved_at}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._profiles, f, ensure_ascii=False)
+        tmp.replace(self.path)
+
+
+class CalibrationManager:
+    """
+    Args:
+        analyzer: GameAnalyzer，用于重新标定 (get_player_regions) 与应用分区 (set_locked_regions)
+        store: 标定档案
+        dpi_provider: 返回当前窗口 DPI 的函数
+        on_change: 分区发生变化时的回调，参数为 (新分区, 来源: "profile" / "recalibrated")
+        method: 重新标定时 get_player_regions 使用的方法
+        retry_interval: 重新标定失败后，至少间隔多少秒再重试 (避免每帧都做整图匹配)
+    """
+
+    def __init__(self, analyzer, store: CalibrationStore, dpi_provider: Callable[[], int] = lambda: DEFAULT_DPI,
+                 on_change: Optional[Callable[[Dict[str, Bounds], str], None]] = None, method: str = "detections",
+                 retry_interval: float = 2.0):
+        self.analyzer = analyzer
+        self.store = store
+        self.dpi_provider = dpi_provider
+        self.on_change = on_change
+        self.method = method
+        self.retry_interval = retry_interval
+        self._retry_at = 0.0
+        self.locked_regions: Optional[Dict[str, Bounds]] = None
+        self.fingerprint: Optional[BoardFingerprint] = None
+        self.failures = 0
+
+    def adopt(self, locked_regions: Dict[str, Bounds]) -> None:
+        """沿用已有分区 (如旧版 regions.json)；指纹在下一帧时从该帧采集"""
+        self.locked_regions = {k: tuple(int(v) for v in b) for k, b in locked_regions.items()}
+        self.fingerprint = None
+        self.analyzer.set_locked_regions(self.locked_regions)
+
+    def ensure(self, image: np.ndarray) -> Optional[str]:
+        """
+        保证分区与当前帧一致。返回 None 表示沿用现有分区，"profile" 表示载入了已保存的档案，
+        "recalibrated" 表示重新标定；重新标定失败时抛出 RuntimeError。
+        """
+        if self.locked_regions is not None:
+            if self.fingerprint is None:
+                self.fingerprint = BoardFingerprint.capture(image, self.locked_regions)
+                return None
+            if self.fingerprint.matches(image): return None
+        self.failures += 1
+
+        key = self.store.key(image.shape, self.dpi_provider())
+        profile = self.store.load(key)
+        if profile is not None and profile.fingerprint.matches(image):
+            self._apply(profile.locked_regions, profile.fingerprint)
+            source = "profile"
+        else:
+            if time.monotonic() < self._retry_at: raise RuntimeError("标定失效，等待重试。")
+            regions = self.analyzer.get_player_regions(image, method=self.method)
+            if len(regions) < 5:
+                self._retry_at = time.monotonic() + self.retry_interval
+                raise RuntimeError("未能计算出完整的5个区域。")
+            regions = {k: tuple(int(v) for v in b) for k, b in regions.items()}
+            fingerprint = BoardFingerprint.capture(image, regions)
+            self.store.save(key, CalibrationProfile(regions, fingerprint, time.strftime("%Y-%m-%dT%H:%M:%S")))
+            self._apply(regions, fingerprint)
+            source = "recalibrated"
+        if self.on_change is not None: self.on_change(self.locked_regions, source)
+        return source
+
+    def _apply(self, regions: Dict[str, Bounds], fingerprint: BoardFingerprint) -> None:
+        self.locked_regions = regions
+        self.fingerprint = fingerprint
+        self.analyzer.set_locked_regions(regions)
@@ -0,0 +1,69 @@
+"""
+识别引擎注册表
+GUI、流水线与基准测试都通过名字取得引擎，不直接依赖具体实现:
+- "analyzer": GameAnalyzer，按颜色掩膜逐色匹配，支持锁定分区后的节点增量识别 (默认)
+- "clahe": ClaheDetector，整帧一张 CLAHE 增强灰度图，每个 (棋子, 方向) 只匹配一个代表模板，
+  颜色由检测框内的颜色标签决定；config={"detect_stride": 2} 时启用步长搜索
+内置引擎在首次创建时才导入，避免未使用的引擎拖慢启动。
+"""
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+
+import numpy as np
+
+Bounds = Tuple[int, int, int, int]
+
+
+class DetectionEngine(Protocol):
+    """各引擎共同实现的接口 (与 GameAnalyzer 的公开方法一致)"""
+    lattice: Any
+
+    def analyze_screenshot(self, screenshot: np.ndarray, match_threshold: float = 0.8,
+                           return_detections: bool = False, mode: Optional[str] = None,
+                           origin: Tuple[int, int] = (0, 0)) -> Any: ...
+
+    def set_locked_regions(self, locked_regions: Optional[Dict[str, Bounds]]) -> None: ...
+
+    def get_player_regions(self, screenshot: np.ndarray, match_threshold: float = 0.7,
+                           method: str = "detections") -> Dict[str, Bounds]: ...
+
+    def enable_metrics(self, enabled: bool = True, dump_path: Optional[str] = None,
+                       dump_interval: float = 10.0) -> None: ...
+
+    def stats(self) -> Dict[str, Dict]: ...
+
+    def close(self) -> None: ...
+
+
+EngineFactory = Callable[..., DetectionEngine]
+ENGINES: Dict[str, EngineFactory] = {}
+DEFAULT_ENGINE = "analyzer"
+
+
+def register_engine(name: str) -> Callable[[EngineFactory], EngineFactory]:
+    """装饰器：factory(templates_path, **kwargs) -> DetectionEngine"""
+    def decorator(factory: EngineFactory) -> EngineFactory:
+        ENGINES[name] = factory
+        return factory
+    return decorator
+
+
+def available_engines() -> List[str]:
+    return sorted(ENGINES)
+
+
+def create_engine(name: str, templates_path: str, **kwargs) -> DetectionEngine:
+    factory = ENGINES.get(name)
+    if factory is None: raise ValueError(f"未知的识别引擎: {name}，可选: {', '.join(available_engines())}")
+    return factory(templates_path, **kwargs)
+
+
+@register_engine("analyzer")
+def _create_analyzer(templates_path: str, **kwargs) -> DetectionEngine:
+    from app.services.game_analyzer import GameAnalyzer
+    return GameAnalyzer(templates_path, **kwargs)
+
+
+@register_engine("clahe")
+def _create_clahe(templates_path: str, **kwargs) -> DetectionEngine:
+    from app.utils.vision.detect import ClaheDetector
+    return ClaheDetector(templates_path, **kwargs)
@@ -0,0 +1,165 @@
+"""
+执行后端模块
+GameAnalyzer 每帧的并行任务统一通过 FrameExecutor.map() 分发，后端可选:
+- process: multiprocessing 进程池 (启动慢、占内存，但不受 GIL 限制)
+- thread: 线程池；cv2.matchTemplate / cvtColor / inRange 执行期间会释放 GIL
+- inline: 在调用线程中顺序执行，把并行交给 OpenCV 自身的线程池
+并发调度器 (governor) 统一决定工作者数量、每个工作者内 cv2.setNumThreads 的取值与每帧任务粒度，
+避免“进程数 x OpenCV 线程数”超订 CPU。执行器在第一次 map() 时才创建工作者。
+工作者状态由 initializer 的返回值给出，任务函数的签名为 fn(state, task)：
+进程后端每个子进程各持一份，线程/内联后端由执行器实例持有，不同执行器之间互不共享。
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from multiprocessing import Pool
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+
+PROCESS = "process"
+THREAD = "thread"
+INLINE = "inline"
+BACKENDS = (PROCESS, THREAD, INLINE)
+
+
+@dataclass(frozen=True)
+class ExecutorConfig:
+    """
+    - backend: process / thread / inline
+    - workers: 工作者数量，0 表示按 CPU 核数自动决定 (inline 恒为 1)
+    - cv_threads: 每个工作者内 OpenCV 的线程数，0 表示由调度器按 CPU 核数 / 工作者数分配
+    - tasks_per_worker: 每帧任务粒度，调用方据此把一帧的工作切成 workers * tasks_per_worker 份
+    """
+    backend: str = THREAD
+    workers: int = 0
+    cv_threads: int = 0
+    tasks_per_worker: int = 1
+
+    def resolved(self, cpus: Optional[int] = None) -> "ExecutorConfig":
+        """把自动取值 (0) 换成具体数值"""
+        if self.backend not in BACKENDS: raise ValueError(f"未知的执行后端: {self.backend}")
+        cpus = cpus or os.cpu_count() or 1
+        workers = 1 if self.backend == INLINE else (self.workers or cpus)
+        cv_threads = self.cv_threads or max(1, cpus // workers)
+        return replace(self, workers=workers, cv_threads=cv_threads, tasks_per_worker=max(1, self.tasks_per_worker))
+
+    def describe(self) -> str:
+        return f"{self.backend}(workers={self.workers}, cv_threads={self.cv_threads}, tasks_per_worker={self.tasks_per_worker})"
+
+
+# 进程后端子进程内的工作者状态 (每个子进程只属于一个执行器)
+_PROCESS_STATE: Any = None
+
+
+def _process_initializer(cv_threads: int, initializer: Optional[Callable], initargs: Tuple) -> None:
+    global _PROCESS_STATE
+    cv2.setNumThreads(cv_threads)
+    _PROCESS_STATE = initializer(*initargs) if initializer is not None else None
+
+
+def _process_call(job: Tuple[Callable[[Any, Any], Any], Any]) -> Any:
+    fn, task = job
+    return fn(_PROCESS_STATE, task)
+
+
+class FrameExecutor:
+    """
+    按 ExecutorConfig 懒创建的执行器
+    - initializer/initargs: 返回工作者状态；进程后端在每个子进程中执行，线程/内联后端在本进程执行一次并由本实例持有
+    - shares_memory: 工作者与调用方是否同处一个进程 (决定帧的传递方式)
+    """
+
+    def __init__(self, config: ExecutorConfig, initializer: Optional[Callable] = None, initargs: Tuple = ()):
+        self.config = config.resolved()
+        self.initializer = initializer
+        self.initargs = initargs
+        self._pool = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._initialized = False
+        self._state: Any = None
+        self._previous_cv_threads: Optional[int] = None
+
+    @property
+    def shares_memory(self) -> bool:
+        return self.config.backend != PROCESS
+
+    @property
+    def task_slots(self) -> int:
+        """建议的每帧任务数"""
+        return self.config.workers * self.config.tasks_per_worker
+
+    @property
+    def started(self) -> bool:
+        return self._initialized
+
+    def _ensure_started(self) -> None:
+        if self._initialized: return
+        cfg = self.config
+        if cfg.backend == PROCESS:
+            self._pool = Pool(processes=cfg.workers, initializer=_process_initializer,
+                              initargs=(cfg.cv_threads, self.initializer, self.initargs))
+        else:
+            # 线程/内联后端共享一个 OpenCV 线程池，其大小即调度器分配给每个工作者的线程数
+            self._previous_cv_threads = cv2.getNumThreads()
+            cv2.setNumThreads(cfg.cv_threads if cfg.backend == THREAD else max(cfg.cv_threads, os.cpu_count() or 1))
+            self._state = self.initializer(*self.initargs) if self.initializer is not None else None
+            if cfg.backend == THREAD:
+                self._threads = ThreadPoolExecutor(max_workers=cfg.workers, thread_name_prefix="analyzer")
+        self._initialized = True
+
+    def map(self, fn: Callable[[Any, Any], Any], tasks: Sequence[Any]) -> List[Any]:
+        """对每个任务执行 fn(state, task)；fn 须为模块级函数 (进程后端需要 pickle)"""
+        self._ensure_started()
+        if self._pool is not None: return self._pool.map(_process_call, [(fn, task) for task in tasks])
+        state = self._state
+        if self._threads is not None and len(tasks) > 1: return list(self._threads.map(lambda task: fn(state, task), tasks))
+        return [fn(state, task) for task in tasks]
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close(); self._pool.join(); self._pool = None
+        if self._threads is not None:
+            self._threads.shutdown(wait=True); self._threads = None
+        if self._previous_cv_threads is not None:
+            cv2.setNumThreads(self._previous_cv_threads); self._previous_cv_threads = None
+        self._state = None
+        self._initialized = False
+
+
+def candidate_configs(cpus: Optional[int] = None) -> List[ExecutorConfig]:
+    """自动调优的候选配置：各后端 x 若干工作者数量与任务粒度"""
+    cpus = cpus or os.cpu_count() or 1
+    worker_counts = sorted({max(1, cpus // 2), cpus, min(cpus, 4)})
+    configs = [ExecutorConfig(INLINE)]
+    for backend in (THREAD, PROCESS):
+        for workers in worker_counts:
+            for granularity in (1, 2):
+                configs.append(ExecutorConfig(backend, workers, 0, granularity))
+    return configs
+
+
+def autotune(apply: Callable[[ExecutorConfig], None], run_frame: Callable[[], Any],
+             configs: Optional[Iterable[ExecutorConfig]] = None, repeat: int = 5, warmup: int = 1) -> Tuple[ExecutorConfig, List[Dict]]:
+    """
+    逐个应用候选配置，测量 run_frame 的中位耗时，返回最快的配置与全部测量结果。
+    apply 负责把配置装到被测对象上 (并关闭旧的执行器)；warmup 轮次包含工作者的启动开销，不计入结果。
+    """
+    results = []
+    for config in configs or candidate_configs():
+        try:
+            apply(config)
+            for _ in range(warmup): run_frame()
+            samples = []
+            for _ in range(repeat):
+                t0 = time.perf_counter(); run_frame(); samples.append(time.perf_counter() - t0)
+            samples.sort()
+            results.append({"config": config.resolved(), "median_s": samples[len(samples) // 2], "min_s": samples[0]})
+        except Exception as e:
+            results.append({"config": config.resolved(), "error": repr(e)})
+    timed = [r for r in results if "median_s" in r]
+    if not timed: raise RuntimeError("所有候选执行配置均运行失败")
+    best = min(timed, key=lambda r: r["median_s"])["config"]
+    apply(best)
+    return best, results
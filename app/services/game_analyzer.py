@@ -1,55 +1,163 @@
 import cv2
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional, Sequence
 from collections import Counter
-from sklearn.cluster import KMeans
 from dataclasses import dataclass
+import threading
 import time
-from multiprocessing import Pool, cpu_count
 
 # --- 导入核心模块 ---
-from app.utils.vision.templates_manager import TemplatesManager
+from app.utils.vision.templates_manager import TemplatesManager, TemplateBank
+from app.services.shared_frame import LocalFrameBuffer, SharedFrameBuffer
+from app.services.executor import ExecutorConfig, FrameExecutor, autotune
+from app.services.board_lattice import BoardLattice, BoardNode
+from app.services.node_classifier import GemmNodeClassifier
+from app.services.metrics import StageMetrics
+from app.services.region_finder import regions_agree, regions_from_labels, regions_from_points
+from app.services.region_pruning import DEFAULT_REGION_ORIENTATIONS, RegionTemplateTable
+from app.utils.vision.matching import (Candidates, PyramidConfig, build_pyramid, effective_levels,
+                                      extract_peaks, peak_radius, pyramid_match)
+from app.utils.vision.utils import non_max_suppression_arrays
+from app.utils.vision.segmentation import ColorSegmenter, ColorSegmentation, blob_search_window, find_blobs, merge_windows
 
 # ==============================================================================
 # --- 并行处理工作函数 (V33 - 稳定并行版) ---
 # ==============================================================================
 
-def _parallel_worker(args: Tuple) -> List[Dict]:
+def _init_worker(bank: TemplateBank, color_ranges: Dict, frames: Any) -> Dict[str, Any]:
+    """
+    构建常驻工作者状态，之后每个任务只读 (模板金字塔缓存除外)。
+    frames 为共享内存名 (进程后端) 或进程内的帧缓冲对象 (线程/内联后端)；
+    状态由执行器持有并传给每个任务，同一进程内的多个 GameAnalyzer 互不干扰。
+    """
+    return {
+        'bank': bank,
+        'color_ranges': color_ranges,
+        'frames': SharedFrameBuffer(name=frames) if isinstance(frames, str) else frames,
+        'template_pyramids': {},
+    }
+
+def _parallel_worker(state: Dict[str, Any], task: Tuple) -> Tuple[Candidates, Dict[str, int], Optional[Dict[str, Any]]]:
+    """
+    执行器任务入口。任务只携带 (帧序号, 颜色, 阈值, 金字塔参数, 是否计时, 模板搜索范围, 模板子集)，
+    截图从帧缓冲零拷贝读取，模板库为工作者常驻状态。
+    """
+    seq, color_name, threshold, pyramid, instrument, rois, subset = task
+    image = state['frames'].read(seq)
+    timings = {} if instrument else None
+    candidates, stats = _match_color(image, state['bank'], color_name, state['color_ranges'], threshold,
+                                     pyramid, state['template_pyramids'], timings, rois, subset)
+    return candidates, stats, timings
+
+def _parallel_node_worker(state: Dict[str, Any], task: Tuple) -> List[Tuple[int, int, int, int, float]]:
+    """节点局部匹配的任务入口，任务为 (帧序号, 颜色, 节点搜索窗口, 节点允许的模板)"""
+    seq, color_name, windows, allowed = task
+    image = state['frames'].read(seq)
+    return _match_color_nodes(image, state['bank'], color_name, state['color_ranges'], windows, allowed)
+
+def _match_color(image: np.ndarray, bank: TemplateBank, color_name: str, color_ranges: Dict, threshold: float,
+                 pyramid: Optional[PyramidConfig] = None, template_pyramids: Optional[Dict] = None,
+                 timings: Optional[Dict[str, Any]] = None,
+                 rois: Optional[Dict[int, Optional[Tuple[int, int, int, int]]]] = None,
+                 subset: Optional[Sequence[int]] = None) -> Tuple[Candidates, Dict[str, int]]:
     """
     为单个颜色执行颜色掩膜和模板匹配的工作函数。
+    模板已在加载时预编译进 TemplateBank，这里只读取，不再逐帧处理模板。
+    提供 pyramid 时走由粗到精匹配，模板金字塔缓存在 template_pyramids 中跨帧复用。
+    提供 timings 字典时写入各阶段耗时 (秒): hsv / mask / match 以及 templates {模板索引: 耗时}。
+    提供 rois 时每个模板只在其允许分区的外接矩形内搜索，值为 None 的模板直接跳过。
+    提供 subset 时只匹配其中的模板 (任务粒度细于颜色时使用)。
     """
-    image, templates, color_name, color_ranges, threshold = args
-    results = []
+    parts: List[Candidates] = []
+    stats = {"full_evaluations": 0, "verified_evaluations": 0, "coarse_candidates": 0}
+    if color_name not in color_ranges: return Candidates.empty(), stats
+    clock = time.perf_counter if timings is not None else None
+
+    if clock: t0 = clock()
     hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    
-    if color_name not in color_ranges: return []
-    
+    if clock: t1 = clock()
     lower = np.array(color_ranges[color_name]['lower'])
     upper = np.array(color_ranges[color_name]['upper'])
     mask = cv2.inRange(hsv_image, lower, upper)
     masked_image = cv2.bitwise_and(image, image, mask=mask)
     gray_masked_image = cv2.cvtColor(masked_image, cv2.COLOR_BGR2GRAY)
+    full_roi = (0, 0, gray_masked_image.shape[1], gray_masked_image.shape[0])
+    views: Dict[Tuple[int, int, int, int], Tuple[np.ndarray, Optional[List[np.ndarray]]]] = {}
+    if template_pyramids is None: template_pyramids = {}
+    if clock:
+        t2 = clock()
+        timings.update(hsv=t1 - t0, mask=t2 - t1, templates={})
+
+    indices = bank.indices_for_color(color_name)
+    if subset is not None: indices = np.intersect1d(indices, subset)
+    for index in indices:
+        roi = rois.get(int(index), full_roi) if rois is not None else full_roi
+        if roi is None: continue
+        if roi not in views:
+            x1, y1, x2, y2 = roi
+            view = gray_masked_image[y1:y2, x1:x2]
+            views[roi] = (view, build_pyramid(view, pyramid.levels) if pyramid else None)
+        view, image_pyramid = views[roi]
+        ox, oy = roi[0], roi[1]
+        h, w = bank.shapes[index]
+        if h > view.shape[0] or w > view.shape[1]: continue
+        if clock: t_start = clock()
+
+        if pyramid:
+            levels = effective_levels((h, w), pyramid.levels)
+            key = (int(index), levels)
+            if key not in template_pyramids: template_pyramids[key] = build_pyramid(bank.template(index), levels)
+            matches, match_stats = pyramid_match(image_pyramid[:levels + 1], template_pyramids[key], threshold, pyramid)
+            for name, value in match_stats.items(): stats[name] += value
+            if matches:
+                xs, ys, scores = zip(*matches)
+                parts.append(Candidates.of(int(index), np.add(xs, ox), np.add(ys, oy), scores))
+        else:
+            match_result = cv2.matchTemplate(view, bank.template(index), cv2.TM_CCOEFF_NORMED)
+            evaluations = match_result.size
+            stats["full_evaluations"] += evaluations; stats["verified_evaluations"] += evaluations
+            xs, ys, scores = extract_peaks(match_result, threshold, peak_radius((h, w)))
+            parts.append(Candidates.of(int(index), xs + ox, ys + oy, scores))
+        if clock: timings['templates'][int(index)] = clock() - t_start
 
-    for template in templates:
-        hsv_template = cv2.cvtColor(template.image, cv2.COLOR_BGR2HSV)
-        template_mask = cv2.inRange(hsv_template, lower, upper)
-        masked_template = cv2.bitwise_and(template.image, template.image, mask=template_mask)
-        gray_masked_template = cv2.cvtColor(masked_template, cv2.COLOR_BGR2GRAY)
-
-        if gray_masked_template.shape[0] > gray_masked_image.shape[0] or \
-           gray_masked_template.shape[1] > gray_masked_image.shape[1] or \
-           np.sum(gray_masked_template) == 0:
-            continue
-            
-        match_result = cv2.matchTemplate(gray_masked_image, gray_masked_template, cv2.TM_CCOEFF_NORMED)
-        locs = np.where(match_result >= threshold)
-        for pt in zip(*locs[::-1]):
-            results.append({
-                'template': template,
-                'location': pt,
-                'confidence': match_result[pt[1], pt[0]]
-            })
+    if clock: timings['match'] = clock() - t2
+    return Candidates.concat(parts), stats
+
+def _match_color_nodes(image: np.ndarray, bank: TemplateBank, color_name: str, color_ranges: Dict, windows: np.ndarray,
+                       allowed: Optional[np.ndarray] = None) -> List[Tuple[int, int, int, int, float]]:
+    """
+    节点局部匹配：只在每个节点的搜索窗口内为该颜色的模板打分。
+    每个节点最多返回一个最佳候选 (节点序号, 模板索引, x, y, 置信度)，坐标为整图坐标。
+    allowed 为 (节点数, 模板数) 的 bool 矩阵时，只匹配节点所在分区允许的模板。
+    """
+    if color_name not in color_ranges: return []
+    indices = bank.indices_for_color(color_name)
+    if len(indices) == 0: return []
+
+    lower = np.array(color_ranges[color_name]['lower'])
+    upper = np.array(color_ranges[color_name]['upper'])
+    # 窗口内该颜色像素过少时直接视为空节点，不做匹配
+    min_pixels = int(np.count_nonzero(bank.masks[indices], axis=(1, 2)).min()) // 4
+
+    results = []
+    for node_index, (x1, y1, x2, y2) in enumerate(windows):
+        node_indices = indices if allowed is None else indices[allowed[node_index, indices]]
+        window = image[y1:y2, x1:x2]
+        if window.size == 0 or len(node_indices) == 0: continue
+        mask = cv2.inRange(cv2.cvtColor(window, cv2.COLOR_BGR2HSV), lower, upper)
+        if cv2.countNonZero(mask) < min_pixels: continue
+        gray_window = cv2.cvtColor(cv2.bitwise_and(window, window, mask=mask), cv2.COLOR_BGR2GRAY)
+        win_h, win_w = gray_window.shape
+
+        best = None
+        for index in node_indices:
+            h, w = bank.shapes[index]
+            if h > win_h or w > win_w: continue
+            _, score, _, loc = cv2.minMaxLoc(cv2.matchTemplate(gray_window, bank.template(index), cv2.TM_CCOEFF_NORMED))
+            if best is None or score > best[4]:
+                best = (node_index, int(index), int(x1) + loc[0], int(y1) + loc[1], float(score))
+        if best is not None: results.append(best)
     return results
 
 # ==============================================================================
@@ -67,103 +175,436 @@ class DetectionResult:
         h, w, _ = self.template.image.shape
         return (x1, y1, x1 + w, y1 + h)
 
+@dataclass
+class NodeMatch:
+    """节点局部匹配的结果：detection 为 None 表示该节点为空"""
+    node: BoardNode
+    detection: Optional[DetectionResult]
+    margin: Optional[float] = None  # 与次优标签的得分差 (仅 gemm 引擎提供)
+
+@dataclass
+class _NodeCache:
+    """增量识别的缓存：上一帧各节点的像素签名与识别结果"""
+    lattice: BoardLattice
+    image_shape: Tuple[int, ...]
+    match_threshold: float
+    signatures: np.ndarray
+    matches: List[NodeMatch]
+    frames_since_refresh: int = 0
+
+# 各玩家棋子颜色的 HSV 范围与棋子中英文名称对照 (各识别引擎共用)
+HSV_COLOR_RANGES = {'blue':{'lower':[100,80,80],'upper':[130,255,255]},'green':{'lower':[35,40,40],'upper':[95,255,255]},'orange':{'lower':[5,150,150],'upper':[20,255,255]},'purple':{'lower':[135,80,80],'upper':[160,255,255]}}
+CN_TO_EN_MAP = {"司令":"commander","军长":"general","师长":"major","旅长":"colonel","团长":"captain","营长":"battalion","连长":"lieutenant","排长":"sergeant","工兵":"miner","地雷":"landmine","炸弹":"bomb","军旗":"flag", "行营":"xingying"}
+
 def standard_non_max_suppression(detections: List[DetectionResult], iou_threshold: float) -> List[DetectionResult]:
+    """对 DetectionResult 列表做 NMS，内部使用向量化实现，结果按置信度降序"""
     if not detections: return []
-    detections.sort(key=lambda x: x.confidence, reverse=True)
-    final_detections = []
-    while detections:
-        best = detections.pop(0)
-        final_detections.append(best)
-        remaining = []
-        for other in detections:
-            x1=max(best.bbox[0],other.bbox[0]); y1=max(best.bbox[1],other.bbox[1])
-            x2=min(best.bbox[2],other.bbox[2]); y2=min(best.bbox[3],other.bbox[3])
-            intersection=max(0,x2-x1)*max(0,y2-y1)
-            area_best=(best.bbox[2]-best.bbox[0])*(best.bbox[3]-best.bbox[1])
-            area_other=(other.bbox[2]-other.bbox[0])*(other.bbox[3]-other.bbox[1])
-            union=area_best+area_other-intersection
-            iou=intersection/union if union>0 else 0
-            if iou<iou_threshold: remaining.append(other)
-        detections=remaining
-    return final_detections
+    boxes = np.array([d.bbox for d in detections])
+    scores = np.array([d.confidence for d in detections])
+    return [detections[i] for i in non_max_suppression_arrays(boxes, scores, iou_threshold)]
+
+def format_report(detections: List[DetectionResult], image_shape: Tuple[int, ...], cn_to_en_map: Optional[Dict[str, str]] = None) -> str:
+    """按玩家方位汇总各颜色棋子数量的文字报告 (各识别引擎共用)"""
+    if not detections: return "未在截图中识别到任何棋子。"
+
+    pieces_by_color: Dict[str, List[DetectionResult]] = {}
+    for det in detections:
+        color = det.template.color
+        if color not in pieces_by_color: pieces_by_color[color] = []
+        pieces_by_color[color].append(det)
+
+    player_locations: Dict[str, str] = {}
+    img_h, img_w = image_shape[:2]
+    for color, dets in pieces_by_color.items():
+        if not dets or color == 'neutral': continue
+        avg_y = np.mean([d.location[1] for d in dets])
+        if avg_y < img_h * 0.45: location = "上方"
+        elif avg_y > img_h * 0.55: location = "下方"
+        else: location = "左侧" if np.mean([d.location[0] for d in dets]) < img_w / 2 else "右侧"
+        player_locations[color] = location
+
+    timestamp = time.strftime("%Y%m%d%H%M-%S")
+    report = [f"=============== [ {timestamp} ] (总棋子数: {len(detections)}个) ==============="]
+    sorted_players = sorted(pieces_by_color.items(), key=lambda i: {"上方":0,"左侧":1,"下方":2,"右侧":3}.get(player_locations.get(i[0]), 99))
+
+    for color, dets in sorted_players:
+        if color == 'neutral': continue
+        location = player_locations.get(color, "未知")
+        report.append(f"【{location}玩家】 ({color.capitalize()})（棋子总数: {len(dets)}）")
+        piece_counts = Counter(d.template.piece_type for d in dets)
+        details = []
+        for piece_cn, piece_en in (cn_to_en_map or CN_TO_EN_MAP).items():
+            if piece_cn == "行营": continue
+            count = piece_counts.get(piece_en, 0)
+            if count > 0: details.append(f"{piece_cn}x{count}")
+        if details: report.append("  " + ", ".join(details))
+        report.append("")
+
+    return "\n".join(report)
 
 class GameAnalyzer:
-    def __init__(self, templates_path: str):
-        self.tm = TemplatesManager(templates_path)
-        self.hsv_color_ranges = {'blue':{'lower':[100,80,80],'upper':[130,255,255]},'green':{'lower':[35,40,40],'upper':[95,255,255]},'orange':{'lower':[5,150,150],'upper':[20,255,255]},'purple':{'lower':[135,80,80],'upper':[160,255,255]}}
-        self.cn_to_en_map = {"司令":"commander","军长":"general","师长":"major","旅长":"colonel","团长":"captain","营长":"battalion","连长":"lieutenant","排长":"sergeant","工兵":"miner","地雷":"landmine","炸弹":"bomb","军旗":"flag", "行营":"xingying"}
+    # 共享帧缓冲的初始容量 (字节)，足够容纳 1920x1080 的 BGR 截图；更大的帧会触发扩容
+    DEFAULT_FRAME_CAPACITY = 1920 * 1080 * 3
+
+    def __init__(self, templates_path: str, executor: Optional[ExecutorConfig] = None):
+        self.hsv_color_ranges = {c: {k: list(v) for k, v in r.items()} for c, r in HSV_COLOR_RANGES.items()}
+        self.tm = TemplatesManager(templates_path, color_ranges=self.hsv_color_ranges)
+        self.bank = self.tm.bank
+        self.piece_colors = [c for c in self.bank.colors if c in self.hsv_color_ranges]
+        self.cn_to_en_map = dict(CN_TO_EN_MAP)
         self.all_piece_types_cn = list(self.cn_to_en_map.keys())[:-1]
-        self.pool = Pool(processes=cpu_count())
-
-    def analyze_screenshot(self, screenshot: np.ndarray, match_threshold: float = 0.8, return_detections: bool = False) -> Any:
-        templates_by_color = {}
-        xingying_template = None
-        for t in self.tm.get_all_templates():
-            if t.piece_type == "xingying":
-                xingying_template = t; continue
-            if t.color not in templates_by_color: templates_by_color[t.color] = []
-            templates_by_color[t.color].append(t)
-        
-        tasks = [(screenshot, templates, color, self.hsv_color_ranges, match_threshold) for color, templates in templates_by_color.items()]
-        results_from_pool = self.pool.map(_parallel_worker, tasks)
-        
-        matches = [DetectionResult(**item) for sublist in results_from_pool for item in sublist]
-        
-        if xingying_template:
-            hsv_image = cv2.cvtColor(screenshot, cv2.COLOR_BGR2HSV)
-            all_color_mask = np.zeros(screenshot.shape[:2], dtype=np.uint8)
-            for color in self.hsv_color_ranges:
-                lower = np.array(self.hsv_color_ranges[color]['lower']); upper = np.array(self.hsv_color_ranges[color]['upper'])
-                all_color_mask = cv2.bitwise_or(all_color_mask, cv2.inRange(hsv_image, lower, upper))
-            neutral_mask = cv2.bitwise_not(all_color_mask)
-            neutral_image = cv2.bitwise_and(screenshot, screenshot, mask=neutral_mask)
-            gray_neutral_image = cv2.cvtColor(neutral_image, cv2.COLOR_BGR2GRAY)
-            gray_template = cv2.cvtColor(xingying_template.image, cv2.COLOR_BGR2GRAY)
-            match_result = cv2.matchTemplate(gray_neutral_image, gray_template, cv2.TM_CCOEFF_NORMED)
-            locs = np.where(match_result >= 0.8)
-            for pt in zip(*locs[::-1]):
-                matches.append(DetectionResult(xingying_template, pt, match_result[pt[1], pt[0]]))
-
-        detections = standard_non_max_suppression(matches, iou_threshold=0.3)
-        if return_detections: return detections
-        if not detections: return "未在截图中识别到任何棋子。"
-
-        pieces_by_color: Dict[str, List[DetectionResult]] = {}
-        for det in detections:
-            color = det.template.color
-            if color not in pieces_by_color: pieces_by_color[color] = []
-            pieces_by_color[color].append(det)
-            
-        player_locations: Dict[str, str] = {}
-        img_h, img_w, _ = screenshot.shape
-        for color, dets in pieces_by_color.items():
-            if not dets or color == 'neutral': continue
-            avg_y = np.mean([d.location[1] for d in dets])
-            if avg_y < img_h * 0.45: location = "上方"
-            elif avg_y > img_h * 0.55: location = "下方"
-            else: location = "左侧" if np.mean([d.location[0] for d in dets]) < img_w / 2 else "右侧"
-            player_locations[color] = location
-
-        timestamp = time.strftime("%Y%m%d%H%M-%S")
-        report = [f"=============== [ {timestamp} ] (总棋子数: {len(detections)}个) ==============="]
-        sorted_players = sorted(pieces_by_color.items(), key=lambda i: {"上方":0,"左侧":1,"下方":2,"右侧":3}.get(player_locations.get(i[0]), 99))
-
-        for color, dets in sorted_players:
-            if color == 'neutral': continue
-            location = player_locations.get(color, "未知")
-            report.append(f"【{location}玩家】 ({color.capitalize()})（棋子总数: {len(dets)}）")
-            piece_counts = Counter(d.template.piece_type for d in dets)
-            details = []
-            for piece_cn in self.all_piece_types_cn:
-                piece_en = self.cn_to_en_map[piece_cn]
-                count = piece_counts.get(piece_en, 0)
-                if count > 0: details.append(f"{piece_cn}x{count}")
-            if details: report.append("  " + ", ".join(details))
-            report.append("")
-
-        return "\n".join(report)
-
-    def get_player_regions(self, screenshot: np.ndarray, match_threshold: float = 0.7) -> Dict[str, Tuple[int, int, int, int]]:
+        self.match_mode = "full"  # "full": 整图匹配 + NMS; "nodes": 节点局部匹配; "blobs": 先定位色块再匹配
+        self.node_margin = 4      # 节点搜索窗口向外扩展的抖动余量 (像素)，节点与棋子中心的偏差约 3 像素
+        self.node_engine = "match"  # 节点分类引擎: "match" 逐窗口 matchTemplate; "gemm" 批量矩阵乘法
+        self._gemm_classifier: Optional[GemmNodeClassifier] = None
+        self.pyramid: Optional[PyramidConfig] = None  # 设置后整图匹配走由粗到精的金字塔模式
+        # 节点签名 (16x16 BGR) 任一元素的绝对差超过该值即视为变化。在仓库截图的两两组合上，
+        # 标签真正变化的节点最小差值为 89；无损截图噪声不超过 10，JPEG 质量 75 的回放帧不超过 64
+        self.dirty_tolerance = 72
+        self.full_refresh_interval = 30  # 增量模式下每隔多少帧强制全量重识别一次
+        self.last_dirty_count = 0
+        self.segmenter = ColorSegmenter(self.hsv_color_ranges)
+        self.blob_padding = 4  # 色块匹配窗口向外扩展的像素数
+        # 色块面积下限：该颜色模板掩膜像素数最小值的四分之一 (与节点匹配的空节点判断一致)
+        self._blob_min_area = {c: int(np.count_nonzero(self.bank.masks[idx], axis=(1, 2)).min()) // 4
+                               for c in self.piece_colors for idx in [self.bank.indices_for_color(c)] if len(idx)}
+        colored_shapes = self.bank.shapes[np.isin(self.bank.color_ids, [self.bank.colors.index(c) for c in self.piece_colors]) & self.bank.non_empty]
+        self._piece_size = (int(np.median(colored_shapes.min(axis=1))), int(np.median(colored_shapes.max(axis=1))))  # 棋子 (短边, 长边)
+        self.labels_tolerance = 8  # labels 法求得的分区与锁定分区的边界相差超过该值 (像素) 即不采用
+        self.metrics = StageMetrics(enabled=False)
+        self._node_cache: Optional[_NodeCache] = None
+        self.prune_by_region = True  # 按分区允许的方向/颜色裁剪模板
+        self.region_orientations: Dict[str, Tuple[str, ...]] = dict(DEFAULT_REGION_ORIENTATIONS)
+        self.region_colors: Dict[str, str] = {}  # 可选: 分区 -> 只匹配的颜色 (调用方保证分区内没有其他颜色)
+        self.region_table: Optional[RegionTemplateTable] = None
+        self.last_match_stats: Dict[str, int] = {}  # 最近一次识别的匹配统计；每个 analyze* 入口先清空，字段随模式不同
+        self.lattice: Optional[BoardLattice] = None
+        self.executor_config = executor or ExecutorConfig()
+        self.executor: Optional[FrameExecutor] = None
+        self.frame_buffer = None
+        # 帧缓冲只保存一帧：同一实例被多个线程调用时，发布帧到取回结果之间须串行
+        self._frame_lock = threading.Lock()
+
+    def _start_executor(self, frame_capacity: int) -> None:
+        """创建帧缓冲与执行器；进程后端使用共享内存，线程/内联后端直接在进程内传递截图"""
+        self._stop_executor()
+        self.executor = FrameExecutor(self.executor_config, _init_worker)
+        self.frame_buffer = LocalFrameBuffer() if self.executor.shares_memory else SharedFrameBuffer(capacity=frame_capacity)
+        frames = self.frame_buffer if self.executor.shares_memory else self.frame_buffer.name
+        self.executor.initargs = (self.bank, self.hsv_color_ranges, frames)
+
+    def _stop_executor(self) -> None:
+        if getattr(self, 'executor', None) is not None:
+            self.executor.close()
+            self.executor = None
+        if getattr(self, 'frame_buffer', None) is not None:
+            self.frame_buffer.close()
+            self.frame_buffer = None
+
+    def _publish_frame(self, screenshot: np.ndarray) -> int:
+        """把截图写入帧缓冲并返回帧序号；执行器在首帧时才创建，共享内存容量不足时扩容并重建"""
+        if self.executor is None:
+            self._start_executor(max(self.DEFAULT_FRAME_CAPACITY, screenshot.nbytes))
+        elif screenshot.nbytes > self.frame_buffer.capacity:
+            self._start_executor(screenshot.nbytes)
+        return self.frame_buffer.write(screenshot)
+
+    def set_executor(self, config: ExecutorConfig) -> None:
+        """切换执行后端；新的执行器在下一帧时创建"""
+        with self._frame_lock:
+            self._stop_executor()
+            self.executor_config = config
+
+    def autotune_executor(self, frames: List[np.ndarray], mode: Optional[str] = None, match_threshold: float = 0.8,
+                          repeat: int = 5, configs: Optional[List[ExecutorConfig]] = None) -> Tuple[ExecutorConfig, List[Dict]]:
+        """在给定截图上逐个试跑候选执行配置，保留最快的一个并返回 (最佳配置, 全部测量结果)"""
+        if not frames: raise ValueError("自动调优至少需要一张截图")
+        position = [0]
+        def run_frame():
+            frame = frames[position[0] % len(frames)]; position[0] += 1
+            self._node_cache = None
+            self.analyze_screenshot(frame, match_threshold, return_detections=True, mode=mode)
+        return autotune(self.set_executor, run_frame, configs, repeat=repeat)
+
+    def _task_chunks(self, n_items: int, n_groups: int) -> int:
+        """每组 (如每种颜色) 应切成几份，使每帧任务数接近执行器建议的任务数"""
+        slots = self.executor.task_slots if self.executor is not None else 1
+        return max(1, min(n_items, -(-slots // max(1, n_groups))))
+
+    def enable_metrics(self, enabled: bool = True, dump_path: Optional[str] = None, dump_interval: float = 10.0) -> None:
+        """开启/关闭分阶段计时；dump_path 不为空时定期把 stats() 写入该 JSON 文件"""
+        self.metrics = StageMetrics(enabled=enabled, dump_path=dump_path, dump_interval=dump_interval)
+
+    def stats(self) -> Dict[str, Dict]:
+        """滚动窗口内各阶段耗时 (毫秒) 与每帧计数的分位数摘要"""
+        return self.metrics.stats()
+
+    def set_locked_regions(self, locked_regions: Optional[Dict[str, Tuple[int, int, int, int]]]) -> None:
+        """设置锁定分区并生成理论节点网格，供节点局部匹配使用"""
+        self.lattice = BoardLattice(locked_regions) if locked_regions else None
+        self._node_cache = None
+        self._rebuild_region_table()
+
+    def configure_region_pruning(self, enabled: bool = True, region_orientations: Optional[Dict[str, Sequence[str]]] = None,
+                                 region_colors: Optional[Dict[str, str]] = None) -> None:
+        """
+        配置按分区裁剪模板：region_orientations 替换默认的分区→方向表，
+        region_colors 设置分区→颜色，分区内只匹配该颜色的模板；只在确知分区内没有别家棋子时使用 (传入 {} 可清除)。
+        """
+        self.prune_by_region = enabled
+        if region_orientations is not None: self.region_orientations = {k: tuple(v) for k, v in region_orientations.items()}
+        if region_colors is not None: self.region_colors = dict(region_colors)
+        self._node_cache = None
+        self._rebuild_region_table()
+
+    def _rebuild_region_table(self) -> None:
+        if self.lattice is None or not self.prune_by_region:
+            self.region_table = None; return
+        self.region_table = RegionTemplateTable(self.bank, self.lattice.locked_regions, self.region_orientations,
+                                                self.region_colors, self.piece_colors)
+
+    def analyze_screenshot(self, screenshot: np.ndarray, match_threshold: float = 0.8, return_detections: bool = False,
+                           mode: Optional[str] = None, origin: Tuple[int, int] = (0, 0)) -> Any:
+        """
+        screenshot 是从窗口 origin=(x, y) 处裁剪出的子图时 (如只截棋盘 ROI)，锁定分区按该偏移换算到子图坐标；
+        节点类模式的理论节点即窗口坐标，只接受整幅窗口截图。
+        """
+        mode = mode or self.match_mode
+        origin = (int(origin[0]), int(origin[1]))
+        metrics = self.metrics
+        self.last_match_stats = {}
+        with metrics.timer("frame_total"):
+            if mode in ("nodes", "incremental", "gemm"):
+                if origin != (0, 0): raise ValueError(f"节点类模式 ({mode}) 需要整幅窗口截图，不支持裁剪偏移 {origin}")
+                with metrics.timer(f"nodes.{mode}"):
+                    if mode == "incremental": node_matches = self.analyze_nodes_incremental(screenshot, match_threshold)
+                    else: node_matches = self.analyze_nodes(screenshot, match_threshold, engine="gemm" if mode == "gemm" else None)
+                detections = [m.detection for m in node_matches if m.detection is not None]
+            elif mode == "blobs":
+                detections = self._detect_blobs(screenshot, match_threshold, origin)
+            else:
+                detections = self._detect_full(screenshot, match_threshold, origin)
+            metrics.count("detections", len(detections))
+            if return_detections:
+                result = detections
+            else:
+                with metrics.timer("report"): result = self._format_report(detections, screenshot.shape)
+        metrics.end_frame()
+        return result
+
+    def analyze_nodes(self, screenshot: np.ndarray, match_threshold: float = 0.8, margin: Optional[int] = None,
+                      node_indices: Optional[np.ndarray] = None, engine: Optional[str] = None) -> List[NodeMatch]:
+        """
+        节点局部匹配：每个理论节点只在 (格子 + margin) 的窗口内匹配模板，无需 NMS。
+        默认返回与 lattice.nodes 一一对应的结果；给定 node_indices 时只识别这些节点，结果按其顺序返回。
+        engine 为 "gemm" 时改用批量矩阵乘法分类器 (抖动偏移代替 margin 窗口)。
+        """
+        if self.lattice is None: raise RuntimeError("尚未设置锁定分区，无法进行节点局部匹配。")
+        margin = self.node_margin if margin is None else margin
+        if node_indices is None: node_indices = np.arange(len(self.lattice))
+        self.last_match_stats = {"nodes": len(node_indices)}
+        if len(node_indices) == 0: return []
+        if (engine or self.node_engine) == "gemm":
+            return self._classify_nodes_gemm(screenshot, match_threshold, node_indices)
+        windows = self.lattice.search_windows(self.bank.gray.shape[1:], margin, screenshot.shape)[node_indices]
+        allowed = self.region_table.node_mask(self.lattice, node_indices) if self.region_table is not None else None
+        with self._frame_lock:
+            seq = self._publish_frame(screenshot)
+            n_chunks = self._task_chunks(len(windows), len(self.piece_colors))
+            starts = [int(c[0]) for c in np.array_split(np.arange(len(windows)), n_chunks) if len(c)]
+            bounds = list(zip(starts, starts[1:] + [len(windows)]))
+            tasks = [(seq, color, windows[a:b], allowed[a:b] if allowed is not None else None)
+                     for color in self.piece_colors for a, b in bounds]
+            with self.metrics.timer("pool_roundtrip"): results_from_pool = self.executor.map(_parallel_node_worker, tasks)
+        offsets = [a for _ in self.piece_colors for a, _ in bounds]
+        self.last_match_stats["tasks"] = len(tasks)
+
+        best: Dict[int, DetectionResult] = {}
+        for offset, sublist in zip(offsets, results_from_pool):
+            for chunk_index, template_index, x, y, score in sublist:
+                local_index = offset + chunk_index
+                if score < match_threshold: continue
+                if local_index not in best or score > best[local_index].confidence:
+                    best[local_index] = DetectionResult(self.tm.bank_templates[template_index], (x, y), score)
+        return [NodeMatch(self.lattice.nodes[node_index], best.get(i)) for i, node_index in enumerate(node_indices)]
+
+    def _classify_nodes_gemm(self, screenshot: np.ndarray, match_threshold: float, node_indices: np.ndarray) -> List[NodeMatch]:
+        if self._gemm_classifier is None:
+            self._gemm_classifier = GemmNodeClassifier(self.bank, self.hsv_color_ranges, atlas=self.tm.atlas)
+        results = []
+        allowed = self.region_table.node_mask(self.lattice, node_indices) if self.region_table is not None else None
+        for score in self._gemm_classifier.classify(screenshot, self.lattice, match_threshold, node_indices, allowed):
+            detection = None
+            if score.template_index >= 0:
+                detection = DetectionResult(self.tm.bank_templates[score.template_index], score.location, score.score)
+            results.append(NodeMatch(self.lattice.nodes[score.node_index], detection, score.margin))
+        return results
+
+    def analyze_nodes_incremental(self, screenshot: np.ndarray, match_threshold: float = 0.8) -> List[NodeMatch]:
+        """
+        增量节点识别 (连续识别用)：与上一帧比较各节点格子的像素签名，
+        只重新识别发生变化的节点并合并进缓存结果；每 full_refresh_interval 帧强制全量刷新一次。
+        """
+        if self.lattice is None: raise RuntimeError("尚未设置锁定分区，无法进行节点局部匹配。")
+        self.last_match_stats = {}
+        signatures = self.lattice.cell_signatures(screenshot)
+        cache = self._node_cache
+        if cache is None or cache.lattice is not self.lattice or cache.image_shape != screenshot.shape \
+                or cache.match_threshold != match_threshold or cache.frames_since_refresh >= self.full_refresh_interval:
+            matches = self.analyze_nodes(screenshot, match_threshold)
+            self._node_cache = _NodeCache(self.lattice, screenshot.shape, match_threshold, signatures, matches)
+            self.last_dirty_count = len(matches)
+            self.last_match_stats.update(dirty_nodes=len(matches), full_refresh=1)
+            return list(matches)
+
+        diff = np.abs(signatures - cache.signatures).max(axis=1)
+        dirty = np.flatnonzero(diff > self.dirty_tolerance)
+        for match in self.analyze_nodes(screenshot, match_threshold, node_indices=dirty):
+            cache.matches[match.node.index] = match
+        cache.signatures[dirty] = signatures[dirty]
+        cache.frames_since_refresh += 1
+        self.last_dirty_count = len(dirty)
+        self.last_match_stats.update(dirty_nodes=len(dirty), full_refresh=0)
+        self.metrics.count("dirty_nodes", len(dirty))
+        return list(cache.matches)
+
+    def _detect_full(self, screenshot: np.ndarray, match_threshold: float, origin: Tuple[int, int] = (0, 0)) -> List[DetectionResult]:
+        """整图匹配：逐颜色对全图做模板匹配，再经 NMS 去重"""
+        metrics = self.metrics
+        rois = self.region_table.template_rois(screenshot.shape, self.node_margin, origin) if self.region_table is not None else None
+        with self._frame_lock:
+            seq = self._publish_frame(screenshot)
+            tasks, task_colors = [], []
+            for color in self.piece_colors:
+                indices = self.bank.indices_for_color(color)
+                n_chunks = self._task_chunks(len(indices), len(self.piece_colors))
+                for chunk in (np.array_split(indices, n_chunks) if n_chunks > 1 else [None]):
+                    tasks.append((seq, color, match_threshold, self.pyramid, metrics.enabled, rois, chunk)); task_colors.append(color)
+            with metrics.timer("pool_roundtrip"): results_from_pool = self.executor.map(_parallel_worker, tasks)
+
+        candidates = [worker_candidates for worker_candidates, _, _ in results_from_pool]
+        stats = Counter()
+        for _, worker_stats, _ in results_from_pool: stats.update(worker_stats)
+        stats["saved_evaluations"] = stats["full_evaluations"] - stats["verified_evaluations"]
+        self.last_match_stats = dict(stats)
+        if metrics.enabled: self._record_worker_timings(task_colors, results_from_pool)
+
+        xingying_indices = self.bank.indices_for_piece("xingying")
+        if len(xingying_indices) > 0:
+            with metrics.timer("xingying"): candidates.append(self._match_xingying(screenshot, int(xingying_indices[0])))
+
+        raw = self._prune_candidates(Candidates.concat(candidates), origin)
+        metrics.count("raw_candidates", raw.size)
+        with metrics.timer("nms"): return self._suppress(raw, iou_threshold=0.3)
+
+    def _detect_blobs(self, screenshot: np.ndarray, match_threshold: float, origin: Tuple[int, int] = (0, 0)) -> List[DetectionResult]:
+        """
+        色块优先定位：一次生成颜色标签图，提取棋子大小的连通块，
+        同色色块的外扩窗口合并为少数几个 ROI，每个模板在每个 ROI 内只匹配一次，
+        匹配面积随棋子覆盖的范围而不是整幅图像增长。
+        """
+        metrics = self.metrics
+        with metrics.timer("segment"):
+            segmentation = self.segmenter.segment(screenshot)
+            gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        with metrics.timer("blobs"):
+            min_size = int(self.bank.shapes[self.bank.non_empty].min()) // 2
+            blobs = find_blobs(segmentation, self._blob_min_area, min_size)
+            if self.region_table is not None:
+                # 分区已锁定时棋子中心只会落在分区内 (边界即边缘棋子的中心)，分区外的同色界面元素不参与匹配
+                centers = np.array([((b.bbox[0] + b.bbox[2]) // 2, (b.bbox[1] + b.bbox[3]) // 2) for b in blobs]).reshape(-1, 2)
+                inside = self.region_table.region_of(centers[:, 0] + origin[0], centers[:, 1] + origin[1], self.node_margin) >= 0
+                blobs = [b for b, keep in zip(blobs, inside) if keep]
+        metrics.count("blob_count", len(blobs))
+
+        parts: List[Candidates] = []
+        evaluations = n_rois = 0
+        box_size = tuple(int(v) for v in self.bank.gray.shape[1:])
+        rois = self.region_table.template_rois(screenshot.shape, self.node_margin, origin) if self.region_table is not None else {}
+        with metrics.timer("match"):
+            for color in self.piece_colors:
+                windows = [blob_search_window(b.bbox, box_size, self.blob_padding, screenshot.shape) for b in blobs if b.color == color]
+                if not windows: continue
+                code = segmentation.code(color)
+                for wx1, wy1, wx2, wy2 in merge_windows(windows):
+                    n_rois += 1
+                    window = np.where(segmentation.labels[wy1:wy2, wx1:wx2] == code, gray[wy1:wy2, wx1:wx2], 0).astype(np.uint8)
+                    for index in self.bank.indices_for_color(color):
+                        # 与整图模式相同的分区搜索范围再与色块 ROI 取交集，搜索面积不会超过整图模式
+                        roi = rois.get(int(index), (wx1, wy1, wx2, wy2))
+                        if roi is None: continue
+                        x1, y1, x2, y2 = max(wx1, roi[0]), max(wy1, roi[1]), min(wx2, roi[2]), min(wy2, roi[3])
+                        h, w = self.bank.shapes[index]
+                        if h > y2 - y1 or w > x2 - x1: continue
+                        view = window[y1 - wy1:y2 - wy1, x1 - wx1:x2 - wx1]
+                        result = cv2.matchTemplate(view, self.bank.template(index), cv2.TM_CCOEFF_NORMED)
+                        evaluations += int(result.size)
+                        xs, ys, scores = extract_peaks(result, match_threshold, peak_radius((h, w)), top_k=64)
+                        parts.append(Candidates.of(int(index), xs + x1, ys + y1, scores))
+        self.last_match_stats = {"blobs": len(blobs), "rois": n_rois, "verified_evaluations": evaluations}
+
+        xingying_indices = self.bank.indices_for_piece("xingying")
+        if len(xingying_indices) > 0:
+            with metrics.timer("xingying"): parts.append(self._match_xingying(screenshot, int(xingying_indices[0]), segmentation, gray))
+
+        raw = self._prune_candidates(Candidates.concat(parts), origin)
+        metrics.count("raw_candidates", raw.size)
+        with metrics.timer("nms"): return self._suppress(raw, iou_threshold=0.3)
+
+    def _match_xingying(self, screenshot: np.ndarray, xingying_index: int,
+                        segmentation: Optional[ColorSegmentation] = None, gray: Optional[np.ndarray] = None) -> Candidates:
+        """行营为中性色，在去除所有棋子颜色后的灰度图上单独匹配；可复用本帧已有的颜色标签图"""
+        if segmentation is None: segmentation = self.segmenter.segment(screenshot)
+        if gray is None: gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        gray_neutral_image = cv2.bitwise_and(gray, gray, mask=segmentation.neutral_mask())
+        match_result = cv2.matchTemplate(gray_neutral_image, self.bank.template(xingying_index), cv2.TM_CCOEFF_NORMED)
+        # 行营数量固定 (每方 5 个)，按 4 方上限保留峰值
+        xs, ys, scores = extract_peaks(match_result, 0.8, peak_radius(self.bank.shapes[xingying_index]), top_k=20)
+        return Candidates.of(xingying_index, xs, ys, scores)
+
+    def _record_worker_timings(self, task_colors: List[str], results_from_pool: List[Tuple]) -> None:
+        """汇总工作者回传的耗时：HSV/掩膜按帧求和，匹配按颜色与模板分别记录"""
+        hsv = mask = 0.0
+        match = Counter()
+        for color, (_, _, timings) in zip(task_colors, results_from_pool):
+            if not timings: continue
+            hsv += timings.get('hsv', 0.0); mask += timings.get('mask', 0.0)
+            match[color] += timings.get('match', 0.0)
+            for index, seconds in timings.get('templates', {}).items():
+                self.metrics.record(f"template.{self.bank.names[index]}", seconds)
+        for color, seconds in match.items(): self.metrics.record(f"match.{color}", seconds)
+        self.metrics.record("hsv", hsv)
+        self.metrics.record("mask", mask)
+
+    def _prune_candidates(self, candidates: Candidates, origin: Tuple[int, int] = (0, 0)) -> Candidates:
+        """外接矩形内可能混入相邻分区，按候选中心所在分区再筛一次；origin 为子图在窗口中的偏移"""
+        if self.region_table is None or candidates.size == 0: return candidates
+        hw = self.bank.shapes[candidates.template_index]
+        keep = self.region_table.keep_candidates(candidates.template_index, candidates.x + hw[:, 1] // 2 + origin[0],
+                                                 candidates.y + hw[:, 0] // 2 + origin[1])
+        return candidates.take(np.flatnonzero(keep))
+
+    def _suppress(self, candidates: Candidates, iou_threshold: float) -> List[DetectionResult]:
+        """在数组上完成 NMS，只为保留下来的候选构造 DetectionResult"""
+        keep = non_max_suppression_arrays(candidates.boxes(self.bank.shapes), candidates.score, iou_threshold)
+        kept = candidates.take(keep)
+        return [DetectionResult(self.tm.bank_templates[t], (int(x), int(y)), float(score))
+                for t, x, y, score in zip(kept.template_index, kept.x, kept.y, kept.score)]
+
+    def _format_report(self, detections: List[DetectionResult], image_shape: Tuple[int, ...]) -> str:
+        return format_report(detections, image_shape, self.cn_to_en_map)
+
+    def get_player_regions(self, screenshot: np.ndarray, match_threshold: float = 0.7, method: str = "detections") -> Dict[str, Tuple[int, int, int, int]]:
+        """
+        求上方/下方/左侧/右侧/中央五个分区的边界 (棋子中心的范围)。
+        method="detections": 由模板匹配得到的棋子中心求 (与旧版聚类结果一致的口径)；
+        method="labels": 已锁定分区时先在其附近由颜色标签图求，不做模板匹配，耗时仅数毫秒；
+        结果与锁定分区相差超过 labels_tolerance 或不完整时不采用，退回 detections。
+        """
+        if method == "labels" and self.lattice is not None:
+            reference = self.lattice.locked_regions
+            regions = regions_from_labels(self.segmenter.segment(screenshot), reference, self._piece_size, self.labels_tolerance)
+            if regions_agree(regions, reference, self.labels_tolerance): return regions
         detections = self.analyze_screenshot(screenshot, match_threshold, return_detections=True)
         img_h, img_w, _ = screenshot.shape
         return self._get_regions_from_clusters(detections, img_w, img_h)
@@ -171,24 +612,10 @@ class GameAnalyzer:
     def _get_regions_from_clusters(self, detections: List[DetectionResult], img_w: int, img_h: int) -> Dict[str, Tuple[int, int, int, int]]:
         if len(detections) < 4: return {}
         points = np.array([((d.bbox[0]+d.bbox[2])/2, (d.bbox[1]+d.bbox[3])/2) for d in detections if d.template.color != 'neutral'])
-        if len(points) < 4: return {}
-        kmeans = KMeans(n_clusters=4, random_state=0, n_init=10).fit(points)
-        centers = kmeans.cluster_centers_
-        img_cx, img_cy = img_w/2, img_h/2
-        label_map = {}
-        for i, (cx,cy) in enumerate(centers):
-            if abs(cx-img_cx) > abs(cy-img_cy): label_map[i] = "左侧" if cx < img_cx else "右侧"
-            else: label_map[i] = "上方" if cy < img_cy else "下方"
-        bounds = {}
-        for i in range(4):
-            pts = points[kmeans.labels_ == i]
-            if len(pts) > 0:
-                min_x, min_y = np.min(pts, axis=0); max_x, max_y = np.max(pts, axis=0)
-                bounds[label_map[i]] = (int(min_x), int(min_y), int(max_x), int(max_y))
-        if all(k in bounds for k in ["上方","下方","左侧","右侧"]):
-            bounds["中央"] = (bounds["左侧"][2], bounds["上方"][3], bounds["右侧"][0], bounds["下方"][1])
-        return bounds
+        return regions_from_points(points)
     
+    def close(self) -> None:
+        self._stop_executor()
+
     def __del__(self):
-        self.pool.close()
-        self.pool.join()
+        self.close()
@@ -0,0 +1,115 @@
+"""
+分阶段计时与计数模块
+GameAnalyzer 用它记录每帧各阶段耗时与候选数量，数据保存在固定长度的滚动窗口中，
+可通过 stats() 查询、定期写入指标文件或在界面面板中显示。关闭时 timer() 返回共享的空上下文，开销接近于零。
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+
+class RollingHistogram:
+    """固定容量的环形样本窗口，按需计算分位数"""
+
+    def __init__(self, size: int = 512):
+        self._values = np.zeros(size, dtype=np.float64)
+        self._count = 0
+
+    def add(self, value: float) -> None:
+        self._values[self._count % len(self._values)] = value
+        self._count += 1
+
+    def summary(self, scale: float = 1.0) -> Dict[str, float]:
+        n = min(self._count, len(self._values))
+        if n == 0: return {"count": 0}
+        values = self._values[:n] * scale
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {"count": self._count, "mean": float(values.mean()), "p50": float(p50),
+                "p95": float(p95), "p99": float(p99), "max": float(values.max()), "last": float(self._values[(self._count - 1) % len(self._values)] * scale)}
+
+
+class _NullTimer:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_TIMER = _NullTimer()
+
+
+class StageMetrics:
+    """
+    - timer(stage): 计时上下文；record(stage, seconds): 直接记录已测得的耗时
+    - count(name, n): 记录每帧计数 (如原始候选数)，同样进入滚动窗口
+    - 设置 dump_path 后，每隔 dump_interval 秒把 stats() 写入 JSON 文件
+    """
+
+    def __init__(self, enabled: bool = False, window: int = 512,
+                 dump_path: Optional[str] = None, dump_interval: float = 10.0):
+        self.enabled = enabled
+        self.window = window
+        self.dump_path = Path(dump_path) if dump_path else None
+        self.dump_interval = dump_interval
+        self._timings: Dict[str, RollingHistogram] = {}
+        self._counts: Dict[str, RollingHistogram] = {}
+        self._lock = threading.Lock()
+        self._last_dump = time.monotonic()
+
+    def timer(self, stage: str):
+        if not self.enabled: return _NULL_TIMER
+        return self._timed(stage)
+
+    @contextmanager
+    def _timed(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float) -> None:
+        if not self.enabled: return
+        with self._lock:
+            hist = self._timings.get(stage)
+            if hist is None: hist = self._timings[stage] = RollingHistogram(self.window)
+            hist.add(seconds)
+
+    def count(self, name: str, value: float) -> None:
+        if not self.enabled: return
+        with self._lock:
+            hist = self._counts.get(name)
+            if hist is None: hist = self._counts[name] = RollingHistogram(self.window)
+            hist.add(value)
+
+    def stats(self) -> Dict[str, Dict]:
+        """{"timings_ms": {阶段: 分位数摘要}, "counts": {名称: 分位数摘要}}"""
+        with self._lock:
+            return {
+                "timings_ms": {k: h.summary(scale=1000.0) for k, h in sorted(self._timings.items())},
+                "counts": {k: h.summary() for k, h in sorted(self._counts.items())},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._timings.clear(); self._counts.clear()
+
+    def end_frame(self) -> None:
+        """每帧结束时调用；到期则写出指标文件"""
+        if not self.enabled or self.dump_path is None: return
+        now = time.monotonic()
+        if now - self._last_dump < self.dump_interval: return
+        self._last_dump = now
+        self.dump()
+
+    def dump(self, path: Optional[str] = None) -> None:
+        target = Path(path) if path else self.dump_path
+        if target is None: return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        payload = dict(self.stats(), timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        tmp.replace(target)
@@ -0,0 +1,162 @@
+"""
+批量矩阵乘法节点分类模块
+把所有模板展开为一个矩阵、把所有节点 (含若干抖动偏移) 的图块展开为另一个矩阵，
+用一次 BLAS 矩阵乘法为每个 (节点, 模板) 对打分，取代成千上万次小尺寸的 cv2.matchTemplate。
+"""
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.utils.vision.templates_manager import TemplateAtlas, TemplateBank
+from app.services.board_lattice import BoardLattice
+
+
+@dataclass
+class NodeScore:
+    """单个节点的分类结果；template_index 为 -1 表示空节点"""
+    node_index: int
+    template_index: int
+    score: float
+    margin: float            # 与不同 (颜色, 棋子) 标签的次优得分之差
+    location: Tuple[int, int]  # 模板左上角的整图坐标
+
+
+class GemmNodeClassifier:
+    """
+    - 所有模板放入同一个 (H_max, W_max) 的画框中居中，框内模板矩形区域零均值、单位范数，
+      展开为 (T, D) 的模板矩阵
+    - 每个节点中心加若干抖动偏移，在各颜色的掩膜灰度图上截取同样大小的画框，展开为 (R, D)；
+      格子内某颜色像素过少 (与节点局部匹配的空节点判断一致) 的 (节点, 颜色) 组合不参与计算，
+      一个有棋子的节点通常只剩一种颜色
+    - 相关峰只有约 1 像素宽，抖动网格必须逐像素 (step=1)；步长为 3 时大部分棋子的得分落在阈值以下
+    - 一次 (R, D) @ (D, T) 得到分子，再除以每个图块在对应模板矩形内的标准差范数，
+      结果与该位置上 TM_CCOEFF_NORMED 的得分完全一致
+    - 提供 atlas 时矩阵只包含去重后的唯一模板 (U << T)，各颜色的变体共用其代表模板的分子
+    """
+
+    def __init__(self, bank: TemplateBank, color_ranges: Dict, jitter: int = 3, step: int = 1,
+                 atlas: Optional[TemplateAtlas] = None, batch_pairs: int = 16):
+        self.bank = bank
+        self.batch_pairs = batch_pairs
+        self.color_ranges = color_ranges
+        self.box_h, self.box_w = bank.gray.shape[1:]
+        self.colors = [c for c in bank.colors if c in color_ranges]
+        color_ids = [bank.colors.index(c) for c in self.colors]
+        self.template_indices = np.flatnonzero(np.isin(bank.color_ids, color_ids) & bank.non_empty)
+        self.offsets = np.array([(dx, dy) for dy in range(-jitter, jitter + 1, step)
+                                 for dx in range(-jitter, jitter + 1, step)], dtype=np.int32).reshape(-1, 2)
+
+        # 模板矩形在画框中的位置按尺寸分组，分母只需按组计算
+        shapes = bank.shapes[self.template_indices]
+        self.rect_shapes, self.template_group = np.unique(shapes, axis=0, return_inverse=True)
+        self.template_group = self.template_group.reshape(-1)
+        self.template_color = np.array([self.colors.index(bank.colors[bank.color_ids[i]]) for i in self.template_indices],
+                                       dtype=np.intp)
+        labels = bank.color_ids[self.template_indices].astype(np.int64) * len(bank.piece_types) + bank.piece_ids[self.template_indices]
+        self.template_label = labels
+        self.color_columns = [np.flatnonzero(self.template_color == c) for c in range(len(self.colors))]
+        self.min_pixels = np.array([int(np.count_nonzero(bank.masks[self.template_indices[cols]], axis=(1, 2)).min()) // 4
+                                    if len(cols) else np.iinfo(np.int32).max for cols in self.color_columns])
+
+        # 每个模板对应矩阵中的一行；有图集时同一唯一模板的变体共用一行
+        if atlas is not None:
+            units, self.template_row = np.unique(atlas.bank_to_unique[self.template_indices], return_inverse=True)
+            self.template_row = self.template_row.reshape(-1)
+            row_templates = atlas.representative[units]
+        else:
+            self.template_row = np.arange(len(self.template_indices))
+            row_templates = self.template_indices
+
+        matrix = np.zeros((len(row_templates), self.box_h, self.box_w), dtype=np.float32)
+        for row, index in enumerate(row_templates):
+            h, w = bank.shapes[index]
+            oy, ox = (self.box_h - h) // 2, (self.box_w - w) // 2
+            rect = bank.template(index).astype(np.float32)
+            rect -= rect.mean()
+            norm = np.linalg.norm(rect)
+            if norm > 0: matrix[row, oy:oy + h, ox:ox + w] = rect / norm
+        self.matrix = matrix.reshape(len(row_templates), -1)
+
+    def _masked_grays(self, image: np.ndarray) -> np.ndarray:
+        """各颜色的掩膜灰度图，四周按画框尺寸补零，形状 (C, H + box_h, W + box_w)"""
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        pad_y, pad_x = self.box_h // 2 + 1, self.box_w // 2 + 1
+        out = np.zeros((len(self.colors), gray.shape[0] + 2 * pad_y, gray.shape[1] + 2 * pad_x), dtype=np.float32)
+        for c, color in enumerate(self.colors):
+            lower = np.array(self.color_ranges[color]['lower']); upper = np.array(self.color_ranges[color]['upper'])
+            mask = cv2.inRange(hsv, lower, upper)
+            out[c, pad_y:pad_y + gray.shape[0], pad_x:pad_x + gray.shape[1]] = cv2.bitwise_and(gray, gray, mask=mask)
+        return out
+
+    def classify(self, image: np.ndarray, lattice: BoardLattice, threshold: float = 0.8,
+                 node_indices: Optional[Sequence[int]] = None, allowed: Optional[np.ndarray] = None) -> List[NodeScore]:
+        """allowed 为 (节点数, 模板库大小) 的 bool 矩阵时，节点只在其所在分区允许的模板中取最佳"""
+        if node_indices is None: node_indices = np.arange(len(lattice))
+        node_indices = np.asarray(node_indices, dtype=np.intp)
+        if len(node_indices) == 0 or len(self.template_indices) == 0: return []
+
+        grays = self._masked_grays(image)
+        pad_y, pad_x = self.box_h // 2 + 1, self.box_w // 2 + 1
+        centers = lattice.centers[node_indices]
+
+        # 各节点格子内各颜色的像素数 (积分图)，只保留像素足够的 (节点, 颜色) 组合
+        cells = lattice.cell_windows(image.shape)[node_indices] + (pad_x, pad_y, pad_x, pad_y)
+        integral = np.stack([cv2.integral((g > 0).astype(np.uint8)) for g in grays])
+        x1, y1, x2, y2 = cells.T
+        counts = integral[:, y2, x2] - integral[:, y1, x2] - integral[:, y2, x1] + integral[:, y1, x1]  # (C, M)
+        pair_color, pair_node = np.nonzero(counts >= self.min_pixels[:, None])
+
+        # 画框左上角 (补零后的坐标)：节点中心 + 偏移 - 半个画框
+        tl = centers[pair_node][:, None, :] + self.offsets[None, :, :] - (self.box_w // 2, self.box_h // 2)
+        xs = np.clip(tl[..., 0] + pad_x, 0, grays.shape[2] - self.box_w)
+        ys = np.clip(tl[..., 1] + pad_y, 0, grays.shape[1] - self.box_h)
+
+        windows = np.lib.stride_tricks.sliding_window_view(grays, (self.box_h, self.box_w), axis=(1, 2))
+        n_pairs, n_offsets = xs.shape
+        numer = np.empty((n_pairs, n_offsets, self.matrix.shape[0]), dtype=np.float32)   # (P, J, U)
+        denom = np.empty((n_pairs, n_offsets, len(self.rect_shapes)), dtype=np.float32)  # (P, J, G)
+        # 按批截取图块，限制 (P, J, box_h, box_w) 临时数组的内存
+        for a in range(0, n_pairs, self.batch_pairs):
+            b = min(n_pairs, a + self.batch_pairs)
+            patches = windows[pair_color[a:b, None], ys[a:b], xs[a:b]]   # (B, J, box_h, box_w)
+            # 分子：一次矩阵乘法
+            numer[a:b] = (patches.reshape((b - a) * n_offsets, -1) @ self.matrix.T).reshape(b - a, n_offsets, -1)
+            # 分母：每个图块在各尺寸组模板矩形内的标准差范数
+            for g, (h, w) in enumerate(self.rect_shapes):
+                oy, ox = (self.box_h - h) // 2, (self.box_w - w) // 2
+                rect = patches[:, :, oy:oy + h, ox:ox + w].reshape(b - a, n_offsets, -1)
+                sums = rect.sum(axis=2)
+                denom[a:b, :, g] = np.sqrt(np.maximum((rect * rect).sum(axis=2) - sums * sums / (h * w), 0))
+
+        # 每个组合只取其颜色的模板列；未参与计算的 (节点, 模板) 得分为 -1
+        node_scores = np.full((len(node_indices), len(self.template_indices)), -1.0, dtype=np.float32)  # (M, T)
+        best_offset = np.zeros(node_scores.shape, dtype=np.intp)
+        for c, cols in enumerate(self.color_columns):
+            pairs = np.flatnonzero(pair_color == c)
+            if len(pairs) == 0 or len(cols) == 0: continue
+            n = numer[pairs][:, :, self.template_row[cols]]
+            d = denom[pairs][:, :, self.template_group[cols]]
+            scores = np.divide(n, d, out=np.zeros_like(n), where=d > 1e-6)  # (Pc, J, Tc)
+            node_scores[np.ix_(pair_node[pairs], cols)] = scores.max(axis=1)
+            best_offset[np.ix_(pair_node[pairs], cols)] = scores.argmax(axis=1)
+        if allowed is not None:
+            node_scores = np.where(allowed[:, self.template_indices], node_scores, -1.0)
+        best_t = node_scores.argmax(axis=1)
+        best = node_scores[np.arange(len(node_indices)), best_t]
+        same_label = self.template_label[None, :] == self.template_label[best_t][:, None]
+        runner_up = np.where(same_label, -np.inf, node_scores).max(axis=1)
+        margins = np.where(np.isfinite(runner_up), best - runner_up, best)
+
+        results = []
+        for m, node_index in enumerate(node_indices):
+            t = int(best_t[m])
+            template_index = int(self.template_indices[t])
+            h, w = self.bank.shapes[template_index]
+            dx, dy = self.offsets[best_offset[m, t]]
+            x = int(centers[m, 0] + dx - self.box_w // 2 + (self.box_w - w) // 2)
+            y = int(centers[m, 1] + dy - self.box_h // 2 + (self.box_h - h) // 2)
+            if best[m] < threshold: template_index = -1
+            results.append(NodeScore(int(node_index), template_index, float(best[m]), float(margins[m]), (x, y)))
+        return results
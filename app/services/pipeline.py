@@ -0,0 +1,184 @@
+"""
+连续识别流水线模块
+采集、分析、发布三个阶段各占一个线程，阶段之间用有界队列连接:
+    FrameSource --[帧队列]--> analyze --[结果队列]--> publish
+分析线程只要有帧就立即处理，不再固定 sleep；每个结果都带有其来源帧的时间戳，可直接测量端到端延迟。
+采集默认按分析速度限速 (最近分析耗时的滑动平均)，分析跟不上时不会空转抓取注定被丢弃的帧。
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.frame_source import Frame, FrameSource
+
+# 过期帧策略
+DROP_OLDEST = "drop-oldest"   # 队列满时丢弃最旧的帧
+LATEST_ONLY = "latest-only"   # 队列只保留最新一帧 (容量强制为 1)
+BLOCK = "block"               # 队列满时阻塞上游 (背压)
+STALE_POLICIES = (DROP_OLDEST, LATEST_ONLY, BLOCK)
+
+MIN_CAPTURE_INTERVAL = 1 / 30  # 自动限速时采集间隔的下限 (秒)，也是首个分析结果出来之前的间隔
+ANALYSIS_EMA_ALPHA = 0.2       # 分析耗时滑动平均的权重
+
+
+@dataclass
+class PipelineResult:
+    frame_index: int
+    frame_timestamp: float  # 帧来源给出的时间戳
+    captured_at: float      # 以下均为 time.perf_counter()
+    analyzed_at: float
+    published_at: float
+    result: Any
+
+    @property
+    def latency(self) -> float:
+        """从采集到发布的端到端延迟 (秒)"""
+        return self.published_at - self.captured_at
+
+    @property
+    def analysis_time(self) -> float:
+        return self.analyzed_at - self.captured_at
+
+
+class _StageQueue:
+    """带过期策略的有界队列，并统计因策略被丢弃的条目数"""
+
+    def __init__(self, maxsize: int, policy: str):
+        if policy not in STALE_POLICIES: raise ValueError(f"未知的过期帧策略: {policy}")
+        self.policy = policy
+        self.queue = queue.Queue(maxsize=1 if policy == LATEST_ONLY else max(1, maxsize))
+        self.dropped = 0
+
+    def put(self, item, stop_event: threading.Event) -> None:
+        if self.policy == BLOCK:
+            while not stop_event.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1); return
+                except queue.Full:
+                    continue
+            return
+        while True:
+            try:
+                self.queue.put_nowait(item); return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait(); self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = 0.1):
+        return self.queue.get(timeout=timeout)
+
+
+class RecognitionPipeline:
+    """
+    Args:
+        source: 帧来源
+        analyze: 分析函数，输入 Frame，返回任意结果 (例如报告字符串)
+        publish: 发布回调，输入 PipelineResult；GUI 中应自行转发到主线程
+        queue_size: 两个阶段队列的容量
+        stale_policy: 帧队列的过期帧策略 (drop-oldest / latest-only / block)
+        capture_interval: 两次采集之间的最小间隔 (秒)；None 表示按分析速度自动限速
+            (间隔取最近分析耗时的滑动平均，不低于 MIN_CAPTURE_INTERVAL)，0 表示不限速
+    """
+
+    def __init__(self, source: FrameSource, analyze: Callable[[Frame], Any], publish: Callable[[PipelineResult], None],
+                 queue_size: int = 2, stale_policy: str = LATEST_ONLY, capture_interval: Optional[float] = None):
+        self.source = source
+        self.analyze = analyze
+        self.publish = publish
+        self.capture_interval = capture_interval
+        self.frames = _StageQueue(queue_size, stale_policy)
+        # 结果队列总是丢弃最旧的结果，避免发布端变慢时拖住分析线程
+        self.results = _StageQueue(queue_size, DROP_OLDEST if stale_policy != BLOCK else BLOCK)
+        self.counters = {"captured": 0, "analyzed": 0, "published": 0, "errors": 0}
+        self._counter_lock = threading.Lock()  # 三个阶段线程都会更新计数
+        self.analysis_time = 0.0  # 分析耗时的滑动平均 (秒)
+        self.last_error: Optional[BaseException] = None
+        self._stop = threading.Event()
+        self._threads: Dict[str, threading.Thread] = {}
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads.values())
+
+    def _stage_alive(self, name: str) -> bool:
+        thread = self._threads.get(name)
+        return thread is not None and thread.is_alive()
+
+    def start(self) -> None:
+        if self.running: return
+        self._stop.clear()
+        self._threads = {name: threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+                         for name, target in (("capture", self._capture_loop), ("analyze", self._analyze_loop),
+                                              ("publish", self._publish_loop))}
+        for t in self._threads.values(): t.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        for t in self._threads.values():
+            if t is not threading.current_thread(): t.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._counter_lock:
+            return dict(self.counters, frames_dropped=self.frames.dropped, results_dropped=self.results.dropped)
+
+    def _count(self, name: str, error: Optional[BaseException] = None) -> None:
+        with self._counter_lock:
+            self.counters[name] += 1
+            if error is not None: self.last_error = error
+
+    def _next_interval(self) -> float:
+        if self.capture_interval is not None: return self.capture_interval
+        return max(MIN_CAPTURE_INTERVAL, self.analysis_time)
+
+    def _capture_loop(self) -> None:
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            try:
+                frame = self.source.read()
+            except Exception as e:
+                self._count("errors", e); frame = None
+            if frame is None:
+                if self.source.exhausted: break
+                self._stop.wait(self.source.retry_interval)
+                continue
+            self._count("captured")
+            self.frames.put((frame, time.perf_counter()), self._stop)
+            remaining = self._next_interval() - (time.perf_counter() - started)
+            if remaining > 0: self._stop.wait(remaining)
+
+    def _analyze_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                frame, captured_at = self.frames.get()
+            except queue.Empty:
+                if not self._stage_alive("capture"): break
+                continue
+            started = time.perf_counter()
+            try:
+                result = self.analyze(frame)
+            except Exception as e:
+                self._count("errors", e)
+                continue
+            elapsed = time.perf_counter() - started
+            self.analysis_time = elapsed if self.analysis_time == 0.0 else \
+                (1 - ANALYSIS_EMA_ALPHA) * self.analysis_time + ANALYSIS_EMA_ALPHA * elapsed
+            self._count("analyzed")
+            self.results.put((frame, captured_at, time.perf_counter(), result), self._stop)
+
+    def _publish_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                frame, captured_at, analyzed_at, result = self.results.get()
+            except queue.Empty:
+                if not self._stage_alive("analyze"): break
+                continue
+            try:
+                self.publish(PipelineResult(frame.index, frame.timestamp, captured_at, analyzed_at,
+                                            time.perf_counter(), result))
+                self._count("published")
+            except Exception as e:
+                self._count("errors", e)
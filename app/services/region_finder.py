@@ -0,0 +1,114 @@
+"""
+玩家分区查找模块
+棋盘是固定的十字形：四名玩家各占一条“臂”，中央为 3x3 的九宫。
+这里不做聚类，而是以棋盘中心为原点按对角线把平面分成上/下/左/右四个扇区，
+每个扇区内棋子中心的范围即该臂的边界，结果确定且只需几毫秒。
+已有锁定分区时，regions_from_labels 可只凭颜色标签图跟踪棋盘的小幅平移，不做模板匹配。
+"""
+import cv2
+import numpy as np
+from typing import Dict, Tuple
+
+from app.services.board_lattice import BoardLattice
+from app.utils.vision.segmentation import ColorSegmentation
+
+Bounds = Tuple[int, int, int, int]
+ARMS = ("上方", "下方", "左侧", "右侧")
+
+
+def _sector_ids(xs: np.ndarray, ys: np.ndarray, cx: float, cy: float) -> np.ndarray:
+    """0=上方, 1=下方, 2=左侧, 3=右侧；与原先按聚类中心判断方位的规则一致"""
+    dx, dy = xs - cx, ys - cy
+    horizontal = np.abs(dx) > np.abs(dy)
+    return np.where(horizontal, np.where(dx < 0, 2, 3), np.where(dy < 0, 0, 1))
+
+
+def _with_center(bounds: Dict[str, Bounds]) -> Dict[str, Bounds]:
+    if all(k in bounds for k in ARMS):
+        bounds["中央"] = (bounds["左侧"][2], bounds["上方"][3], bounds["右侧"][0], bounds["下方"][1])
+    return bounds
+
+
+def regions_from_points(points: np.ndarray, trim: float = 0.0) -> Dict[str, Bounds]:
+    """
+    由棋子中心点 (N, 2) 求四个玩家分区与中央分区的边界。
+    棋盘中心取所有点外接框的中点；trim > 0 时每个扇区两端各剔除该比例的离群点，trim = 0 即取最小/最大值。
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 4: return {}
+    xs, ys = points[:, 0], points[:, 1]
+    q = [100 * trim, 100 * (1 - trim)]
+    cx, cy = np.percentile(xs, q).mean(), np.percentile(ys, q).mean()
+    sectors = _sector_ids(xs, ys, cx, cy)
+
+    bounds: Dict[str, Bounds] = {}
+    for sector, name in enumerate(ARMS):
+        inside = sectors == sector
+        if not inside.any(): continue
+        (x1, x2), (y1, y2) = np.percentile(xs[inside], q), np.percentile(ys[inside], q)
+        bounds[name] = (int(x1), int(y1), int(x2), int(y2))
+    return _with_center(bounds)
+
+
+def piece_centers_from_labels(segmentation: ColorSegmentation, piece_size: Tuple[int, int], close_kernel: int = 5,
+                              low: float = 0.6, high: float = 1.3) -> np.ndarray:
+    """
+    颜色标签图上棋子形状的连通块中心 (N, 2)。piece_size 为棋子的 (短边, 长边)。
+    短边不像一枚棋子的连通块 (界面元素、与棋盘线连成一片的色块) 丢弃；
+    同一排相邻棋子连成的长条只取两端棋子的中心，求边界时只用得到两端。
+    """
+    short, long = piece_size
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (close_kernel, close_kernel))
+    points = []
+    for color in segmentation.colors:
+        mask = cv2.morphologyEx(segmentation.mask(color), cv2.MORPH_CLOSE, kernel)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        for x, y, w, h, _ in stats[1:count]:
+            if not (low * short <= min(w, h) <= high * short and max(w, h) >= low * long): continue
+            cx, cy = x + w / 2, y + h / 2
+            if max(w, h) <= high * long: points.append((cx, cy))
+            elif w > h: points += [(x + long / 2, cy), (x + w - long / 2, cy)]
+            else: points += [(cx, y + long / 2), (cx, y + h - long / 2)]
+    return np.array(points, dtype=np.float64).reshape(-1, 2)
+
+
+def _snap_offsets(points: np.ndarray, nodes: np.ndarray, radius: float) -> np.ndarray:
+    """每个点到最近节点的偏移，只保留两个方向都不超过 radius 的"""
+    offsets = points[:, None, :] - nodes[None, :, :]
+    nearest = np.argmin((offsets ** 2).sum(axis=2), axis=1)
+    offsets = offsets[np.arange(len(points)), nearest]
+    return offsets[(np.abs(offsets) <= radius).all(axis=1)]
+
+
+def regions_from_labels(segmentation: ColorSegmentation, board: Dict[str, Bounds], piece_size: Tuple[int, int],
+                        max_shift: int = 12, min_points: int = 8, max_spread: float = 3.0) -> Dict[str, Bounds]:
+    """
+    不经过模板匹配，由颜色标签图跟踪参考分区 board (如当前锁定分区) 的平移。
+    整幅标签图里有与棋子同色的棋盘线和界面元素，同色棋子也常与棋盘线连成一片，
+    直接取色块的范围会偏出整整一格甚至整条臂；因此只取棋子形状色块的中心，
+    与参考分区理论节点的偏移都在 max_shift 以内的才算作棋子，整体平移取偏移的中位数。
+    以下情况返回 {}，调用方应改用模板匹配的棋子中心 (regions_from_points)：
+    - 吻合的棋子少于 min_points，或各棋子偏移与中位数的平均差超过 max_spread (不是整体平移)
+    - 节点网格是周期的，平移接近整格时会错认到相邻节点；再平移一整格后吻合的棋子不少于当前时，说明发生了错认
+    """
+    points = piece_centers_from_labels(segmentation, piece_size)
+    lattice = BoardLattice(board)
+    nodes = lattice.centers.astype(np.float64)
+    if len(points) == 0 or len(nodes) == 0: return {}
+    offsets = _snap_offsets(points, nodes, max_shift)
+    if len(offsets) < min_points: return {}
+    shift = np.median(offsets, axis=0)
+    if np.abs(offsets - shift).sum(axis=1).mean() > max_spread: return {}
+    pitch = float(np.median(lattice.cell_sizes))
+    matched = len(_snap_offsets(points, nodes + shift, max_spread))
+    for step in ((pitch, 0), (-pitch, 0), (0, pitch), (0, -pitch)):
+        if len(_snap_offsets(points, nodes + shift + step, max_spread)) >= matched: return {}
+    dx, dy = (int(round(v)) for v in shift)
+    return {name: (x1 + dx, y1 + dy, x2 + dx, y2 + dy) for name, (x1, y1, x2, y2) in
+            ((k, tuple(int(v) for v in b)) for k, b in board.items())}
+
+
+def regions_agree(regions: Dict[str, Bounds], reference: Dict[str, Bounds], tolerance: int) -> bool:
+    """两组分区是否包含同样的分区，且每条边界相差都不超过 tolerance 像素"""
+    if not regions or set(regions) != set(reference): return False
+    return all(np.abs(np.subtract(regions[k], reference[k])).max() <= tolerance for k in reference)
@@ -0,0 +1,114 @@
+"""
+按棋盘分区裁剪模板
+上下两方的格子是横向的，左右两方的格子是竖向的，棋子图像随格子方向旋转，
+无论是谁的棋子，在某个分区里都只会以该分区格子的方向出现，因此每个分区只需匹配部分方向的模板。
+颜色裁剪是可选的：调用方给出 region_colors 时，视为该分区只会出现这一种颜色并据此裁剪，
+本模块不做检验；棋子走进别家分区后这一前提即不成立 (如布阵阶段之后)，届时应清除 region_colors。
+RegionTemplateTable 据此为每个分区预先算好允许的模板集合，供各匹配模式查询。
+"""
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+
+from app.utils.vision.templates_manager import TemplateBank
+from app.services.board_lattice import BoardLattice
+
+# 分区 -> 允许出现的模板方向
+DEFAULT_REGION_ORIENTATIONS: Dict[str, Tuple[str, ...]] = {
+    "上方": ("horizontal",),
+    "下方": ("horizontal",),
+    "左侧": ("left", "right"),
+    "右侧": ("left", "right"),
+    "中央": ("horizontal", "left", "right"),
+}
+
+
+class RegionTemplateTable:
+    """
+    - region_orientations: 分区 -> 允许的方向；未列出的分区不做方向限制
+    - region_colors: 分区 -> 只匹配该颜色的模板 (由调用方保证分区内没有其他颜色)；未列出的分区不限颜色
+    - allowed: 分区 -> (N,) bool，与 TemplateBank 索引对齐
+    不受颜色范围约束的模板 (如中立的行营) 永远不被裁剪。
+    """
+
+    def __init__(self, bank: TemplateBank, locked_regions: Dict[str, Sequence[int]],
+                 region_orientations: Optional[Dict[str, Sequence[str]]] = None,
+                 region_colors: Optional[Dict[str, str]] = None, piece_colors: Sequence[str] = ()):
+        self.bank = bank
+        self.regions = list(locked_regions)
+        self.bounds = np.array([tuple(int(v) for v in locked_regions[r]) for r in self.regions], dtype=np.int32).reshape(-1, 4)
+        self.region_orientations = dict(DEFAULT_REGION_ORIENTATIONS if region_orientations is None else region_orientations)
+        self.region_colors = dict(region_colors or {})
+        colored = np.isin(bank.color_ids, [bank.colors.index(c) for c in piece_colors if c in bank.colors])
+
+        self.allowed: Dict[str, np.ndarray] = {}
+        for region in self.regions:
+            keep = np.ones(len(bank), dtype=bool)
+            orientations = self.region_orientations.get(region)
+            if orientations is not None:
+                ids = [bank.orientations.index(o) for o in orientations if o in bank.orientations]
+                keep &= np.isin(bank.orientation_ids, ids)
+            color = self.region_colors.get(region)
+            if color is not None:
+                keep &= bank.color_ids == (bank.colors.index(color) if color in bank.colors else -1)
+            keep |= ~colored
+            keep.setflags(write=False)
+            self.allowed[region] = keep
+        # (R, N) 便于按分区序号向量化查询
+        self._matrix = np.stack([self.allowed[r] for r in self.regions]) if self.regions else np.zeros((0, len(bank)), dtype=bool)
+        self._roi_cache: Dict[Tuple[int, int, int, int, int], Dict[int, Optional[Tuple[int, int, int, int]]]] = {}
+
+    def allowed_fraction(self) -> float:
+        """裁剪后需要匹配的 (分区, 模板) 对占全部组合的比例"""
+        return float(self._matrix.mean()) if self._matrix.size else 1.0
+
+    def node_mask(self, lattice: BoardLattice, node_indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """(M, N) bool：每个节点允许匹配的模板"""
+        if node_indices is None: node_indices = np.arange(len(lattice))
+        regions = [lattice.nodes[i].region for i in node_indices]
+        full = np.ones(len(self.bank), dtype=bool)
+        return np.stack([self.allowed.get(r, full) for r in regions]) if regions else np.zeros((0, len(self.bank)), dtype=bool)
+
+    def region_of(self, xs: np.ndarray, ys: np.ndarray, margin: int = 0) -> np.ndarray:
+        """每个点所在分区 (各边外扩 margin) 的序号，不在任何分区内为 -1 (分区重叠时取第一个)"""
+        xs = np.asarray(xs)[:, None]; ys = np.asarray(ys)[:, None]
+        b = self.bounds[None, :, :]
+        inside = (xs >= b[..., 0] - margin) & (xs < b[..., 2] + margin) & (ys >= b[..., 1] - margin) & (ys < b[..., 3] + margin)
+        return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+    def allowed_at(self, x: int, y: int) -> Optional[np.ndarray]:
+        """点所在分区允许的模板 (N,) bool；不在任何分区内返回 None"""
+        region = int(self.region_of([x], [y])[0])
+        return self._matrix[region] if region >= 0 else None
+
+    def template_rois(self, image_shape: Tuple[int, ...], padding: int = 0,
+                      origin: Tuple[int, int] = (0, 0)) -> Dict[int, Optional[Tuple[int, int, int, int]]]:
+        """
+        整图匹配用：每个模板只需在允许它出现的分区的外接矩形内搜索。
+        分区边界是棋子中心的范围，因此每边再外扩半个模板，边缘的棋子才能完整落在 ROI 内。
+        图像是从窗口 origin=(x, y) 处裁剪出的子图时，返回子图坐标。
+        返回 {模板索引: (x1, y1, x2, y2)}；不允许出现在任何分区的模板值为 None，调用方应跳过。
+        """
+        img_h, img_w = image_shape[:2]
+        ox, oy = (int(v) for v in origin)
+        key = (img_h, img_w, padding, ox, oy)
+        if key in self._roi_cache: return self._roi_cache[key]
+        rois: Dict[int, Optional[Tuple[int, int, int, int]]] = {}
+        for index in range(len(self.bank)):
+            rows = self._matrix[:, index]
+            if not rows.any():
+                rois[index] = None; continue
+            b = self.bounds[rows]
+            h, w = (int(v) for v in self.bank.shapes[index])
+            pad_x, pad_y = padding + (w + 1) // 2, padding + (h + 1) // 2
+            rois[index] = (max(0, int(b[:, 0].min()) - pad_x - ox), max(0, int(b[:, 1].min()) - pad_y - oy),
+                           min(img_w, int(b[:, 2].max()) + pad_x - ox), min(img_h, int(b[:, 3].max()) + pad_y - oy))
+        self._roi_cache[key] = rois
+        return rois
+
+    def keep_candidates(self, template_index: np.ndarray, centers_x: np.ndarray, centers_y: np.ndarray) -> np.ndarray:
+        """候选中心所在分区允许该模板时保留；落在所有分区之外的候选不做判断，直接保留"""
+        region = self.region_of(centers_x, centers_y)
+        keep = np.ones(len(template_index), dtype=bool)
+        inside = region >= 0
+        keep[inside] = self._matrix[region[inside], template_index[inside]]
+        return keep
@@ -0,0 +1,123 @@
+"""
+共享内存帧缓冲模块
+父进程把截图写入一块 multiprocessing.shared_memory，工作进程按帧序号零拷贝读取，
+避免每帧把整张截图 pickle 后发送给每个工作进程。
+"""
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+HEADER_FIELDS = 4  # [seq, h, w, c]
+HEADER_BYTES = HEADER_FIELDS * np.dtype(np.int64).itemsize
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    以只附加的方式打开共享内存，由创建方负责回收。
+    工作进程与创建方共用同一个 resource_tracker，附加时的重复登记是空操作；若在此注销，
+    会连创建方的登记一起删掉，创建方 unlink 时 tracker 便报 KeyError。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameBuffer:
+    """
+    单帧共享内存缓冲
+    - 布局: int64 头部 [seq, h, w, c] + 紧随其后的 uint8 像素
+    - 父进程 (owner) 负责创建、写入与回收；工作进程通过 name 附加后只读
+    """
+
+    def __init__(self, capacity: int = 0, name: Optional[str] = None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER_BYTES + max(1, capacity))
+            self.owner = True
+        else:
+            self.shm = _attach_shared_memory(name)
+            self.owner = False
+        self._header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+        if self.owner:
+            self._header[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def capacity(self) -> int:
+        return self.shm.size - HEADER_BYTES
+
+    @property
+    def seq(self) -> int:
+        return int(self._header[0])
+
+    def write(self, frame: np.ndarray) -> int:
+        """写入一帧 (BGR uint8)，返回新的帧序号"""
+        if frame.ndim != 3 or frame.dtype != np.uint8:
+            raise ValueError(f"仅支持 HxWxC 的 uint8 图像, 实际为 {frame.shape} {frame.dtype}")
+        if frame.nbytes > self.capacity:
+            raise ValueError(f"帧大小 {frame.nbytes} 超出共享缓冲容量 {self.capacity}")
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=HEADER_BYTES)
+        np.copyto(view, frame)
+        del view
+        seq = self.seq + 1
+        self._header[1:] = frame.shape
+        self._header[0] = seq
+        return seq
+
+    def shape(self) -> Tuple[int, int, int]:
+        _, h, w, c = (int(v) for v in self._header)
+        return h, w, c
+
+    def read(self, seq: int) -> np.ndarray:
+        """按帧序号读取当前帧的零拷贝视图；序号不符说明任务已过期"""
+        current = self.seq
+        if current != seq:
+            raise RuntimeError(f"共享帧已过期: 期望 seq={seq}, 当前 seq={current}")
+        return np.ndarray(self.shape(), dtype=np.uint8, buffer=self.shm.buf, offset=HEADER_BYTES)
+
+    def close(self) -> None:
+        """关闭映射；仍有外部视图导致无法关闭时，创建方也要在 finally 中删除共享内存段，避免泄漏"""
+        self._header = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        finally:
+            if self.owner:
+                try:
+                    self.shm.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+class LocalFrameBuffer:
+    """
+    与 SharedFrameBuffer 接口一致的进程内帧缓冲，供线程/内联后端使用：
+    任务与调用方在同一进程，只保存截图引用，不做复制。
+    """
+    name = None
+    capacity = float("inf")
+
+    def __init__(self):
+        self._frame: Optional[np.ndarray] = None
+        self._seq = 0
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def write(self, frame: np.ndarray) -> int:
+        self._frame = frame
+        self._seq += 1
+        return self._seq
+
+    def read(self, seq: int) -> np.ndarray:
+        if seq != self._seq:
+            raise RuntimeError(f"帧已过期: 期望 seq={seq}, 当前 seq={self._seq}")
+        return self._frame
+
+    def close(self) -> None:
+        self._frame = None
@@ -0,0 +1,226 @@
+"""
+节点数组状态差异模块
+两帧节点数组 (见 board_history) 按跟踪 ID 一次性求出移动、消失、出现的棋子，
+再按军棋规则把它们归结为事件序列。计算量只与节点数 (129) 有关，与棋子数和变化数无关。
+
+归结顺序 (同一帧内多处变化时，如丢帧或快速落子):
+1. 消失棋子的原节点现在站着一个敌方棋子 (移入或新出现) -> 吃子 CaptureEvent
+2. 剩余消失棋子中两两互为敌方、且一方是炸弹或等级相同 -> BombEvent / TradeEvent，距离近的优先配对
+3. 仍未解释的消失棋子: 与它相邻 (一步可达) 或能沿铁路走到、且按 PIECE_RANKS 能吃掉它的敌方棋子中
+   最近的一个视为胜者 (CaptureEvent)；最近的是地雷或找不到时记为 LandmineEvent
+4. 其余移动 -> MoveEvent
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.board_history import BoardCodec, NODE_KEYS, PIECE_CODES, PIECE_NAMES, PieceRecord, RANK_BY_CODE
+from app.game_model import BombEvent, CaptureEvent, GameEvent, LandmineEvent, MoveEvent, Piece, TradeEvent
+from app.services.board_lattice import TRANSPOSED_REGIONS
+
+# 各分区在标准 17x17 棋盘上的左上角与节点间距 (x1, y1, step)；中央九宫落在臂的第 0/2/4 列上
+CANONICAL_REGIONS: Dict[str, Tuple[int, int, int]] = {
+    "上方": (6, 0, 1), "下方": (6, 11, 1), "左侧": (0, 6, 1), "右侧": (11, 6, 1), "中央": (6, 6, 2)}
+
+
+def _node_positions() -> np.ndarray:
+    xy = np.zeros((len(NODE_KEYS), 2), dtype=np.int32)
+    for i, (region, r, c) in enumerate(NODE_KEYS):
+        x1, y1, step = CANONICAL_REGIONS[region]
+        if region in TRANSPOSED_REGIONS: r, c = c, r   # 逻辑行 -> 截图列
+        xy[i] = (x1 + c * step, y1 + r * step)
+    return xy
+
+
+NODE_XY = _node_positions()
+_NODE_AT: Dict[Tuple[int, int], int] = {(int(x), int(y)): i for i, (x, y) in enumerate(NODE_XY)}
+
+
+def _rotations(points: Sequence[Tuple[int, int]]) -> List[List[int]]:
+    """上方一条臂上的坐标序列绕棋盘中心依次旋转 90 度，得到四条臂对应的节点编号序列"""
+    out = []
+    for _ in range(4):
+        out.append([_NODE_AT[p] for p in points])
+        points = [(16 - y, x) for x, y in points]
+    return out
+
+
+# 行营 (上方臂的 5 个，其余三臂由旋转得到)：与四个斜向相邻节点也有公路相连
+CAMPS = np.array(sorted({n for seq in _rotations([(7, 2), (9, 2), (8, 3), (7, 4), (9, 4)]) for n in seq}))
+# 铁路线：同一条线上非工兵棋子可以直行任意距离；外圈经四个角上的弧线首尾相连
+RAIL_LINES: Tuple[List[int], ...] = tuple(
+    _rotations([(x, 1) for x in range(6, 11)])                                           # 各臂大本营往里一排
+    + _rotations([(6, y) for y in range(1, 6)] + [(6, 6), (6, 8), (6, 10)] + [(6, y) for y in range(11, 16)])
+    + _rotations([(8, 5), (8, 6), (8, 8), (8, 10), (8, 11)])                             # 贯穿九宫的中线
+    + [[_NODE_AT[p] for p in [(x, 5) for x in range(6, 11)] + [(11, y) for y in range(6, 11)]
+        + [(x, 11) for x in range(10, 5, -1)] + [(5, y) for y in range(10, 5, -1)]]])
+RING = RAIL_LINES[-1]
+
+
+def _rail_neighbours() -> List[List[int]]:
+    """铁路上与每个节点相邻的站 (按节点编号)"""
+    neighbours: List[List[int]] = [[] for _ in range(len(NODE_KEYS))]
+    for line in RAIL_LINES:
+        stations = line + [line[0]] if line is RING else line
+        for a, b in zip(stations[:-1], stations[1:]):
+            if b not in neighbours[a]: neighbours[a].append(b); neighbours[b].append(a)
+    return neighbours
+
+
+RAIL_NEIGHBOURS = _rail_neighbours()
+
+
+def _adjacency() -> np.ndarray:
+    """一步可达的节点对：横竖相距 1 格、行营的斜向公路、铁路上相邻的两站"""
+    diff = np.abs(NODE_XY[:, None] - NODE_XY[None, :])
+    adjacent = diff.sum(axis=-1) == 1
+    diagonal = (diff == 1).all(axis=-1)
+    adjacent[CAMPS] |= diagonal[CAMPS]; adjacent[:, CAMPS] |= diagonal[:, CAMPS]
+    for a, stations in enumerate(RAIL_NEIGHBOURS): adjacent[a, stations] = True
+    return adjacent
+
+
+ADJACENT = _adjacency()
+
+
+def rail_reachable(src: int, dst: int, occupied: np.ndarray, engineer: bool = False) -> bool:
+    """
+    src 上的棋子能否沿铁路走到 dst：途经的节点必须为空 (occupied 为按节点的布尔数组)
+    - 普通棋子只能沿同一条铁路线直行 (外圈可经弧线转过棋盘角)
+    - 工兵可以在铁路交叉处转弯，按铁路图做一次广度优先搜索
+    """
+    if engineer:
+        seen = {src}; frontier = [src]
+        while frontier:
+            nxt = []
+            for a in frontier:
+                for b in RAIL_NEIGHBOURS[a]:
+                    if b == dst: return True
+                    if b not in seen and not occupied[b]: seen.add(b); nxt.append(b)
+            frontier = nxt
+        return False
+    for line in RAIL_LINES:
+        if src not in line or dst not in line: continue
+        i, j = line.index(src), line.index(dst)
+        lo, hi = min(i, j), max(i, j)
+        if not occupied[line[lo + 1:hi]].any(): return True
+        if line is RING and not occupied[line[hi + 1:] + line[:lo]].any(): return True
+    return False
+
+
+BOMB = PIECE_CODES["炸弹"]
+MINE = PIECE_CODES["地雷"]
+ENGINEER = PIECE_CODES["工兵"]
+
+
+@dataclass
+class NodeDiff:
+    """均为节点编号数组；moved_from[i] -> moved_to[i] 是同一个跟踪 ID"""
+    moved_from: np.ndarray
+    moved_to: np.ndarray
+    vanished: np.ndarray   # 上一帧的节点
+    appeared: np.ndarray   # 本帧的节点
+
+    @property
+    def empty(self) -> bool:
+        return not (len(self.moved_from) or len(self.vanished) or len(self.appeared))
+
+
+def diff_nodes(prev: np.ndarray, curr: np.ndarray) -> NodeDiff:
+    """按跟踪 ID 比较两帧；没有跟踪 ID (track == 0) 的棋子按“消失 + 出现”处理"""
+    prev_nodes = np.flatnonzero(prev["piece"]); curr_nodes = np.flatnonzero(curr["piece"])
+    prev_tracks = prev["track"][prev_nodes]; curr_tracks = curr["track"][curr_nodes]
+    prev_tracks = np.where(prev_tracks > 0, prev_tracks, -1 - np.arange(len(prev_tracks)))
+    curr_tracks = np.where(curr_tracks > 0, curr_tracks, -(1 << 30) - np.arange(len(curr_tracks)))
+    _, pi, ci = np.intersect1d(prev_tracks, curr_tracks, assume_unique=True, return_indices=True)
+    moved = prev_nodes[pi] != curr_nodes[ci]
+    return NodeDiff(prev_nodes[pi][moved], curr_nodes[ci][moved], np.delete(prev_nodes, pi), np.delete(curr_nodes, ci))
+
+
+class EventResolver:
+    """
+    把 NodeDiff 归结为 GameEvent 列表
+    - codec: 与节点数组配套的 BoardCodec (解析颜色/玩家/ID)
+    - teams: 玩家方位 -> 阵营编号，同阵营为友军
+    """
+
+    def __init__(self, codec: BoardCodec, teams: Dict[str, int]):
+        self.codec = codec
+        self.teams = teams
+        self._team_cache = np.zeros(0, dtype=np.int8)
+
+    def _team_of_owner(self) -> np.ndarray:
+        """玩家代码 -> 阵营编号 (-1 未知)；SymbolTable 只增不减，按长度增量更新"""
+        labels = self.codec.labels
+        if len(self._team_cache) != len(labels):
+            self._team_cache = np.array([self.teams.get(labels.name(i), -1) for i in range(len(labels))], dtype=np.int8)
+        return self._team_cache
+
+    def _piece(self, nodes: np.ndarray, node: int) -> Piece:
+        v = nodes[node]
+        return PieceRecord(self.codec.tracks.name(int(v["track"])), PIECE_NAMES[int(v["piece"])],
+                           self.codec.labels.name(int(v["color"])), self.codec.labels.name(int(v["owner"])), node).to_piece()
+
+    def resolve(self, prev: np.ndarray, curr: np.ndarray, timestamp: float, diff: Optional[NodeDiff] = None) -> List[GameEvent]:
+        diff = diff if diff is not None else diff_nodes(prev, curr)
+        if diff.empty: return []
+        team = self._team_of_owner()
+        prev_team = team[prev["owner"]]; curr_team = team[curr["owner"]]
+        events: List[GameEvent] = []
+
+        # 1. 原节点被敌方占据
+        arrived = np.zeros(len(curr), dtype=bool)
+        arrived[diff.moved_to] = True; arrived[diff.appeared] = True
+        v = diff.vanished
+        taken = arrived[v] & (curr_team[v] >= 0) & (prev_team[v] >= 0) & (curr_team[v] != prev_team[v])
+        for node in v[taken]:
+            events.append(CaptureEvent("capture", timestamp, self._piece(curr, node), self._piece(prev, node), NODE_KEYS[node][1:]))
+        consumed_moves = np.isin(diff.moved_to, v[taken])
+        remaining = v[~taken]
+
+        # 2. 同归于尽：两两配对
+        if len(remaining) > 1:
+            codes = prev["piece"][remaining]; ranks = RANK_BY_CODE[codes]; teams = prev_team[remaining]
+            dist = np.linalg.norm(NODE_XY[remaining][:, None] - NODE_XY[remaining][None, :], axis=-1)
+            mutual = (teams[:, None] != teams[None, :]) & (teams[:, None] >= 0) & (teams[None, :] >= 0)
+            mutual &= (codes[:, None] == BOMB) | (codes[None, :] == BOMB) | (ranks[:, None] == ranks[None, :])
+            mutual &= np.triu(np.ones_like(mutual), 1)
+            used = np.zeros(len(remaining), dtype=bool)
+            pairs = np.argwhere(mutual)
+            for i, j in pairs[np.argsort(dist[mutual], kind="stable")]:
+                if used[i] or used[j]: continue
+                used[i] = used[j] = True
+                p1, p2 = self._piece(prev, remaining[i]), self._piece(prev, remaining[j])
+                if codes[i] == BOMB: events.append(BombEvent("bomb", timestamp, p1, p2, p2.board_coords))
+                elif codes[j] == BOMB: events.append(BombEvent("bomb", timestamp, p2, p1, p1.board_coords))
+                else: events.append(TradeEvent("trade", timestamp, p1, p2, p2.board_coords))
+            remaining = remaining[~used]
+
+        # 3. 进攻失败：找它够得着的、能吃掉它的敌方棋子中最近的一个
+        if len(remaining):
+            filled = curr["piece"] > 0
+            occupied = np.flatnonzero(filled)
+            codes = curr["piece"][occupied]; ranks = RANK_BY_CODE[codes]; teams = curr_team[occupied]
+            for node in remaining:
+                victim_code = int(prev["piece"][node]); victim_rank = int(RANK_BY_CODE[victim_code])
+                winners = (teams >= 0) & (prev_team[node] >= 0) & (teams != prev_team[node]) & (codes != BOMB)
+                winners &= (ranks > victim_rank) | ((codes == MINE) & (victim_code != ENGINEER))
+                victim = self._piece(prev, node)
+                candidates = [int(n) for n in occupied[winners]
+                              if ADJACENT[node, n] or rail_reachable(int(node), int(n), filled, victim_code == ENGINEER)]
+                if not candidates:
+                    events.append(LandmineEvent("landmine", timestamp, victim, victim.board_coords)); continue
+                candidates = np.array(candidates)
+                winner = int(candidates[np.argmin(np.linalg.norm(NODE_XY[candidates] - NODE_XY[node], axis=1))])
+                if curr["piece"][winner] == MINE:
+                    events.append(LandmineEvent("landmine", timestamp, victim, victim.board_coords))
+                else:
+                    attacker = self._piece(curr, winner)
+                    events.append(CaptureEvent("capture", timestamp, attacker, victim, attacker.board_coords))
+
+        # 4. 普通移动
+        for src, dst in zip(diff.moved_from[~consumed_moves], diff.moved_to[~consumed_moves]):
+            events.append(MoveEvent("move", timestamp, self._piece(curr, dst), NODE_KEYS[src][1:], NODE_KEYS[dst][1:]))
+        return events
+
@@ -0,0 +1,215 @@
+"""
+帧来源模块
+统一的 FrameSource 接口 (拉取式 read() 与迭代器)，实现包括:
+- WindowFrameSource: 现有的 win32 游戏窗口截图
+- DirectoryFrameSource: 图片目录
+- VideoFrameSource: 视频文件 (cv2.VideoCapture)
+- ReplaySource: 带时间戳的录制会话，可按真实速度或最大速度回放
+"""
+import json
+import re
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp")
+SESSION_MANIFEST = "session.json"
+
+
+@dataclass
+class Frame:
+    image: np.ndarray
+    timestamp: float  # 采集时间 (秒)；实时来源为 time.time()，回放来源为录制时的时间戳
+    index: int
+    source: str = ""
+
+
+def _imread(path: Path) -> Optional[np.ndarray]:
+    # 使用 imdecode 以正确处理中文路径
+    return cv2.imdecode(np.fromfile(str(path), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class FrameSource(ABC):
+    """
+    帧来源基类
+    - read(): 拉取下一帧；暂时取不到帧时返回 None
+    - exhausted: 有限来源读完后为 True，迭代随之结束；实时来源永远为 False
+    """
+    is_live = False
+    retry_interval = 0.05  # 实时来源取帧失败后的重试间隔 (秒)
+
+    def __init__(self):
+        self._index = 0
+        self.exhausted = False
+
+    @abstractmethod
+    def _grab(self) -> Optional[Tuple[np.ndarray, float, str]]:
+        """返回 (图像, 时间戳, 来源描述)；没有帧时返回 None"""
+
+    def read(self) -> Optional[Frame]:
+        if self.exhausted: return None
+        grabbed = self._grab()
+        if grabbed is None: return None
+        image, timestamp, source = grabbed
+        frame = Frame(image, timestamp, self._index, source)
+        self._index += 1
+        return frame
+
+    def __iter__(self) -> Iterator[Frame]:
+        while not self.exhausted:
+            frame = self.read()
+            if frame is not None:
+                yield frame
+            elif self.is_live:
+                time.sleep(self.retry_interval)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "FrameSource":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class WindowFrameSource(FrameSource):
+    """包装 WindowCapture；win32 依赖只在使用时导入"""
+    is_live = True
+
+    def __init__(self, window_capture=None, process_name: str = "JunQiRpg.exe", title_substring: str = "四国军棋"):
+        super().__init__()
+        if window_capture is None:
+            from app.utils.capture import WindowCapture
+            window_capture = WindowCapture(process_name, title_substring)
+        self.window_capture = window_capture
+
+    def _grab(self) -> Optional[Tuple[np.ndarray, float, str]]:
+        image = self.window_capture.get_screenshot()
+        if image is None or image.size == 0: return None
+        return image, time.time(), f"hwnd:{self.window_capture.hwnd}"
+
+
+class DirectoryFrameSource(FrameSource):
+    """按文件名顺序读取目录中的图片；loop=True 时循环播放 (用于压测)"""
+
+    def __init__(self, directory: str, loop: bool = False, preload: bool = False):
+        super().__init__()
+        self.directory = Path(directory)
+        self.paths: List[Path] = sorted(p for p in self.directory.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        self.loop = loop
+        self._cache = {p: _imread(p) for p in self.paths} if preload else None
+        self._pos = 0
+        if not self.paths: self.exhausted = True
+
+    def _grab(self) -> Optional[Tuple[np.ndarray, float, str]]:
+        for _ in range(len(self.paths)):
+            if self._pos >= len(self.paths):
+                if not self.loop: break
+                self._pos = 0
+            path = self.paths[self._pos]
+            self._pos += 1
+            image = self._cache[path] if self._cache is not None else _imread(path)
+            if image is not None:
+                return image, time.time(), str(path)
+        self.exhausted = True
+        return None
+
+
+class VideoFrameSource(FrameSource):
+    """通过 cv2.VideoCapture 逐帧读取视频文件，时间戳取自视频时间轴"""
+
+    def __init__(self, path: str, loop: bool = False):
+        super().__init__()
+        self.path = str(path)
+        self.loop = loop
+        self.capture = cv2.VideoCapture(self.path)
+        if not self.capture.isOpened():
+            raise IOError(f"无法打开视频文件: {self.path}")
+
+    def _grab(self) -> Optional[Tuple[np.ndarray, float, str]]:
+        ok, image = self.capture.read()
+        if not ok and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, image = self.capture.read()
+        if not ok:
+            self.exhausted = True
+            return None
+        return image, self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, self.path
+
+    def close(self) -> None:
+        self.capture.release()
+
+
+def _timestamp_from_name(path: Path) -> Optional[float]:
+    """从 screenshot_YYYYmmddHHMMSS.png 形式的文件名解析时间戳"""
+    m = re.search(r"(\d{14})", path.stem)
+    if not m: return None
+    return time.mktime(time.strptime(m.group(1), "%Y%m%d%H%M%S"))
+
+
+class ReplaySource(FrameSource):
+    """
+    回放录制的会话目录
+    - 目录下有 session.json ([{"file": ..., "timestamp": ...}, ...]) 时按清单回放；
+      否则按文件名排序，时间戳从文件名解析，解析不到时按 1 秒间隔
+    - speed: 1.0 为真实速度，2.0 为两倍速；None 或 0 表示不等待、以最大速度回放
+    """
+
+    def __init__(self, directory: str, speed: Optional[float] = 1.0):
+        super().__init__()
+        self.directory = Path(directory)
+        self.speed = speed
+        self.entries = self._load_entries()
+        self._pos = 0
+        self._wall_start: Optional[float] = None
+        if not self.entries: self.exhausted = True
+
+    def _load_entries(self) -> List[Tuple[Path, float]]:
+        manifest = self.directory / SESSION_MANIFEST
+        if manifest.exists():
+            with open(manifest, "r", encoding="utf-8") as f:
+                return [(self.directory / e["file"], float(e["timestamp"])) for e in json.load(f)]
+        paths = sorted(p for p in self.directory.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        entries = []
+        for i, p in enumerate(paths):
+            ts = _timestamp_from_name(p)
+            entries.append((p, ts if ts is not None else float(i)))
+        return entries
+
+    def _grab(self) -> Optional[Tuple[np.ndarray, float, str]]:
+        while self._pos < len(self.entries):
+            path, ts = self.entries[self._pos]
+            self._pos += 1
+            if self.speed:
+                t0 = self.entries[0][1]
+                if self._wall_start is None: self._wall_start = time.perf_counter()
+                delay = (ts - t0) / self.speed - (time.perf_counter() - self._wall_start)
+                if delay > 0: time.sleep(delay)
+            image = _imread(path)
+            if image is not None:
+                return image, ts, str(path)
+        self.exhausted = True
+        return None
+
+
+def record_session(source: FrameSource, directory: str, max_frames: Optional[int] = None) -> int:
+    """把任意帧来源录制为可被 ReplaySource 回放的会话目录，返回录制的帧数"""
+    out = Path(directory)
+    out.mkdir(parents=True, exist_ok=True)
+    entries = []
+    for frame in source:
+        name = f"frame_{frame.index:06d}.png"
+        ok, buf = cv2.imencode(".png", frame.image)
+        if not ok: continue
+        buf.tofile(str(out / name))
+        entries.append({"file": name, "timestamp": frame.timestamp})
+        if max_frames is not None and len(entries) >= max_frames: break
+    with open(out / SESSION_MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2)
+    return len(entries)
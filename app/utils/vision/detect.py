@@ -1,144 +1,69 @@
 """
 模板匹配与检测流程模块
 实现棋子检测、模板匹配和OCR二次确认功能
+
+ClaheDetector 是与 GameAnalyzer 接口一致的另一套识别引擎 (引擎注册名 "clahe"):
+- 整帧只做一次灰度 + 归一化 + CLAHE，所有模板都在这一张增强灰度图上匹配，不按颜色逐一掩膜
+- 灰度下不同颜色的同名棋子几乎相同，因此每个 (棋子, 方向) 只匹配一个代表模板，
+  颜色由 NMS 之后检测框内的颜色标签多数决定
+- detect_stride > 1 时先在按步长缩小的图上粗匹配，再只在粗候选周围 ±stride 的窗口内做全分辨率复核
 """
+from dataclasses import dataclass
 from typing import List, Dict, Any, Tuple, Optional
 import cv2
 import numpy as np
 import os
-from pathlib import Path
 
-from src.vision.utils import (
-    preprocess_image, enhance_contrast, remove_noise,
-    adaptive_threshold, morphological_operations, non_max_suppression,
-    extract_cell_image, resize_with_aspect_ratio
+from app.utils.vision.utils import (
+    preprocess_image, enhance_contrast, non_max_suppression_arrays, extract_cell_image
 )
-from src.vision.templates_manager import TemplatesManager
-from src.vision.ocr import confirm_label_by_ocr, OCREngine
-from src.board.coordinate_manager import CoordinateManager
+from app.utils.vision.templates_manager import Template, TemplatesManager
+from app.utils.vision.ocr import confirm_label_by_ocr, OCREngine, OCRService
+from app.utils.vision.matching import extract_peaks, peak_radius
+from app.utils.vision.segmentation import ColorSegmenter
+from app.services.board_lattice import BoardLattice
+from app.services.game_analyzer import CN_TO_EN_MAP, HSV_COLOR_RANGES, DetectionResult, format_report
+from app.services.metrics import StageMetrics
+from app.services.region_finder import regions_agree, regions_from_labels, regions_from_points
 
 Detection = Dict[str, Any]  # {"position_key":str,"type":str|"unknown","color":str|None,
                            #  "confidence":float,"bbox":[x,y,w,h]}
 
-
-def detect_pieces(board_img: np.ndarray, config: dict,
-                templates_manager: Optional[TemplatesManager] = None,
-                ocr_engine: Optional[OCREngine] = None,
-                coord_manager: Optional[CoordinateManager] = None) -> List[Detection]:
-    """
-    检测棋盘上的棋子
-
-    Args:
-        board_img: 棋盘区域图像 (BGR格式)
-        config: 配置字典
-        templates_manager: 模板管理器实例
-        ocr_engine: OCR引擎实例
-        coord_manager: 坐标管理器实例
-
-    Returns:
-        检测到的棋子列表
-    """
-    if templates_manager is None:
-        templates_manager = TemplatesManager(config.get('template_dir', ''))
-    
-    if coord_manager is None:
-        map_path = Path(__file__).parent.parent / "board" / "new_coordinate_map.json"
-        coord_manager = CoordinateManager(map_path)
-
-    # 获取配置参数
-    match_threshold = config.get('match_threshold', 0.78)
-    nms_iou = config.get('nms_iou', 0.35)
-    detect_stride = config.get('detect_stride', 1)
-    ocr_enabled = config.get('ocr', {}).get('enable', True)
-
-    # 预处理图像
-    gray_img = preprocess_image(board_img, method='grayscale', normalize=True)
-    enhanced_img = enhance_contrast(gray_img, method='clahe')
-
-    # 获取所有模板
-    templates = templates_manager.get_all_templates()
-    if not templates:
-        return []
-
-    # 模板匹配
-    all_detections = []
-
-    for template in templates:
-        template_img = template.image
-        color = template.color
-        piece_type = template.piece
-
-        # 调整模板大小（如果需要）
-        if template_img.shape[0] > enhanced_img.shape[0] or \
-           template_img.shape[1] > enhanced_img.shape[1]:
-            continue
-
-        # 执行模板匹配
-        matches = _template_match(enhanced_img, template_img,
-                               match_threshold, detect_stride)
-
-        for match in matches:
-            x, y, w, h, score = match
-            detection = {
-                'position_key': None,  # 待映射
-                'type': piece_type,
-                'color': color,
-                'confidence': score,
-                'bbox': [x, y, w, h],
-                'template_piece': piece_type,
-                'template_color': color
-            }
-            all_detections.append(detection)
-
-    # 非极大值抑制
-    if all_detections:
-        boxes = [(d['bbox'][0], d['bbox'][1],
-                 d['bbox'][0] + d['bbox'][2],
-                 d['bbox'][1] + d['bbox'][3])
-                for d in all_detections]
-        scores = [d['confidence'] for d in all_detections]
-
-        keep_indices = non_max_suppression(boxes, scores, nms_iou)
-        filtered_detections = [all_detections[i] for i in keep_indices]
-    else:
-        filtered_detections = []
-
-    # 映射到逻辑坐标
-    mapped_detections = []
-    
-    for detection in filtered_detections:
-        # 计算检测框中心点
-        x, y, w, h = detection['bbox']
-        center_x = x + w // 2
-        center_y = y + h // 2
-
-        # 映射到逻辑坐标
-        position_key = coord_manager.find_nearest_position(center_x, center_y)
-
-        # 检查是否在有效范围内
-        if position_key:
-            detection['position_key'] = position_key
-
-            # OCR二次确认（如果需要）
-            if ocr_enabled and ocr_engine:
-                cell_img = extract_cell_image(board_img, detection['bbox'])
-                final_type, final_confidence = confirm_label_by_ocr(
-                    cell_img, detection['type'], ocr_engine)
-
-                if final_type != detection['type']:
-                    detection['type'] = final_type
-                    detection['confidence'] = final_confidence
-                    detection['ocr_confirmed'] = True
-                else:
-                    detection['ocr_confirmed'] = False
-
-            mapped_detections.append(detection)
-
-    return mapped_detections
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "match_threshold": 0.78,
+    "nms_iou": 0.35,
+    "detect_stride": 1,
+    "stride_slack": 0.12,   # 粗匹配阈值 = 阈值 - stride_slack
+    "top_k": 64,            # 每个代表模板保留的峰值数 (代表模板覆盖所有颜色)
+    "min_color_fraction": 0.2,  # 检测框内颜色像素占比低于该值时保留代表模板的颜色
+    "labels_tolerance": 8,  # labels 法求得的分区与锁定分区的边界相差超过该值 (像素) 即不采用
+    "ocr": {"enable": False},
+}
+
+
+@dataclass
+class _TemplateGroup:
+    """同一 (棋子, 方向) 的各颜色模板；gray 为代表模板的灰度图"""
+    gray: np.ndarray
+    representative: Template
+    by_color: Dict[str, Template]
+
+
+def _group_templates(templates: List[Template]) -> List[_TemplateGroup]:
+    groups: Dict[Tuple[str, str], _TemplateGroup] = {}
+    for t in sorted(templates, key=lambda t: (t.piece_type, t.orientation, t.color, t.index)):
+        key = (t.piece_type, t.orientation)
+        if key not in groups:
+            # 模板只做灰度归一化；TM_CCOEFF_NORMED 对亮度的仿射变化不敏感
+            gray = preprocess_image(np.ascontiguousarray(t.image), method='grayscale', normalize=True)
+            groups[key] = _TemplateGroup(gray, t, {})
+        groups[key].by_color.setdefault(t.color, t)
+    return list(groups.values())
 
 
 def _template_match(img: np.ndarray, template: np.ndarray,
-                  threshold: float, stride: int = 1) -> List[Tuple[int, int, int, int, float]]:
+                  threshold: float, stride: int = 1, top_k: int = 16,
+                  small_img: Optional[np.ndarray] = None, slack: float = 0.12) -> List[Tuple[int, int, int, int, float]]:
     """
     执行模板匹配
 
@@ -146,7 +71,10 @@ def _template_match(img: np.ndarray, template: np.ndarray,
         img: 输入图像（灰度）
         template: 模板图像（灰度）
         threshold: 匹配阈值
-        stride: 滑动步长
+        stride: 滑动步长；> 1 时先在缩小 stride 倍的图上粗匹配，再在候选周围复核
+        top_k: 最多保留的峰值数
+        small_img: 已缩小 stride 倍的输入图像 (同一帧的多个模板共用)，为空时现算
+        slack: 粗匹配阈值的放宽量
 
     Returns:
         匹配结果列表 [(x, y, w, h, score), ...]
@@ -157,18 +85,229 @@ def _template_match(img: np.ndarray, template: np.ndarray,
     if h > img_h or w > img_w:
         return []
 
+    if stride > 1 and min(h, w) // stride >= 4:
+        return _strided_match(img, template, threshold, stride, top_k, small_img, slack)
+
     # 执行模板匹配
     result = cv2.matchTemplate(img, template, cv2.TM_CCOEFF_NORMED)
 
-    # 找到所有超过阈值的匹配
-    locations = np.where(result >= threshold)
-    matches = []
+    # 只保留超过阈值的局部极大值
+    xs, ys, scores = extract_peaks(result, threshold, peak_radius((h, w)), top_k)
+    return [(int(x), int(y), w, h, float(score)) for x, y, score in zip(xs, ys, scores)]
+
+
+def downsample(img: np.ndarray, stride: int) -> np.ndarray:
+    """按步长缩小 (INTER_AREA 等价于对 stride x stride 的块取均值)"""
+    return cv2.resize(img, (img.shape[1] // stride, img.shape[0] // stride), interpolation=cv2.INTER_AREA)
+
+
+def _strided_match(img: np.ndarray, template: np.ndarray, threshold: float, stride: int, top_k: int,
+                   small_img: Optional[np.ndarray], slack: float) -> List[Tuple[int, int, int, int, float]]:
+    """
+    步长搜索：相关运算量约为全分辨率的 1 / stride^4 (图像与模板各缩小 stride^2 倍)，
+    再加上每个候选一个 (2 * stride + 1)^2 窗口的复核
+    """
+    h, w = template.shape[:2]
+    img_h, img_w = img.shape[:2]
+    small_img = downsample(img, stride) if small_img is None else small_img
+    small_tmpl = downsample(template, stride)
+    if small_tmpl.shape[0] > small_img.shape[0] or small_tmpl.shape[1] > small_img.shape[1]: return []
+    coarse = cv2.matchTemplate(small_img, small_tmpl, cv2.TM_CCOEFF_NORMED)
+    xs, ys, _ = extract_peaks(coarse, threshold - slack, peak_radius(small_tmpl.shape), top_k)
+
+    found: Dict[Tuple[int, int], float] = {}
+    for cx, cy in zip(xs, ys):
+        px, py = int(cx) * stride, int(cy) * stride
+        x1, y1 = max(0, px - stride), max(0, py - stride)
+        x2, y2 = min(img_w - w, px + stride), min(img_h - h, py + stride)
+        if x2 < x1 or y2 < y1: continue
+        result = cv2.matchTemplate(img[y1:y2 + h, x1:x2 + w], template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (dx, dy) = cv2.minMaxLoc(result)
+        if score >= threshold:
+            key = (x1 + int(dx), y1 + int(dy))
+            found[key] = max(found.get(key, -1.0), float(score))
+    return [(x, y, w, h, score) for (x, y), score in found.items()]
+
+
+class ClaheDetector:
+    """
+    CLAHE 单灰度图识别引擎，对外接口与 GameAnalyzer 一致:
+    analyze_screenshot / set_locked_regions / get_player_regions / enable_metrics / stats / close / last_match_stats
+    """
+
+    def __init__(self, templates_path: str, config: Optional[dict] = None,
+                 templates_manager: Optional[TemplatesManager] = None,
+                 color_ranges: Optional[Dict] = None, ocr_engine=None):
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.tm = templates_manager or TemplatesManager(templates_path)
+        self.hsv_color_ranges = color_ranges or HSV_COLOR_RANGES
+        self.segmenter = ColorSegmenter(self.hsv_color_ranges)
+        self.groups = _group_templates(self.tm.get_all_templates())
+        self.cn_to_en_map = dict(CN_TO_EN_MAP)
+        self.ocr_engine = ocr_engine  # OCREngine (逐个确认) 或 OCRService (整帧批量确认)
+        self.lattice: Optional[BoardLattice] = None
+        self.metrics = StageMetrics(enabled=False)
+        self.last_match_stats: Dict[str, int] = {}
+
+    # --- 与 GameAnalyzer 一致的接口 ---
+    def set_locked_regions(self, locked_regions) -> None:
+        self.lattice = BoardLattice(locked_regions) if locked_regions else None
+
+    def enable_metrics(self, enabled: bool = True, dump_path: Optional[str] = None, dump_interval: float = 10.0) -> None:
+        self.metrics = StageMetrics(enabled=enabled, dump_path=dump_path, dump_interval=dump_interval)
+
+    def stats(self) -> Dict[str, Dict]:
+        return self.metrics.stats()
+
+    def close(self) -> None:
+        pass
+
+    def analyze_screenshot(self, screenshot: np.ndarray, match_threshold: float = 0.8,
+                           return_detections: bool = False, mode: Optional[str] = None,
+                           origin: Tuple[int, int] = (0, 0)) -> Any:
+        """mode 仅为与 GameAnalyzer 保持签名一致，本引擎只有一条识别路径；origin 为子图在窗口中的偏移"""
+        metrics = self.metrics
+        with metrics.timer("frame_total"):
+            detections = [DetectionResult(d['template'], (d['bbox'][0], d['bbox'][1]), d['confidence'])
+                          for d in self.detect(screenshot, match_threshold, origin)]
+            metrics.count("detections", len(detections))
+            if return_detections:
+                result = detections
+            else:
+                with metrics.timer("report"): result = self._format_report(detections, screenshot.shape)
+        metrics.end_frame()
+        return result
+
+    def _format_report(self, detections: List[DetectionResult], image_shape: Tuple[int, ...]) -> str:
+        return format_report(detections, image_shape, self.cn_to_en_map)
+
+    def get_player_regions(self, screenshot: np.ndarray, match_threshold: float = 0.7, method: str = "detections"):
+        """与 GameAnalyzer.get_player_regions 相同：labels 法只在已锁定分区附近使用，与之不符时退回检测结果"""
+        if method == "labels" and self.lattice is not None:
+            reference = self.lattice.locked_regions
+            shapes = np.array([g.gray.shape[:2] for g in self.groups if g.representative.color != 'neutral'])
+            piece_size = (int(np.median(shapes.min(axis=1))), int(np.median(shapes.max(axis=1))))
+            regions = regions_from_labels(self.segmenter.segment(screenshot), reference, piece_size, self.config['labels_tolerance'])
+            if regions_agree(regions, reference, self.config['labels_tolerance']): return regions
+        detections = self.analyze_screenshot(screenshot, match_threshold, return_detections=True)
+        if len(detections) < 4: return {}
+        points = np.array([((d.bbox[0] + d.bbox[2]) / 2, (d.bbox[1] + d.bbox[3]) / 2)
+                           for d in detections if d.template.color != 'neutral'])
+        return regions_from_points(points)
+
+    # --- 识别 ---
+    def detect(self, board_img: np.ndarray, match_threshold: Optional[float] = None,
+               origin: Tuple[int, int] = (0, 0)) -> List[Detection]:
+        cfg = self.config
+        threshold = cfg['match_threshold'] if match_threshold is None else match_threshold
+        stride = max(1, int(cfg['detect_stride']))
+        metrics = self.metrics
+
+        # 预处理图像
+        with metrics.timer("clahe"):
+            gray_img = preprocess_image(board_img, method='grayscale', normalize=True)
+            enhanced_img = enhance_contrast(gray_img, method='clahe')
+            small_img = downsample(enhanced_img, stride) if stride > 1 else None
+
+        # 模板匹配：每个 (棋子, 方向) 一个代表模板
+        boxes, scores, owners = [], [], []
+        with metrics.timer("match"):
+            for g, group in enumerate(self.groups):
+                for x, y, w, h, score in _template_match(enhanced_img, group.gray, threshold, stride, cfg['top_k'],
+                                                         small_img, cfg['stride_slack']):
+                    boxes.append((x, y, x + w, y + h)); scores.append(score); owners.append(g)
+        self.last_match_stats = {"representative_templates": len(self.groups), "raw_candidates": len(scores),
+                                 "detect_stride": stride}
+        if not scores: return []
+
+        # 非极大值抑制
+        with metrics.timer("nms"):
+            keep = non_max_suppression_arrays(np.array(boxes), np.array(scores), cfg['nms_iou'])
+
+        # 颜色：检测框内的颜色标签多数
+        with metrics.timer("color"):
+            labels = self.segmenter.segment(board_img).labels
+            detections = []
+            for i in keep:
+                group = self.groups[owners[i]]
+                x1, y1, x2, y2 = boxes[i]
+                template = self._colored(group, labels[y1:y2, x1:x2])
+                detections.append({
+                    'position_key': None,
+                    'type': template.piece_type,
+                    'color': template.color,
+                    'confidence': float(scores[i]),
+                    'bbox': [x1, y1, x2 - x1, y2 - y1],
+                    'template': template,
+                    'template_piece': template.piece_type,
+                    'template_color': template.color,
+                })
+
+        if self.lattice is not None: self._assign_positions(detections, origin)
+        if cfg.get('ocr', {}).get('enable', False) and self.ocr_engine is not None:
+            with metrics.timer("ocr"): self._confirm_by_ocr(board_img, detections)
+        return detections
+
+    def _colored(self, group: _TemplateGroup, label_patch: np.ndarray) -> Template:
+        """按检测框内颜色标签的多数选出该颜色的模板；中性模板或颜色像素过少时保留代表模板"""
+        if group.representative.color == 'neutral' or label_patch.size == 0: return group.representative
+        counts = np.bincount(label_patch.reshape(-1), minlength=len(self.segmenter.colors) + 1)[1:]
+        if counts.sum() < self.config['min_color_fraction'] * label_patch.size: return group.representative
+        color = self.segmenter.colors[int(np.argmax(counts))]
+        return group.by_color.get(color, group.representative)
+
+    def _assign_positions(self, detections: List[Detection], origin: Tuple[int, int] = (0, 0)) -> None:
+        """映射到逻辑坐标：最近的理论节点 (窗口坐标，子图的检测先加上 origin)，中心偏离超过半个格子的检测丢弃其位置"""
+        if not detections: return
+        centers = np.array([(d['bbox'][0] + d['bbox'][2] / 2 + origin[0], d['bbox'][1] + d['bbox'][3] / 2 + origin[1])
+                            for d in detections])
+        offsets = np.abs(centers[:, None, :] - self.lattice.centers[None, :, :])
+        nearest = np.argmin((offsets ** 2).sum(axis=2), axis=1)
+        inside = (offsets[np.arange(len(detections)), nearest] <= self.lattice.cell_sizes[nearest] / 2).all(axis=1)
+        for d, node_index, ok in zip(detections, nearest, inside):
+            if not ok: continue
+            node = self.lattice.nodes[int(node_index)]
+            d['position_key'] = f"{node.region}:{node.row},{node.col}"
+
+    def _confirm_by_ocr(self, board_img: np.ndarray, detections: List[Detection]) -> None:
+        """OCR二次确认：OCRService 时整帧一批，否则逐个调用；OCR 文本按 cn_to_en_map 换成模板的 piece_type 命名"""
+        cells = [extract_cell_image(board_img, d['bbox']) for d in detections]
+        if isinstance(self.ocr_engine, OCRService):
+            results = self.ocr_engine.confirm_labels(cells, [d['type'] for d in detections], mapping=self.cn_to_en_map)
+        else:
+            results = [confirm_label_by_ocr(cell, d['type'], self.ocr_engine, self.cn_to_en_map)
+                       for cell, d in zip(cells, detections)]
+        for detection, (final_type, final_confidence) in zip(detections, results):
+            if final_type != detection['type']:
+                detection['type'] = final_type
+                detection['confidence'] = final_confidence
+                detection['ocr_confirmed'] = True
+            else:
+                detection['ocr_confirmed'] = False
 
-    for pt in zip(*locations[::-1]):  # 切换为 (x, y) 顺序
-        score = result[pt[1], pt[0]]
-        matches.append((pt[0], pt[1], w, h, float(score)))
 
-    return matches
+def detect_pieces(board_img: np.ndarray, config: dict,
+                templates_manager: Optional[TemplatesManager] = None,
+                ocr_engine: Optional[OCREngine] = None,
+                lattice: Optional[BoardLattice] = None) -> List[Detection]:
+    """
+    检测棋盘上的棋子 (函数式入口，每次调用都会构建 ClaheDetector；连续识别请直接复用 ClaheDetector)
+
+    Args:
+        board_img: 棋盘区域图像 (BGR格式)
+        config: 配置字典；config["ocr"]["enable"] 为 True 且提供 ocr_engine 时才做 OCR 二次确认 (默认关闭)
+        templates_manager: 模板管理器实例
+        ocr_engine: OCR引擎实例 (OCREngine 或 OCRService)
+        lattice: 理论节点网格，提供时为检测结果填写 position_key，并丢弃不在任何格子内的检测
+
+    Returns:
+        检测到的棋子列表
+    """
+    detector = ClaheDetector(config.get('template_dir', ''), config, templates_manager, ocr_engine=ocr_engine)
+    detector.lattice = lattice
+    detections = detector.detect(board_img)
+    if lattice is not None: detections = [d for d in detections if d['position_key']]
+    return detections
 
 
 def _parse_template_name(template_name: str) -> Tuple[Optional[str], str]:
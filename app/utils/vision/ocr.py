@@ -1,15 +1,25 @@
 """
 PaddleOCR 封装模块
+- OCREngine: 单张图像的完整 OCR (检测 + 方向分类 + 识别)，以及只做识别的批量接口
+- OCRService: 独立工作线程中只加载一次模型，把一帧内所有待确认的格子合并为一批做纯识别，
+  并按归一化格子图像的哈希缓存结果，同一棋子字形重复出现时不再推理
 """
-from typing import Optional, Tuple
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
 import numpy as np
 import cv2
-from paddleocr import PaddleOCR
+
+REC_IMAGE_HEIGHT = 48     # PaddleOCR 识别模型的输入高度
+CACHE_KEY_SIZE = 24       # 缓存键使用的归一化边长
 
 
 class OCREngine:
     def __init__(self, lang: str = "ch", use_gpu: bool = False,
-                 det_limit_side_len: int = 960, rec_batch_size: int = 8):
+                 det_limit_side_len: int = 960, rec_batch_size: int = 8, use_angle_cls: bool = True):
         """
         初始化 PaddleOCR 引擎
 
@@ -18,16 +28,19 @@ class OCREngine:
             use_gpu: 是否使用 GPU
             det_limit_side_len: 检测边长限制
             rec_batch_size: 识别批处理大小
+            use_angle_cls: 是否加载方向分类模型 (只做纯识别时可关闭)
         """
         self.lang = lang
         self.use_gpu = use_gpu
         self.det_limit_side_len = det_limit_side_len
         self.rec_batch_size = rec_batch_size
+        self.use_angle_cls = use_angle_cls
 
-        # 初始化 PaddleOCR
+        # 初始化 PaddleOCR (延迟导入：paddle 体积大，只在实际使用 OCR 时加载)
         try:
+            from paddleocr import PaddleOCR
             self.ocr = PaddleOCR(
-                use_angle_cls=True,
+                use_angle_cls=use_angle_cls,
                 lang=lang,
                 det=True,
                 det_limit_side_len=det_limit_side_len,
@@ -100,7 +113,7 @@ class OCREngine:
             processed = self._preprocess_image(roi_image)
 
             # 执行 OCR
-            result = self.ocr.ocr(processed, cls=True)
+            result = self.ocr.ocr(processed, cls=self.use_angle_cls)
 
             if not result or not result[0]:
                 return "", 0.0
@@ -124,9 +137,81 @@ class OCREngine:
             print(f"⚠️ OCR 识别失败: {e}")
             return "", 0.0
 
+    @staticmethod
+    def prepare_for_recognition(image: np.ndarray) -> np.ndarray:
+        """
+        纯识别的输入：灰度后等比缩放到识别模型的输入高度，再转回三通道。
+        不做二值化，识别模型本身在灰度文字行上训练，二值化反而丢失笔画边缘。
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        h, w = gray.shape[:2]
+        width = max(REC_IMAGE_HEIGHT // 2, int(round(w * REC_IMAGE_HEIGHT / max(h, 1))))
+        resized = cv2.resize(gray, (width, REC_IMAGE_HEIGHT), interpolation=cv2.INTER_AREA if h > REC_IMAGE_HEIGHT else cv2.INTER_CUBIC)
+        return cv2.cvtColor(resized, cv2.COLOR_GRAY2BGR)
+
+    def recognize_batch(self, images: Sequence[np.ndarray]) -> List[Tuple[str, float]]:
+        """
+        只做文字识别 (跳过文本检测与方向分类)，一次推理整批图像；
+        PaddleOCR 内部按 rec_batch_size 分组。每张图像应是已裁好的单个棋子格子。
+        """
+        if self.ocr is None or not images: return [("", 0.0)] * len(images)
+        prepared = [self.prepare_for_recognition(img) for img in images]
+        try:
+            recognizer = getattr(self.ocr, "text_recognizer", None)
+            if recognizer is not None:
+                rec_res, _ = recognizer(prepared)
+            else:
+                rec_res = [(r[0][0] if r and r[0] else ("", 0.0)) for r in
+                           (self.ocr.ocr(img, det=False, cls=False) for img in prepared)]
+            return [(str(text).strip(), float(score)) for text, score in rec_res]
+        except Exception as e:
+            print(f"⚠️ OCR 批量识别失败: {e}")
+            return [("", 0.0)] * len(images)
+
+
+# 军棋棋子名称映射
+PIECE_MAPPING: Dict[str, str] = {
+    "司令": "commander",
+    "军长": "army_commander",
+    "师长": "division_commander",
+    "旅长": "brigade_commander",
+    "团长": "regiment_commander",
+    "营长": "battalion_commander",
+    "连长": "company_commander",
+    "排长": "platoon_commander",
+    "工兵": "engineer",
+    "地雷": "mine",
+    "炸弹": "bomb",
+    "军旗": "flag"
+}
+
+
+def interpret_ocr_text(ocr_text: str, ocr_confidence: float, rough_label: str,
+                       mapping: Optional[Dict[str, str]] = None) -> Tuple[str, float]:
+    """
+    由 OCR 文本与模板初判得到 (final_label, confidence)，规则与 confirm_label_by_ocr 一致；
+    mapping 为中文棋子名 -> 标签，应与 rough_label 同一套命名 (默认 PIECE_MAPPING)
+    """
+    if not ocr_text or ocr_confidence < 0.5:
+        # OCR 失败，返回模板初判结果
+        return rough_label, 0.3
+
+    # 检查 OCR 识别结果
+    for chinese_name, piece_type in (mapping or PIECE_MAPPING).items():
+        if chinese_name in ocr_text:
+            # OCR 确认成功，返回高置信度
+            return piece_type, max(ocr_confidence, 0.7)
+
+    # OCR 未识别到已知棋子，但识别到文字
+    if len(ocr_text) >= 2:
+        return rough_label, min(ocr_confidence, 0.6)
+
+    # 完全无法确认
+    return rough_label, 0.2
+
 
 def confirm_label_by_ocr(cell_img: np.ndarray, rough_label: str,
-                         ocr: OCREngine) -> Tuple[str, float]:
+                         ocr: OCREngine, mapping: Optional[Dict[str, str]] = None) -> Tuple[str, float]:
     """
     结合模板初判与 OCR 文本，返回最终类别与置信度
 
@@ -134,42 +219,139 @@ def confirm_label_by_ocr(cell_img: np.ndarray, rough_label: str,
         cell_img: 棋子图像
         rough_label: 模板匹配初判结果
         ocr: OCR 引擎实例
+        mapping: 中文棋子名 -> 标签，默认 PIECE_MAPPING
 
     Returns:
         (final_label, confidence) 最终标签和置信度
     """
     # 执行 OCR 识别
     ocr_text, ocr_confidence = ocr.read_text(cell_img)
+    return interpret_ocr_text(ocr_text, ocr_confidence, rough_label, mapping)
 
-    if not ocr_text or ocr_confidence < 0.5:
-        # OCR 失败，返回模板初判结果
-        return rough_label, 0.3
 
-    # 军棋棋子名称映射
-    piece_mapping = {
-        "司令": "commander",
-        "军长": "army_commander",
-        "师长": "division_commander",
-        "旅长": "brigade_commander",
-        "团长": "regiment_commander",
-        "营长": "battalion_commander",
-        "连长": "company_commander",
-        "排长": "platoon_commander",
-        "工兵": "engineer",
-        "地雷": "mine",
-        "炸弹": "bomb",
-        "军旗": "flag"
-    }
+def cell_cache_key(cell_img: np.ndarray) -> bytes:
+    """
+    归一化格子图像的哈希：灰度、缩放到 CACHE_KEY_SIZE 见方、量化到 16 级，
+    对亚像素抖动与轻微亮度变化不敏感，同一字形在不同帧得到相同的键
+    """
+    gray = cv2.cvtColor(cell_img, cv2.COLOR_BGR2GRAY) if cell_img.ndim == 3 else cell_img
+    small = cv2.resize(gray, (CACHE_KEY_SIZE, CACHE_KEY_SIZE), interpolation=cv2.INTER_AREA)
+    normalized = cv2.normalize(small, None, 0, 255, cv2.NORM_MINMAX)
+    return hashlib.blake2b((normalized >> 4).tobytes(), digest_size=16).digest()
 
-    # 检查 OCR 识别结果
-    for chinese_name, piece_type in piece_mapping.items():
-        if chinese_name in ocr_text:
-            # OCR 确认成功，返回高置信度
-            return piece_type, max(ocr_confidence, 0.7)
 
-    # OCR 未识别到已知棋子，但识别到文字
-    if len(ocr_text) >= 2:
-        return rough_label, min(ocr_confidence, 0.6)
+class OCRService:
+    """
+    专用工作线程中的 OCR 服务
+    - 模型在工作线程中首次使用时加载一次 (engine_factory)，分析线程不再被初始化与推理阻塞
+    - submit() 提交一帧内所有待确认的格子，返回 Future；工作线程会把排队中的多个请求合并为一批
+    - 非空的识别结果按 cell_cache_key 做 LRU 缓存，批内重复的格子也只推理一次
+    """
 
-    # 完全无法确认
-    return rough_label, 0.2
\ No newline at end of file
+    def __init__(self, engine_factory=None, cache_size: int = 4096, rec_batch_size: int = 16):
+        self.engine_factory = engine_factory or (lambda: OCREngine(rec_batch_size=rec_batch_size, use_angle_cls=False))
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._jobs: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self.engine: Optional[OCREngine] = None
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive(): return
+        self._thread = threading.Thread(target=self._run, name="ocr-service", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        if self._thread is None: return
+        self._jobs.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, cells: Sequence[np.ndarray]) -> Future:
+        """提交一批格子图像，Future 的结果为与之对齐的 [(text, confidence)]；全部命中缓存时立即完成"""
+        future: Future = Future()
+        keys = [cell_cache_key(c) for c in cells]
+        cached = self._lookup(keys)
+        if all(r is not None for r in cached):
+            future.set_result(cached); return future
+        self.start()
+        self._jobs.put((list(cells), keys, cached, future))
+        return future
+
+    def recognize(self, cells: Sequence[np.ndarray], timeout: Optional[float] = None) -> List[Tuple[str, float]]:
+        return self.submit(cells).result(timeout)
+
+    def confirm_labels(self, cells: Sequence[np.ndarray], rough_labels: Sequence[str],
+                       timeout: Optional[float] = None, mapping: Optional[Dict[str, str]] = None) -> List[Tuple[str, float]]:
+        """confirm_label_by_ocr 的批量版本"""
+        return [interpret_ocr_text(text, conf, label, mapping)
+                for (text, conf), label in zip(self.recognize(cells, timeout), rough_labels)]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "batches": self.batches, "cached": len(self._cache)}
+
+    def _lookup(self, keys: Sequence[bytes]) -> List[Optional[Tuple[str, float]]]:
+        results = []
+        with self._cache_lock:
+            for key in keys:
+                value = self._cache.get(key)
+                if value is not None:
+                    self._cache.move_to_end(key); self.hits += 1
+                results.append(value)
+        return results
+
+    def _store(self, key: bytes, value: Tuple[str, float]) -> None:
+        with self._cache_lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+
+    def _run(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None: return
+            jobs = [job]
+            # 合并排队中的请求，一次推理
+            while True:
+                try:
+                    extra = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is None:
+                    self._jobs.put(None); break
+                jobs.append(extra)
+            try:
+                self._process(jobs)
+            except Exception as e:
+                for _, _, _, future in jobs:
+                    if not future.done(): future.set_exception(e)
+
+    def _process(self, jobs: List[Tuple]) -> None:
+        if self.engine is None: self.engine = self.engine_factory()
+        pending: Dict[bytes, np.ndarray] = {}
+        for cells, keys, cached, _ in jobs:
+            for cell, key, value in zip(cells, keys, cached):
+                if value is None and key not in pending: pending[key] = cell
+        if pending:
+            # 入队之后可能已被其他批次写入缓存
+            fresh = self._lookup(list(pending))
+            pending = {k: c for (k, c), v in zip(pending.items(), fresh) if v is None}
+        recognized: Dict[bytes, Tuple[str, float]] = {}
+        if pending:
+            self.misses += len(pending); self.batches += 1
+            recognized = dict(zip(pending, self.engine.recognize_batch(list(pending.values()))))
+            # 引擎未初始化或识别失败时返回 ("", 0.0)，不写入缓存，下次出现同一字形时重新识别
+            for key, value in recognized.items():
+                if value[0]: self._store(key, value)
+        for cells, keys, cached, future in jobs:
+            results = [value if value is not None else recognized.get(key) for key, value in zip(keys, cached)]
+            missing = [i for i, r in enumerate(results) if r is None]
+            if missing:
+                # 在别的批次中识别过的格子，从缓存取
+                for i, value in zip(missing, self._lookup([keys[i] for i in missing])):
+                    results[i] = value or ("", 0.0)
+            future.set_result(results)
@@ -0,0 +1,119 @@
+"""
+颜色分割模块
+每帧只做一次 HSV 转换，通过查找表把所有颜色区间一次性映射为颜色标签图，
+再在标签图上提取棋子大小的连通块，供“先定位色块、再在色块内匹配模板”的流程使用。
+"""
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+MAX_COLORS = 8  # 颜色位掩码存放在 uint8 中
+
+
+@dataclass
+class ColorSegmentation:
+    """一帧的颜色标签图：0 表示不属于任何颜色，i + 1 表示 colors[i]"""
+    colors: Tuple[str, ...]
+    labels: np.ndarray
+
+    def code(self, color: str) -> int:
+        return self.colors.index(color) + 1
+
+    def mask(self, color: str) -> np.ndarray:
+        """该颜色的 0/255 掩膜，与 cv2.inRange 的输出格式一致"""
+        return cv2.compare(self.labels, self.code(color), cv2.CMP_EQ)
+
+    def neutral_mask(self) -> np.ndarray:
+        """不属于任何颜色的像素 (行营等中性元素)"""
+        return cv2.compare(self.labels, 0, cv2.CMP_EQ)
+
+
+@dataclass
+class Blob:
+    """单一颜色的连通块；bbox 为 (x1, y1, x2, y2)，右下角不含"""
+    color: str
+    bbox: Tuple[int, int, int, int]
+    area: int
+
+
+class ColorSegmenter:
+    """
+    HSV 各通道各建一张 256 项查找表，表项为“该值落在哪些颜色区间内”的位掩码；
+    三个通道的位掩码按位与即得到像素所属的颜色集合，再取最低位作为标签。
+    区间重叠时排在前面的颜色优先。
+    """
+
+    def __init__(self, color_ranges: Dict, colors: Optional[Sequence[str]] = None):
+        self.colors = tuple(colors if colors is not None else color_ranges)
+        if len(self.colors) > MAX_COLORS: raise ValueError(f"颜色数超过 {MAX_COLORS}，无法放入 uint8 位掩码")
+        lut = np.zeros((256, 1, 3), dtype=np.uint8)
+        values = np.arange(256)
+        for i, color in enumerate(self.colors):
+            lower, upper = color_ranges[color]['lower'], color_ranges[color]['upper']
+            for channel in range(3):
+                inside = (values >= lower[channel]) & (values <= upper[channel])
+                lut[inside, 0, channel] |= np.uint8(1 << i)
+        self._channel_lut = lut
+        # 位掩码 -> 标签：最低的置位对应的颜色
+        first_bit = np.zeros(256, dtype=np.uint8)
+        for bits in range(1, 256):
+            first_bit[bits] = (bits & -bits).bit_length()
+        self._label_lut = first_bit
+
+    def segment(self, image: np.ndarray, hsv: Optional[np.ndarray] = None) -> ColorSegmentation:
+        if hsv is None: hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        h_bits, s_bits, v_bits = cv2.split(cv2.LUT(hsv, self._channel_lut))
+        bits = cv2.bitwise_and(cv2.bitwise_and(h_bits, s_bits), v_bits)
+        return ColorSegmentation(self.colors, cv2.LUT(bits, self._label_lut))
+
+
+def find_blobs(segmentation: ColorSegmentation, min_area: Dict[str, int], min_size: int = 1,
+               close_kernel: int = 5) -> List[Blob]:
+    """
+    在标签图上逐颜色提取连通块。
+    先做一次闭运算，把被棋子文字切开的色块重新连起来；面积小于 min_area[color]
+    或短边小于 min_size 的连通块视为噪点丢弃。相邻同色棋子可能合并为一个大块，
+    由后续在块内的模板匹配把它们分开。
+    """
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (close_kernel, close_kernel)) if close_kernel > 1 else None
+    blobs: List[Blob] = []
+    for color in segmentation.colors:
+        if color not in min_area: continue
+        mask = segmentation.mask(color)
+        if kernel is not None: mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        for x, y, w, h, area in stats[1:count]:
+            if area < min_area[color] or min(w, h) < min_size: continue
+            blobs.append(Blob(color, (int(x), int(y), int(x + w), int(y + h)), int(area)))
+    return blobs
+
+
+def blob_search_window(bbox: Tuple[int, int, int, int], template_size: Tuple[int, int], padding: int,
+                       image_shape: Tuple[int, ...]) -> Tuple[int, int, int, int]:
+    """色块外扩 padding，且至少能容纳 (h, w) 的模板，并裁剪到图像范围内"""
+    x1, y1, x2, y2 = bbox
+    h, w = template_size
+    grow_x = max(padding, (w + 2 * padding - (x2 - x1) + 1) // 2)
+    grow_y = max(padding, (h + 2 * padding - (y2 - y1) + 1) // 2)
+    img_h, img_w = image_shape[:2]
+    return max(0, x1 - grow_x), max(0, y1 - grow_y), min(img_w, x2 + grow_x), min(img_h, y2 + grow_y)
+
+
+def merge_windows(windows: Sequence[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """把相交的矩形 (x1, y1, x2, y2) 反复合并为外接矩形，直到两两不相交；相邻棋子的窗口合并为一个 ROI"""
+    merged = [list(w) for w in windows]
+    changed = True
+    while changed:
+        changed = False
+        out: List[List[int]] = []
+        for w in merged:
+            for o in out:
+                if w[0] < o[2] and o[0] < w[2] and w[1] < o[3] and o[1] < w[3]:
+                    o[0], o[1], o[2], o[3] = min(o[0], w[0]), min(o[1], w[1]), max(o[2], w[2]), max(o[3], w[3])
+                    changed = True
+                    break
+            else:
+                out.append(w)
+        merged = out
+    return [tuple(w) for w in merged]
@@ -3,14 +3,20 @@
 仅处理规范的英文文件名: {color}_{piece}_{position}_{index}.png
 """
 import cv2
+import json
+import os
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Sequence
 import logging
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
+# 解码后模板缓存的格式版本；缓存布局变化时递增，旧缓存自动失效
+TEMPLATE_CACHE_VERSION = 1
+TEMPLATE_CACHE_DIR = ".template_cache"
+
 @dataclass
 class Template:
     """最终版的模板数据类"""
@@ -24,15 +30,225 @@ class Template:
     filename: str
     orientation: str = "horizontal"  # 默认方向
 
+@dataclass
+class TemplateBank:
+    """
+    预编译模板库 (加载时一次性构建，之后只读)
+    - 所有模板按 (N, H_max, W_max) 左上对齐填充，连续存放；真实尺寸见 shapes
+    - 颜色/棋子/方向均以整数 id 存储，名称通过对应的查找表还原
+    """
+    names: List[str]
+    colors: Tuple[str, ...]
+    piece_types: Tuple[str, ...]
+    orientations: Tuple[str, ...]
+    gray: np.ndarray             # (N, H, W) uint8，颜色掩膜后的灰度模板
+    masks: np.ndarray            # (N, H, W) uint8，颜色掩膜
+    shapes: np.ndarray           # (N, 2) int32，每个模板的真实 (h, w)
+    color_ids: np.ndarray        # (N,) int16
+    piece_ids: np.ndarray        # (N,) int16
+    orientation_ids: np.ndarray  # (N,) int16
+    non_empty: np.ndarray        # (N,) bool，掩膜后模板是否含有有效像素
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def template(self, index: int) -> np.ndarray:
+        """返回第 index 个模板的灰度视图 (不复制)"""
+        h, w = self.shapes[index]
+        return self.gray[index, :h, :w]
+
+    def mask(self, index: int) -> np.ndarray:
+        h, w = self.shapes[index]
+        return self.masks[index, :h, :w]
+
+    def indices_for_color(self, color: str) -> np.ndarray:
+        """某颜色下所有可用于匹配的模板索引 (已排除掩膜后为空的模板)"""
+        if color not in self.colors:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero((self.color_ids == self.colors.index(color)) & self.non_empty)
+
+    def indices_for_piece(self, piece_type: str) -> np.ndarray:
+        if piece_type not in self.piece_types:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero(self.piece_ids == self.piece_types.index(piece_type))
+
+
+def compile_template_bank(templates: List[Template], color_ranges: Dict[str, Dict[str, List[int]]]) -> TemplateBank:
+    """
+    将模板预处理为只读的 TemplateBank。
+    有 HSV 颜色范围的模板做颜色掩膜后转灰度；其余 (如中立的行营) 直接转灰度，掩膜为全图。
+    """
+    templates = sorted(templates, key=lambda t: t.name)
+    colors = tuple(sorted({t.color for t in templates}))
+    piece_types = tuple(sorted({t.piece_type for t in templates}))
+    orientations = tuple(sorted({t.orientation for t in templates}))
+
+    n = len(templates)
+    max_h = max((t.image.shape[0] for t in templates), default=0)
+    max_w = max((t.image.shape[1] for t in templates), default=0)
+    gray = np.zeros((n, max_h, max_w), dtype=np.uint8)
+    masks = np.zeros((n, max_h, max_w), dtype=np.uint8)
+    shapes = np.zeros((n, 2), dtype=np.int32)
+    non_empty = np.zeros(n, dtype=bool)
+
+    for i, t in enumerate(templates):
+        h, w = t.image.shape[:2]
+        if t.color in color_ranges:
+            lower = np.array(color_ranges[t.color]['lower'])
+            upper = np.array(color_ranges[t.color]['upper'])
+            mask = cv2.inRange(cv2.cvtColor(t.image, cv2.COLOR_BGR2HSV), lower, upper)
+            masked = cv2.bitwise_and(t.image, t.image, mask=mask)
+            gray_t = cv2.cvtColor(masked, cv2.COLOR_BGR2GRAY)
+        else:
+            mask = np.full((h, w), 255, dtype=np.uint8)
+            gray_t = cv2.cvtColor(t.image, cv2.COLOR_BGR2GRAY)
+        gray[i, :h, :w] = gray_t
+        masks[i, :h, :w] = mask
+        shapes[i] = (h, w)
+        non_empty[i] = bool(gray_t.any())
+
+    bank = TemplateBank(
+        names=[t.name for t in templates],
+        colors=colors,
+        piece_types=piece_types,
+        orientations=orientations,
+        gray=gray,
+        masks=masks,
+        shapes=shapes,
+        color_ids=np.array([colors.index(t.color) for t in templates], dtype=np.int16),
+        piece_ids=np.array([piece_types.index(t.piece_type) for t in templates], dtype=np.int16),
+        orientation_ids=np.array([orientations.index(t.orientation) for t in templates], dtype=np.int16),
+        non_empty=non_empty,
+    )
+    for arr in (bank.gray, bank.masks, bank.shapes, bank.color_ids, bank.piece_ids, bank.orientation_ids, bank.non_empty):
+        arr.setflags(write=False)
+    return bank
+
+@dataclass
+class TemplateAtlas:
+    """
+    TemplateBank 的去重视图
+    - 同尺寸的唯一模板连续存放在 stacks[g] = (K, h, w) 中，尺寸见 sizes[g]
+    - 掩膜灰度几乎相同 (相关系数 >= tolerance) 的模板合并为一个唯一模板，representative 为其代表的 bank 索引
+    - expansion[u, color_id] 把唯一模板按颜色还原为具体的 bank 索引 (-1 表示该颜色没有此变体)，
+      同一唯一模板下每种颜色至多一个成员，因此还原结果唯一
+    """
+    sizes: Tuple[Tuple[int, int], ...]
+    stacks: List[np.ndarray]
+    unique_group: np.ndarray    # (U,) int16，所属尺寸组
+    unique_slot: np.ndarray     # (U,) int32，在尺寸组中的位置
+    representative: np.ndarray  # (U,) int32
+    collapsible: np.ndarray     # (U,) bool，是否为受颜色范围约束的棋子模板
+    bank_to_unique: np.ndarray  # (N,) int32，-1 表示未收录 (掩膜后为空的模板)
+    expansion: np.ndarray       # (U, n_colors) int32
+
+    def __len__(self) -> int:
+        return len(self.representative)
+
+    def template(self, unique_index: int) -> np.ndarray:
+        return self.stacks[self.unique_group[unique_index]][self.unique_slot[unique_index]]
+
+    def size(self, unique_index: int) -> Tuple[int, int]:
+        return self.sizes[self.unique_group[unique_index]]
+
+    def members(self, unique_index: int) -> np.ndarray:
+        return np.flatnonzero(self.bank_to_unique == unique_index)
+
+
+def _normalized(template: np.ndarray) -> np.ndarray:
+    v = template.astype(np.float32).reshape(-1)
+    v -= v.mean()
+    norm = np.linalg.norm(v)
+    return v / norm if norm > 0 else v
+
+
+def build_template_atlas(bank: TemplateBank, collapsible_colors: Sequence[str], tolerance: float = 0.97) -> TemplateAtlas:
+    """
+    按尺寸分组并合并近似重复的模板。
+    只有 collapsible_colors 中颜色的模板参与合并；一个模板并入与其代表相关系数最高且不低于 tolerance、
+    并且尚无同色成员的唯一模板，否则自成一个新的唯一模板。
+    仓库中同一棋子不同颜色的模板截自不同截图，掩膜灰度的相关系数只有 0.22~0.94 (不掩膜也只有 0.58 起)，
+    实际能合并的只有个别重复模板；图集主要提供按尺寸连续存放的模板栈与颜色还原表。
+    """
+    collapsible_ids = {bank.colors.index(c) for c in collapsible_colors if c in bank.colors}
+    sizes: List[Tuple[int, int]] = []
+    group_members: List[List[int]] = []  # 每个尺寸组内的唯一模板序号
+    representative: List[int] = []
+    rep_vectors: List[np.ndarray] = []
+    member_colors: List[set] = []
+    bank_to_unique = np.full(len(bank), -1, dtype=np.int32)
+
+    for index in np.flatnonzero(bank.non_empty):
+        size = tuple(int(v) for v in bank.shapes[index])
+        if size not in sizes:
+            sizes.append(size); group_members.append([])
+        group = sizes.index(size)
+        color_id = int(bank.color_ids[index])
+        vector = _normalized(bank.template(index))
+
+        target = -1
+        if color_id in collapsible_ids:
+            best = tolerance
+            for u in group_members[group]:
+                if color_id in member_colors[u] or int(bank.color_ids[representative[u]]) not in collapsible_ids: continue
+                corr = float(vector @ rep_vectors[u])
+                if corr >= best: best, target = corr, u
+        if target < 0:
+            target = len(representative)
+            representative.append(int(index)); rep_vectors.append(vector); member_colors.append(set())
+            group_members[group].append(target)
+        member_colors[target].add(color_id)
+        bank_to_unique[index] = target
+
+    unique_group = np.zeros(len(representative), dtype=np.int16)
+    unique_slot = np.zeros(len(representative), dtype=np.int32)
+    stacks = []
+    for g, members in enumerate(group_members):
+        h, w = sizes[g]
+        stacks.append(np.ascontiguousarray(np.stack([bank.template(representative[u]) for u in members])).reshape(-1, h, w))
+        unique_group[members] = g
+        unique_slot[members] = np.arange(len(members))
+
+    expansion = np.full((len(representative), len(bank.colors)), -1, dtype=np.int32)
+    for index in np.flatnonzero(bank_to_unique >= 0):
+        expansion[bank_to_unique[index], bank.color_ids[index]] = index
+    representative = np.array(representative, dtype=np.int32)
+    atlas = TemplateAtlas(
+        sizes=tuple(sizes),
+        stacks=stacks,
+        unique_group=unique_group,
+        unique_slot=unique_slot,
+        representative=representative,
+        collapsible=np.isin(bank.color_ids[representative], list(collapsible_ids)),
+        bank_to_unique=bank_to_unique,
+        expansion=expansion,
+    )
+    for arr in (*atlas.stacks, atlas.unique_group, atlas.unique_slot, atlas.representative, atlas.collapsible,
+                atlas.bank_to_unique, atlas.expansion):
+        arr.setflags(write=False)
+    return atlas
+
 class TemplatesManager:
     """
     最终版模板库管理器
     - 高效、稳定，只处理标准英文文件名
+    - 提供 color_ranges 时，加载后立即编译只读的 TemplateBank
     """
 
-    def __init__(self, template_dir: str):
+    # 近似重复模板的合并阈值 (掩膜灰度的相关系数)。合并后的变体共用代表模板的得分，
+    # 阈值放宽会直接改变 GEMM 节点分类的结果，因此只合并几乎相同的模板
+    ATLAS_TOLERANCE = 0.97
+
+    def __init__(self, template_dir: str, color_ranges: Optional[Dict[str, Dict[str, List[int]]]] = None,
+                 use_cache: bool = True):
         self.template_dir = Path(template_dir)
+        self.color_ranges = color_ranges
+        self.use_cache = use_cache
+        self.cache_dir = self.template_dir / TEMPLATE_CACHE_DIR
         self.templates: Dict[str, Template] = {}
+        self.bank: Optional[TemplateBank] = None
+        self.atlas: Optional[TemplateAtlas] = None
+        self.bank_templates: List[Template] = []
         self.load_templates()
 
     def _parse_filename(self, filename: str) -> Optional[Dict]:
@@ -69,12 +285,28 @@ class TemplatesManager:
             return None
 
     def load_templates(self) -> None:
-        """加载所有标准模板文件"""
+        """
+        加载所有标准模板文件。
+        模板目录未变化 (文件名、修改时间、大小均一致) 时直接内存映射二进制缓存，跳过逐个 PNG 解码。
+        """
         self.templates.clear()
         if not self.template_dir.is_dir():
             return
 
-        for file_path in self.template_dir.glob("*.png"):
+        files = sorted(self.template_dir.glob("*.png"))
+        key = [[p.name, st.st_mtime_ns, st.st_size] for p in files for st in [p.stat()]]
+        source = "缓存"
+        if not (self.use_cache and self._load_cache(key)):
+            source = "PNG"
+            self._decode_templates(files)
+            if self.use_cache: self._write_cache(key)
+
+        logger.info(f"模板加载完成 (来源: {source})。共加载 {len(self.templates)} 个模板。")
+        if self.color_ranges is not None:
+            self.compile_bank(self.color_ranges)
+
+    def _decode_templates(self, files: List[Path]) -> None:
+        for file_path in files:
             parsed_info = self._parse_filename(file_path.name)
             if not parsed_info:
                 logger.warning(f"文件名格式不规范，已跳过: {file_path.name}")
@@ -90,26 +322,77 @@ class TemplatesManager:
                     logger.warning(f"无法读取图片文件: {file_path.name}")
                     continue
 
-                h, w = image.shape[:2]
-                name = file_path.stem
-
-                template = Template(
-                    name=name,
-                    piece_type=parsed_info['piece_type'],
-                    color=parsed_info['color'],
-                    position=parsed_info['position'],
-                    index=parsed_info['index'],
-                    image=image,
-                    shape=(w, h),
-                    filename=file_path.name,
-                    orientation=parsed_info['position']  # 使用position作为orientation
-                )
-                self.templates[name] = template
+                self._add_template(file_path.name, parsed_info, image)
 
             except Exception as e:
                 logger.error(f"加载模板失败 {file_path.name}: {e}")
 
-        logger.info(f"模板加载完成。共加载 {len(self.templates)} 个模板。")
+    def _add_template(self, filename: str, parsed_info: Dict, image: np.ndarray) -> None:
+        h, w = image.shape[:2]
+        name = Path(filename).stem
+        self.templates[name] = Template(
+            name=name,
+            piece_type=parsed_info['piece_type'],
+            color=parsed_info['color'],
+            position=parsed_info['position'],
+            index=parsed_info['index'],
+            image=image,
+            shape=(w, h),
+            filename=filename,
+            orientation=parsed_info['position']  # 使用position作为orientation
+        )
+
+    def _load_cache(self, key: List[List]) -> bool:
+        """
+        缓存布局: index.json (版本、目录指纹、各模板的解析信息与偏移) + pixels.npy (所有 BGR 像素首尾相接)。
+        pixels.npy 以只读方式内存映射，各模板图像均为其上的视图。
+        """
+        index_path, pixels_path = self.cache_dir / "index.json", self.cache_dir / "pixels.npy"
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") != TEMPLATE_CACHE_VERSION or index.get("key") != key:
+                return False
+            pixels = np.load(pixels_path, mmap_mode="r")
+            for entry in index["entries"]:
+                offset, shape = entry["offset"], tuple(entry["shape"])
+                image = pixels[offset:offset + int(np.prod(shape))].reshape(shape)
+                self._add_template(entry["filename"], entry["parsed"], image)
+            return True
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError): logger.warning(f"模板缓存不可用，改为重新解码: {e}")
+            self.templates.clear()
+            return False
+
+    def _write_cache(self, key: List[List]) -> None:
+        entries, chunks, offset = [], [], 0
+        for t in self.templates.values():
+            image = np.ascontiguousarray(t.image)
+            entries.append({"filename": t.filename, "offset": offset, "shape": list(image.shape),
+                            "parsed": {"piece_type": t.piece_type, "color": t.color, "position": t.position, "index": t.index}})
+            chunks.append(image.reshape(-1)); offset += image.size
+        pixels = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint8)
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # 先写像素再写索引，索引文件的替换是缓存生效的标志
+            tmp_pixels = self.cache_dir / "pixels.tmp.npy"
+            np.save(tmp_pixels, pixels)
+            os.replace(tmp_pixels, self.cache_dir / "pixels.npy")
+            tmp_index = self.cache_dir / "index.tmp.json"
+            with open(tmp_index, "w", encoding="utf-8") as f:
+                json.dump({"version": TEMPLATE_CACHE_VERSION, "key": key, "entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp_index, self.cache_dir / "index.json")
+        except OSError as e:
+            logger.warning(f"写入模板缓存失败: {e}")
+
+    def compile_bank(self, color_ranges: Dict[str, Dict[str, List[int]]]) -> TemplateBank:
+        """编译模板库及其去重图集；bank_templates 与 bank 索引一一对应，用于把匹配结果还原为 Template"""
+        self.color_ranges = color_ranges
+        self.bank = compile_template_bank(list(self.templates.values()), color_ranges)
+        self.bank_templates = [self.templates[name] for name in self.bank.names]
+        self.atlas = build_template_atlas(self.bank, list(color_ranges), self.ATLAS_TOLERANCE)
+        logger.info(f"模板图集构建完成。{int(self.bank.non_empty.sum())} 个模板合并为 {len(self.atlas)} 个唯一模板。")
+        return self.bank
 
     def get_all_templates(self) -> List[Template]:
         return list(self.templates.values())
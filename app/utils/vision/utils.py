@@ -224,6 +224,75 @@ def non_max_suppression(boxes: List[Tuple[int, int, int, int]],
     return keep
 
 
+def non_max_suppression_arrays(boxes: np.ndarray,
+                               scores: np.ndarray,
+                               iou_threshold: float = 0.3,
+                               classes: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    向量化非极大值抑制 (数组版)
+
+    与 GameAnalyzer 的 standard_non_max_suppression 语义一致：
+    面积按 (x2 - x1) * (y2 - y1) 计算 (不加 1)，IOU >= iou_threshold 的框被抑制，
+    同分数时保持输入顺序。
+
+    Args:
+        boxes: (N, 4) 边界框数组 [x1, y1, x2, y2]
+        scores: (N,) 置信度数组
+        iou_threshold: IOU阈值
+        classes: (N,) 类别编号，可选；提供时只在同类别内抑制
+
+    Returns:
+        保留框的索引数组，按置信度降序排列
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    boxes = np.asarray(boxes, dtype=np.float64)
+    scores = np.asarray(scores)
+
+    if classes is not None:
+        # 按类别整体平移坐标，使不同类别的框不可能相交
+        span = boxes.max() - boxes.min() + 1
+        boxes = boxes + (np.asarray(classes, dtype=np.float64) * span)[:, None]
+
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = boxes[:, 2]
+    y2 = boxes[:, 3]
+
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        union = areas[i] + areas[rest] - inter
+        iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+        order = rest[iou < iou_threshold]
+
+    return np.array(keep, dtype=np.intp)
+
+
+def class_aware_non_max_suppression(boxes: np.ndarray,
+                                    scores: np.ndarray,
+                                    classes: np.ndarray,
+                                    iou_threshold: float = 0.3) -> np.ndarray:
+    """
+    按类别分别做非极大值抑制，不同类别的框互不抑制
+
+    Returns:
+        保留框的索引数组，按置信度降序排列
+    """
+    return non_max_suppression_arrays(boxes, scores, iou_threshold, classes=classes)
+
+
 def extract_cell_image(img: np.ndarray,
                      bbox: Tuple[int, int, int, int],
                      padding: int = 2) -> np.ndarray:
@@ -0,0 +1,95 @@
+"""
+NMS 性能对比
+比较原纯 Python 版 standard_non_max_suppression 与向量化的 non_max_suppression_arrays。
+
+用法:
+    python -m benchmarks.bench_nms
+    python -m benchmarks.bench_nms --sizes 1000 10000 100000 --legacy-max 10000
+"""
+import argparse
+import time
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+from app.utils.vision.utils import non_max_suppression_arrays
+
+
+@dataclass
+class _Candidate:
+    box: Tuple[int, int, int, int]
+    confidence: float
+
+
+def legacy_non_max_suppression(detections: List[_Candidate], iou_threshold: float) -> List[_Candidate]:
+    """原 game_analyzer.standard_non_max_suppression 的算法 (O(n²) 纯 Python)，仅作对照"""
+    if not detections: return []
+    detections.sort(key=lambda x: x.confidence, reverse=True)
+    final_detections = []
+    while detections:
+        best = detections.pop(0)
+        final_detections.append(best)
+        remaining = []
+        for other in detections:
+            x1=max(best.box[0],other.box[0]); y1=max(best.box[1],other.box[1])
+            x2=min(best.box[2],other.box[2]); y2=min(best.box[3],other.box[3])
+            intersection=max(0,x2-x1)*max(0,y2-y1)
+            area_best=(best.box[2]-best.box[0])*(best.box[3]-best.box[1])
+            area_other=(other.box[2]-other.box[0])*(other.box[3]-other.box[1])
+            union=area_best+area_other-intersection
+            iou=intersection/union if union>0 else 0
+            if iou<iou_threshold: remaining.append(other)
+        detections=remaining
+    return final_detections
+
+
+def make_candidates(n: int, pieces: int = 120, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """模拟低阈值下的原始命中：围绕 pieces 个真实棋子位置的抖动框"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform((40, 40), (980, 700), size=(pieces, 2))
+    owner = rng.integers(0, pieces, size=n)
+    jitter = rng.normal(0, 3, size=(n, 2))
+    sizes = np.where(rng.random(n)[:, None] < 0.5, (38, 28), (28, 38))
+    top_left = np.round(centers[owner] + jitter - sizes / 2).astype(np.int64)
+    boxes = np.concatenate([top_left, top_left + sizes], axis=1)
+    scores = rng.uniform(0.5, 1.0, size=n).astype(np.float32)
+    return boxes, scores
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="NMS 性能对比")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--iou", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-max", type=int, default=10000, help="超过该候选数时跳过纯 Python 版 (耗时过长)")
+    args = parser.parse_args()
+
+    print(f"{'候选数':>10} {'legacy (s)':>12} {'vectorized (s)':>16} {'加速比':>10} {'保留数':>8}")
+    for n in args.sizes:
+        boxes, scores = make_candidates(n)
+        keep = non_max_suppression_arrays(boxes, scores, args.iou)
+        t_vec = _time(lambda: non_max_suppression_arrays(boxes, scores, args.iou), args.repeat)
+
+        if n <= args.legacy_max:
+            items = [_Candidate(tuple(int(v) for v in b), float(s)) for b, s in zip(boxes, scores)]
+            legacy_keep = legacy_non_max_suppression(list(items), args.iou)
+            if len(legacy_keep) != len(keep):
+                print(f"  [警告] n={n} 时保留数不一致: legacy={len(legacy_keep)}, vectorized={len(keep)}")
+            t_legacy = _time(lambda: legacy_non_max_suppression(list(items), args.iou), 1)
+            print(f"{n:>10} {t_legacy:>12.4f} {t_vec:>16.4f} {t_legacy / t_vec:>9.1f}x {len(keep):>8}")
+        else:
+            print(f"{n:>10} {'skipped':>12} {t_vec:>16.4f} {'-':>10} {len(keep):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+PieceTracker 性能对比
+比较原贪心双重循环版 update_state 与按 (颜色, 棋子) 分桶 + 最优指派的新版本，
+模拟 100 个棋子的满盘：每帧少量棋子移动、偶尔有棋子消失。
+
+用法:
+    python -m benchmarks.bench_tracker
+    python -m benchmarks.bench_tracker --frames 500 --pieces 100 --movers 2
+"""
+import argparse
+import copy
+import math
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from app.game_model import BoardState, Piece, PieceTracker
+
+COLORS = ("红", "绿", "蓝", "紫")
+POSITIONS = ("下方", "右侧", "上方", "左侧")
+LINEUP = ["司令", "军长", "师长", "师长", "旅长", "旅长", "团长", "团长", "营长", "营长", "连长", "连长", "连长",
+          "排长", "排长", "排长", "工兵", "工兵", "工兵", "地雷", "地雷", "地雷", "炸弹", "炸弹", "军旗"]
+
+
+class LegacyPieceTracker(PieceTracker):
+    """原 PieceTracker.update_state 的算法 (贪心、math.hypot 双重循环)，仅作对照"""
+
+    def update_state(self, prev_state: Optional[BoardState], current_detections: BoardState) -> BoardState:
+        if not prev_state or not prev_state.pieces:
+            return super().update_state(prev_state, current_detections)
+        new_state = BoardState(timestamp=current_detections.timestamp)
+        unmatched_new_pieces = list(current_detections.pieces.values())
+        for prev_piece in prev_state.pieces.values():
+            best_match = None
+            min_dist = float('inf')
+            for i, new_piece in enumerate(unmatched_new_pieces):
+                if prev_piece.name == new_piece.name and prev_piece.color == new_piece.color:
+                    dist = math.hypot(prev_piece.board_coords[0] - new_piece.board_coords[0],
+                                      prev_piece.board_coords[1] - new_piece.board_coords[1])
+                    if dist < 4 and dist < min_dist:
+                        min_dist = dist
+                        best_match = i
+            if best_match is not None:
+                matched_piece = unmatched_new_pieces.pop(best_match)
+                matched_piece.id = prev_piece.id
+                new_state.pieces[matched_piece.id] = matched_piece
+                new_state.grid[matched_piece.board_coords] = matched_piece.id
+        for new_piece in unmatched_new_pieces:
+            new_piece.id = self.get_new_id(new_piece)
+            new_state.pieces[new_piece.id] = new_piece
+            new_state.grid[new_piece.board_coords] = new_piece.id
+        return new_state
+
+
+def make_frames(frames: int, pieces: int, movers: int, seed: int = 0) -> List[BoardState]:
+    """生成 frames 帧检测结果：初始 pieces 个棋子分布在 17x17 网格上，之后每帧 movers 个棋子走一步"""
+    rng = np.random.default_rng(seed)
+    cells = rng.choice(17 * 17, size=pieces, replace=False)
+    coords = [(int(c // 17), int(c % 17)) for c in cells]
+    kinds = [(COLORS[i % 4], POSITIONS[i % 4], LINEUP[(i // 4) % len(LINEUP)]) for i in range(pieces)]
+    occupied = set(coords)
+    sequence = []
+    for t in range(frames):
+        for i in rng.choice(len(coords), size=min(movers, len(coords)), replace=False):
+            r, c = coords[i]
+            dr, dc = [(0, 1), (1, 0), (0, -1), (-1, 0)][rng.integers(4)]
+            target = (min(16, max(0, r + dr)), min(16, max(0, c + dc)))
+            if target not in occupied:
+                occupied.discard(coords[i]); occupied.add(target); coords[i] = target
+        state = BoardState(timestamp=float(t))
+        for i, ((color, pos, name), xy) in enumerate(zip(kinds, coords)):
+            state.pieces[f"det_{i}"] = Piece(id=f"det_{i}", name=name, color=color, player_pos=pos, board_coords=xy)
+        sequence.append(state)
+    return sequence
+
+
+def run(tracker: PieceTracker, frames: List[BoardState]) -> BoardState:
+    state = None
+    for detections in frames:
+        state = tracker.update_state(state, detections)
+    return state
+
+
+def _time(tracker_cls, frames: List[BoardState], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        data = copy.deepcopy(frames)
+        start = time.perf_counter()
+        run(tracker_cls(), data)
+        best = min(best, time.perf_counter() - start)
+    return best / len(frames)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PieceTracker 性能对比")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--pieces", type=int, nargs="+", default=[25, 50, 100, 200])
+    parser.add_argument("--movers", type=int, default=2, help="每帧移动的棋子数")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'棋子数':>8} {'legacy (ms/帧)':>16} {'assignment (ms/帧)':>20} {'加速比':>10} {'ID 一致':>8}")
+    for n in args.pieces:
+        frames = make_frames(args.frames, n, args.movers)
+        legacy_ids = set(run(LegacyPieceTracker(), copy.deepcopy(frames)).pieces)
+        new_ids = set(run(PieceTracker(), copy.deepcopy(frames)).pieces)
+        t_legacy = _time(LegacyPieceTracker, frames, args.repeat)
+        t_new = _time(PieceTracker, frames, args.repeat)
+        print(f"{n:>8} {t_legacy * 1e3:>16.3f} {t_new * 1e3:>20.3f} {t_legacy / t_new:>9.1f}x {str(legacy_ids == new_ids):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+离线识别性能基准
+不依赖游戏窗口、GUI 或 win32，直接在录制好的截图上运行 GameAnalyzer 的各种识别模式
+以及注册表中的其他识别引擎 (clahe / clahe_stride)，统计各阶段延迟 (p50/p95/p99)、帧率、峰值内存与检测数量，并输出 JSON 以便对比不同版本。
+
+用法:
+    python -m benchmarks.vision_bench
+    python -m benchmarks.vision_bench --variants full nodes gemm --repeat 5 --output bench_output.json
+    python -m benchmarks.vision_bench --variants full clahe clahe_stride
+    python -m benchmarks.vision_bench --images D:/recordings/session1 --regions data/regions.json
+"""
+import argparse
+import json
+import os
+import platform
+import time
+from collections import defaultdict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.services.game_analyzer import GameAnalyzer, DetectionResult
+from app.utils.vision.matching import PyramidConfig
+from app.services.executor import BACKENDS, ExecutorConfig
+from app.services.engines import DetectionEngine, create_engine
+
+DEFAULT_IMAGE_DIRS = ["pictures/qipan", "pictures/samples", "pictures/temp"]
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp"}
+
+
+def _configure_full(analyzer: GameAnalyzer) -> str:
+    analyzer.pyramid = None
+    return "full"
+
+def _configure_pyramid(analyzer: GameAnalyzer) -> str:
+    analyzer.pyramid = PyramidConfig()
+    return "full"
+
+def _configure_blobs(analyzer: GameAnalyzer) -> str:
+    analyzer.pyramid = None
+    return "blobs"
+
+def _configure_nodes(analyzer: GameAnalyzer) -> str:
+    analyzer.pyramid = None; analyzer.node_engine = "match"
+    return "nodes"
+
+def _configure_gemm(analyzer: GameAnalyzer) -> str:
+    analyzer.pyramid = None
+    return "gemm"
+
+def _configure_incremental(analyzer: GameAnalyzer) -> str:
+    analyzer.pyramid = None; analyzer.node_engine = "match"; analyzer._node_cache = None
+    return "incremental"
+
+def _configure_engine(engine: DetectionEngine) -> Optional[str]:
+    return None
+
+# 其他引擎的变体: 变体名 -> (引擎名, 构造参数)；每个变体单独创建一个引擎实例
+ENGINE_VARIANTS: Dict[str, Tuple[str, Dict]] = {
+    "clahe": ("clahe", {}),
+    "clahe_stride": ("clahe", {"config": {"detect_stride": 2}}),
+}
+
+# 变体名 -> (配置函数, 是否需要锁定分区)
+VARIANTS: Dict[str, Tuple[Callable[[DetectionEngine], Optional[str]], bool]] = {
+    "full": (_configure_full, False),
+    "pyramid": (_configure_pyramid, False),
+    "blobs": (_configure_blobs, False),
+    "nodes": (_configure_nodes, True),
+    "gemm": (_configure_gemm, True),
+    "incremental": (_configure_incremental, True),
+    **{name: (_configure_engine, False) for name in ENGINE_VARIANTS},
+}
+
+
+def find_images(dirs: List[str]) -> List[Path]:
+    images = []
+    for d in dirs:
+        path = Path(d)
+        if path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES:
+            images.append(path)
+        elif path.is_dir():
+            images.extend(sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES))
+    return images
+
+
+def load_image(path: Path) -> Optional[np.ndarray]:
+    # 与 TemplatesManager 相同，使用 imdecode 以正确处理中文路径
+    return cv2.imdecode(np.fromfile(str(path), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class RssSampler:
+    """采样当前进程及其子进程 (进程池工作进程) 的常驻内存，记录峰值"""
+
+    def __init__(self):
+        self.peak = 0
+        try:
+            import psutil
+            self._proc = psutil.Process(os.getpid())
+        except ImportError:
+            self._proc = None
+
+    def sample(self) -> None:
+        if self._proc is not None:
+            rss = self._proc.memory_info().rss
+            for child in self._proc.children(recursive=True):
+                try: rss += child.memory_info().rss
+                except Exception: pass
+        else:
+            import resource  # 仅 POSIX；ru_maxrss 在 Linux 下以 KB 计
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self.peak = max(self.peak, rss)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples: return {"count": 0}
+    arr = np.asarray(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+
+def _labels(detections: List[DetectionResult]) -> List[Tuple[str, str, float, float]]:
+    out = []
+    for d in detections:
+        if d.template.color == "neutral": continue
+        x1, y1, x2, y2 = d.bbox
+        out.append((d.template.color, d.template.piece_type, (x1 + x2) / 2, (y1 + y2) / 2))
+    return out
+
+
+def recall_against(reference: List[DetectionResult], candidate: List[DetectionResult], tolerance: float = 10.0) -> Optional[float]:
+    """以 reference 为基准，candidate 中颜色、棋子一致且中心距离不超过 tolerance 的比例"""
+    ref = _labels(reference)
+    if not ref: return None
+    remaining = _labels(candidate)
+    hit = 0
+    for color, piece, cx, cy in ref:
+        for i, (c2, p2, x2, y2) in enumerate(remaining):
+            if c2 == color and p2 == piece and abs(cx - x2) <= tolerance and abs(cy - y2) <= tolerance:
+                hit += 1; remaining.pop(i); break
+    return hit / len(ref)
+
+
+def run_variant(analyzer: DetectionEngine, name: str, frames: List[Tuple[Path, np.ndarray]], repeat: int,
+                threshold: float, warmup: int, baseline: Optional[Dict[str, List[DetectionResult]]]) -> Dict:
+    configure, _ = VARIANTS[name]
+    mode = configure(analyzer)
+    stage_times: Dict[str, List[float]] = defaultdict(list)
+    detection_counts: List[int] = []
+    recalls: List[float] = []
+    sampler = RssSampler()
+    last_detections: Dict[str, List[DetectionResult]] = {}
+
+    for _ in range(warmup):
+        for _, frame in frames: analyzer.analyze_screenshot(frame, threshold, return_detections=True, mode=mode)
+
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        for path, frame in frames:
+            t0 = time.perf_counter()
+            detections = analyzer.analyze_screenshot(frame, threshold, return_detections=True, mode=mode)
+            t1 = time.perf_counter()
+            analyzer._format_report(detections, frame.shape)
+            t2 = time.perf_counter()
+            stage_times["detect"].append(t1 - t0)
+            stage_times["report"].append(t2 - t1)
+            stage_times["total"].append(t2 - t0)
+            detection_counts.append(len(detections))
+            last_detections[str(path)] = detections
+            if baseline is not None and str(path) in baseline:
+                recall = recall_against(baseline[str(path)], detections)
+                if recall is not None: recalls.append(recall)
+            sampler.sample()
+    wall = time.perf_counter() - wall_start
+    n_frames = repeat * len(frames)
+
+    result = {
+        "mode": mode or ENGINE_VARIANTS[name][0],
+        "frames": n_frames,
+        "fps": n_frames / wall if wall > 0 else None,
+        "stages": {stage: summarize(samples) for stage, samples in stage_times.items()},
+        "peak_rss_mb": sampler.peak / (1024 * 1024),
+        "detections": {"mean": float(np.mean(detection_counts)) if detection_counts else 0.0,
+                       "min": int(min(detection_counts, default=0)), "max": int(max(detection_counts, default=0))},
+        "match_stats": dict(analyzer.last_match_stats),
+    }
+    if recalls: result["recall_vs_full"] = float(np.mean(recalls))
+    result["_detections"] = last_detections
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="离线识别性能基准")
+    parser.add_argument("--images", nargs="*", default=[], help="额外的截图目录或文件")
+    parser.add_argument("--no-default-images", action="store_true", help="不使用 pictures/ 下的默认截图")
+    parser.add_argument("--templates", default="pictures/qizi_samples")
+    parser.add_argument("--regions", default="data/regions.json", help="节点类模式使用的锁定分区文件")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--backend", default="thread", choices=BACKENDS, help="执行后端")
+    parser.add_argument("--workers", type=int, default=0, help="工作者数量，0 为按 CPU 核数")
+    parser.add_argument("--autotune", action="store_true", help="先在截图上自动选择最快的执行配置")
+    args = parser.parse_args()
+
+    dirs = ([] if args.no_default_images else DEFAULT_IMAGE_DIRS) + args.images
+    frames = [(p, img) for p in find_images(dirs) for img in [load_image(p)] if img is not None]
+    if not frames:
+        raise SystemExit(f"未找到可用的截图: {dirs}")
+
+    t0 = time.perf_counter()
+    analyzer = GameAnalyzer(args.templates, executor=ExecutorConfig(args.backend, args.workers))
+    startup = time.perf_counter() - t0
+    tuning = None
+    if args.autotune:
+        best, results = analyzer.autotune_executor([img for _, img in frames[:3]], mode="full", match_threshold=args.threshold)
+        tuning = [{"config": r["config"].describe(), **{k: v for k, v in r.items() if k != "config"}} for r in results]
+        print(f"自动调优选择: {best.describe()}")
+
+    regions = None
+    if Path(args.regions).exists():
+        with open(args.regions, "r") as f: regions = json.load(f)
+        analyzer.set_locked_regions(regions)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "images": [str(p) for p, _ in frames],
+            "threshold": args.threshold,
+            "repeat": args.repeat,
+            "analyzer_startup_s": startup,
+            "executor": analyzer.executor_config.resolved().describe(),
+            "autotune": tuning,
+            "pyramid": asdict(PyramidConfig()),
+        },
+        "variants": {},
+    }
+
+    baseline = None
+    full_p50 = None
+    engines: Dict[str, DetectionEngine] = {}
+    try:
+        for name in args.variants:
+            if VARIANTS[name][1] and regions is None:
+                print(f"[跳过] {name}: 需要锁定分区文件 {args.regions}")
+                continue
+            engine = analyzer
+            if name in ENGINE_VARIANTS:
+                engine_name, kwargs = ENGINE_VARIANTS[name]
+                engine = engines[name] = create_engine(engine_name, args.templates, **kwargs)
+                if regions is not None: engine.set_locked_regions(regions)
+            result = run_variant(engine, name, frames, args.repeat, args.threshold, args.warmup, baseline)
+            detections = result.pop("_detections")
+            total = result["stages"]["total"]
+            if name == "full": baseline, full_p50 = detections, total["p50_ms"]
+            elif full_p50: result["speedup_vs_full"] = full_p50 / total["p50_ms"]
+            report["variants"][name] = result
+            # 召回与加速比并列输出，便于权衡各变体的精度与延迟
+            recall = f", recall_vs_full={result['recall_vs_full']:.3f}" if "recall_vs_full" in result else ""
+            if "speedup_vs_full" in result: recall += f", speedup_vs_full={result['speedup_vs_full']:.2f}x"
+            print(f"{name:>12}: p50={total['p50_ms']:.1f}ms p95={total['p95_ms']:.1f}ms p99={total['p99_ms']:.1f}ms "
+                  f"fps={result['fps']:.2f} rss={result['peak_rss_mb']:.0f}MB dets={result['detections']['mean']:.1f}{recall}")
+    finally:
+        analyzer.close()
+        for engine in engines.values(): engine.close()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
+import argparse
 import tkinter as tk
 from multiprocessing import freeze_support
 from app.gui.main_window import DashboardApp
+from app.services.engines import DEFAULT_ENGINE, available_engines
 import app.gui.callbacks as callbacks
 
 if __name__ == "__main__":
     freeze_support()
+    parser = argparse.ArgumentParser(description="陆战棋-智能战情室")
+    parser.add_argument("--metrics", action="store_true", help="显示性能指标面板")
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, choices=available_engines(), help="识别引擎")
+    args = parser.parse_args()
     root = tk.Tk()
-    app = DashboardApp(root)
-    callbacks.initialize_analyzer(app)
+    app = DashboardApp(root, show_metrics=args.metrics, engine=args.engine)
+    # 先显示窗口，再在事件循环中初始化分析器
+    root.after(0, callbacks.initialize_analyzer, app)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,49 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from app.utils.vision.detect import ClaheDetector, detect_pieces
+from app.utils.vision.ocr import OCRService
+
+TEMPLATES = Path(__file__).resolve().parents[1] / "pictures" / "qizi_samples"
+FRAME = Path(__file__).resolve().parents[1] / "pictures" / "qipan" / "1.png"
+pytestmark = pytest.mark.skipif(not TEMPLATES.is_dir() or not FRAME.is_file(), reason="缺少模板或截图样本")
+
+
+class _FixedEngine:
+    """无论输入都识别为同一段文字，并记录调用次数"""
+
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def recognize_batch(self, images):
+        self.calls += 1
+        return [(self.text, 0.95)] * len(images)
+
+
+def test_ocr_confirmation_keeps_template_vocabulary():
+    engine = _FixedEngine("军长")
+    service = OCRService(engine_factory=lambda: engine)
+    detector = ClaheDetector(str(TEMPLATES), {"ocr": {"enable": True}}, ocr_engine=service)
+    frame = cv2.imread(str(FRAME))
+    detection = {"type": "general", "confidence": 0.85, "bbox": [412, 53, 38, 28]}
+    try:
+        detector._confirm_by_ocr(frame, [detection])
+    finally:
+        service.stop()
+    assert engine.calls == 1
+    assert detection["type"] == "general" and not detection["ocr_confirmed"]
+
+
+def test_detect_pieces_skips_ocr_by_default():
+    engine = _FixedEngine("司令")
+    service = OCRService(engine_factory=lambda: engine)
+    frame = cv2.imread(str(FRAME))
+    try:
+        detections = detect_pieces(frame, {"template_dir": str(TEMPLATES)}, ocr_engine=service)
+    finally:
+        service.stop()
+    assert detections and engine.calls == 0
@@ -0,0 +1,28 @@
+import numpy as np
+
+from app.utils.vision.ocr import OCRService
+
+
+class _FlakyEngine:
+    """第一次识别失败 (返回空结果)，之后正常识别"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def recognize_batch(self, images):
+        self.calls += 1
+        return [("", 0.0) if self.calls == 1 else ("司令", 0.9)] * len(images)
+
+
+def test_failed_recognition_is_not_cached():
+    engine = _FlakyEngine()
+    service = OCRService(engine_factory=lambda: engine)
+    cell = np.full((38, 28, 3), 200, dtype=np.uint8); cell[10:28, 6:22] = 30
+    try:
+        assert service.recognize([cell], timeout=5) == [("", 0.0)]
+        assert service.recognize([cell], timeout=5) == [("司令", 0.9)]
+        assert engine.calls == 2
+        assert service.recognize([cell], timeout=5) == [("司令", 0.9)]
+        assert engine.calls == 2
+    finally:
+        service.stop()
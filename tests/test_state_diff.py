@@ -0,0 +1,35 @@
+from app.game_model import BoardState, CaptureEvent, GameLogicEngine, LandmineEvent, Piece
+
+
+def _state(timestamp, *pieces):
+    return BoardState(timestamp, {p.id: p for p in pieces})
+
+
+def _piece(pid, name, player, region, coords):
+    return Piece(pid, name, "", player, board_coords=coords, region=region)
+
+
+def test_lone_vanish_with_distant_enemy_is_landmine():
+    victim = _piece("a", "排长", "上方", "上方", (0, 1))
+    commander = _piece("b", "司令", "左侧", "左侧", (0, 4))
+    events = GameLogicEngine().compare_states(_state(0.0, victim, commander), _state(1.0, commander))
+    assert len(events) == 1 and isinstance(events[0], LandmineEvent)
+
+
+def test_adjacent_enemy_is_capturer():
+    victim = _piece("a", "排长", "上方", "上方", (5, 0))
+    commander = _piece("b", "司令", "左侧", "左侧", (5, 0))   # 隔着角上的弧线相邻
+    events = GameLogicEngine().compare_states(_state(0.0, victim, commander), _state(1.0, commander))
+    assert len(events) == 1 and isinstance(events[0], CaptureEvent) and events[0].attacker.id == "b"
+
+
+def test_enemy_reached_along_railway_is_capturer():
+    victim = _piece("a", "排长", "上方", "上方", (5, 4))
+    commander = _piece("b", "司令", "右侧", "右侧", (0, 4))   # 外圈铁路经右上角弧线直达
+    events = GameLogicEngine().compare_states(_state(0.0, victim, commander), _state(1.0, commander))
+    assert len(events) == 1 and isinstance(events[0], CaptureEvent) and events[0].attacker.id == "b"
+
+    # 外圈两个方向上都有棋子挡住
+    blockers = _piece("c", "地雷", "下方", "右侧", (0, 2)), _piece("d", "排长", "上方", "上方", (5, 3))
+    events = GameLogicEngine().compare_states(_state(0.0, victim, commander, *blockers), _state(1.0, commander, *blockers))
+    assert len(events) == 1 and isinstance(events[0], LandmineEvent)